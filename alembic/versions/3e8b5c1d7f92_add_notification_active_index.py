@@ -0,0 +1,38 @@
+"""Add partial index on unfinished tournament notifications
+
+Revision ID: 3e8b5c1d7f92
+Revises: 6d2a9f4e8b07
+Create Date: 2026-10-20 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b5c1d7f92'
+down_revision = '6d2a9f4e8b07'
+branch_labels = None
+depends_on = None
+
+# Бот каждые несколько секунд ищет строки pending и зависшие sending/delivering;
+# индекс ix_tournament_notifications_status начинается с tournament_id и для этого
+# не подходит. В частичный индекс попадают только незаконченные строки
+ACTIVE_WHERE = sa.text("status IN ('pending', 'sending', 'delivering')")
+
+
+def upgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tournament_notifications_active', 'tournament_notifications', ['status', 'tournament_id', 'kind'],
+            unique=False, postgresql_where=ACTIVE_WHERE, sqlite_where=ACTIVE_WHERE,
+            postgresql_concurrently=concurrently,
+        )
+
+
+def downgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tournament_notifications_active', table_name='tournament_notifications',
+                      postgresql_concurrently=concurrently)
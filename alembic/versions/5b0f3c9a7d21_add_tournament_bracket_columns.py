@@ -0,0 +1,40 @@
+"""Add tournament format and bracket columns to matches
+
+Revision ID: 5b0f3c9a7d21
+Revises: 22bc7366494b
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0f3c9a7d21'
+down_revision = '22bc7366494b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tournaments', sa.Column('format', sa.String(), server_default='single_elimination', nullable=False))
+    op.add_column('matches', sa.Column('bracket', sa.String(), nullable=True))
+    op.add_column('matches', sa.Column('round', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('slot', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('next_slot', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('next_slot_side', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('loser_next_slot', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('loser_next_slot_side', sa.Integer(), nullable=True))
+    op.create_index('ix_matches_tournament_slot', 'matches', ['tournament_id', 'slot'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_matches_tournament_slot', table_name='matches')
+    op.drop_column('matches', 'loser_next_slot_side')
+    op.drop_column('matches', 'loser_next_slot')
+    op.drop_column('matches', 'next_slot_side')
+    op.drop_column('matches', 'next_slot')
+    op.drop_column('matches', 'slot')
+    op.drop_column('matches', 'round')
+    op.drop_column('matches', 'bracket')
+    op.drop_column('tournaments', 'format')
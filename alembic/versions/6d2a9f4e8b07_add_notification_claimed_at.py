@@ -0,0 +1,25 @@
+"""Add claimed_at to tournament notifications
+
+Revision ID: 6d2a9f4e8b07
+Revises: b92e4d7a3c18
+Create Date: 2026-10-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2a9f4e8b07'
+down_revision = 'b92e4d7a3c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Строки, уже оставшиеся в sending, получают NULL и возвращаются в очередь при первой проверке
+    op.add_column('tournament_notifications', sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tournament_notifications', 'claimed_at')
@@ -0,0 +1,26 @@
+"""Add table and time slot to matches
+
+Revision ID: 8c41e2d6f0a3
+Revises: 5b0f3c9a7d21
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e2d6f0a3'
+down_revision = '5b0f3c9a7d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('matches', sa.Column('table_number', sa.Integer(), nullable=True))
+    op.add_column('matches', sa.Column('scheduled_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('matches', 'scheduled_at')
+    op.drop_column('matches', 'table_number')
@@ -0,0 +1,32 @@
+"""Unique (tournament_id, user_id) for tournament participants
+
+Revision ID: a7e93f1b2c54
+Revises: 8c41e2d6f0a3
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e93f1b2c54'
+down_revision = '8c41e2d6f0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Удаляем дубли регистраций, оставляя самую раннюю
+    op.execute(
+        "DELETE FROM tournament_participants WHERE id NOT IN ("
+        "SELECT MIN(id) FROM tournament_participants GROUP BY tournament_id, user_id)"
+    )
+    op.create_unique_constraint(
+        'uq_tournament_participants_tournament_user',
+        'tournament_participants',
+        ['tournament_id', 'user_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_tournament_participants_tournament_user', 'tournament_participants', type_='unique')
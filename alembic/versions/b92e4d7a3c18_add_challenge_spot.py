@@ -0,0 +1,32 @@
+"""Add spot to challenges and fill spot of tournament matches
+
+Revision ID: b92e4d7a3c18
+Revises: f1b7c2d9e6a3
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b92e4d7a3c18'
+down_revision = 'f1b7c2d9e6a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('challenges', sa.Column('spot_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('challenges_spot_id_fkey', 'challenges', 'locations', ['spot_id'], ['id'])
+    # Турнирные матчи раньше создавались без спота - берем спот турнира
+    op.execute(
+        "UPDATE matches SET spot_id = "
+        "(SELECT tournaments.spot_id FROM tournaments WHERE tournaments.id = matches.tournament_id) "
+        "WHERE tournament_id IS NOT NULL AND spot_id IS NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('challenges_spot_id_fkey', 'challenges', type_='foreignkey')
+    op.drop_column('challenges', 'spot_id')
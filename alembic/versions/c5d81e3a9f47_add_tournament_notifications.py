@@ -0,0 +1,47 @@
+"""Add tournament_notifications delivery state
+
+Revision ID: c5d81e3a9f47
+Revises: a7e93f1b2c54
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d81e3a9f47'
+down_revision = 'a7e93f1b2c54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tournament_notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tournament_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['tournament_id'], ['tournaments.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tournament_id', 'user_id', 'kind', name='uq_tournament_notifications_recipient')
+    )
+    op.create_index(op.f('ix_tournament_notifications_id'), 'tournament_notifications', ['id'], unique=False)
+    op.create_index(
+        'ix_tournament_notifications_status',
+        'tournament_notifications',
+        ['tournament_id', 'kind', 'status'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tournament_notifications_status', table_name='tournament_notifications')
+    op.drop_index(op.f('ix_tournament_notifications_id'), table_name='tournament_notifications')
+    op.drop_table('tournament_notifications')
@@ -0,0 +1,26 @@
+"""Add index on lower(users.username)
+
+Revision ID: d3f6a1c8b942
+Revises: c5d81e3a9f47
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6a1c8b942'
+down_revision = 'c5d81e3a9f47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Не уникальный: у переименовавшихся в Telegram игроков в базе может
+    # остаться старый username, совпадающий с чужим новым
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_username_lower', table_name='users')
@@ -0,0 +1,44 @@
+"""Add indexes for hot queries
+
+Revision ID: f1b7c2d9e6a3
+Revises: d3f6a1c8b942
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7c2d9e6a3'
+down_revision = 'd3f6a1c8b942'
+branch_labels = None
+depends_on = None
+
+# matches(tournament_id) и tournament_participants(tournament_id) уже покрыты
+# первыми столбцами ix_matches_tournament_slot и uq_tournament_participants_tournament_user
+INDEXES = [
+    ('ix_challenges_challenger_created', 'challenges', ['challenger_id', 'created_at']),
+    ('ix_challenges_challenged_status', 'challenges', ['challenged_id', 'status']),
+    ('ix_user_rating_history_user_created', 'user_rating_history', ['user_id', 'created_at']),
+    ('ix_ratings_location_id', 'ratings', ['location_id']),
+    ('ix_photos_location_id', 'photos', ['location_id']),
+    ('ix_tournaments_created_at_id', 'tournaments', ['created_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    # На PostgreSQL индексы строятся CONCURRENTLY, не блокируя запись в таблицы.
+    # Такое построение не может идти в транзакции, поэтому каждый индекс
+    # создается в autocommit; если построение прервалось, остается невалидный
+    # индекс - его нужно удалить (DROP INDEX) и повторить миграцию
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=concurrently)
+
+
+def downgrade() -> None:
+    concurrently = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=concurrently)
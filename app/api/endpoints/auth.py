@@ -1,89 +1,116 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, Body, HTTPException, Depends
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.database import get_db
+from app.database.database import dialect_insert, get_async_db, get_db, get_read_db
+from app.database.profiling import query_budget
 from app.database.models import User, Match, UserRatingHistory
-from jose import jwt
-from datetime import datetime, timedelta
+from app.services.matchmaking import rating_index
+from app.services.search import release_username, search_index
+from app.api.security import create_access_token, user_snapshots
 import hashlib
 import hmac
+import logging
 import os
-from typing import List
+import random
+import time
+from typing import Any, Dict, List
 
 router = APIRouter()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
-JWT_SECRET = os.getenv("JWT_SECRET", "jwtsecret")
-JWT_ALGORITHM = "HS256"
-JWT_EXPIRE_MINUTES = 60 * 24 * 7  # 1 неделя
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Ключ HMAC для проверки подписи Telegram - sha256 от токена бота, считается один раз
+TELEGRAM_SECRET = hashlib.sha256(BOT_TOKEN.encode()).digest() if BOT_TOKEN else None
+# Доля успешных входов, попадающих в лог (ошибки логируются всегда)
+AUTH_LOG_SAMPLE_RATE = float(os.getenv("AUTH_LOG_SAMPLE_RATE", "0.01"))
+
+# Поля профиля, которые берутся из данных Telegram при каждом входе
+PROFILE_FIELDS = {
+    "username": "username",
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "avatar_url": "photo_url",
+}
+
+logger = logging.getLogger(__name__)
 
 # Проверка подписи Telegram
 
-def check_telegram_auth(data: dict, bot_token: str) -> bool:
+def check_telegram_auth(data: dict, secret_key: bytes) -> bool:
     auth_data = data.copy()
     hash_ = auth_data.pop("hash", None)
+    if not isinstance(hash_, str):
+        return False
     data_check_string = "\n".join([f"{k}={v}" for k, v in sorted(auth_data.items())])
-    secret_key = hashlib.sha256(bot_token.encode()).digest()
     h = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-    return h == hash_
+    return hmac.compare_digest(h, hash_)
+
+def upsert_telegram_user(db: Session, telegram_id: int, profile: dict):
+    """Создает или обновляет пользователя одним INSERT ... ON CONFLICT (telegram_id) DO UPDATE.
+
+    UPDATE выполняется, только если какое-то поле профиля изменилось,
+    поэтому повторный вход без изменений ничего не пишет. Возвращает
+    (строка пользователя, была ли запись).
+    """
+    insert = dialect_insert(db, User).values(telegram_id=telegram_id, **profile)
+    upsert = insert.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={field: insert.excluded[field] for field in profile},
+        where=or_(*(getattr(User, field).is_distinct_from(insert.excluded[field]) for field in profile)),
+    ).returning(User.id, User.telegram_id, User.username, User.first_name, User.last_name, User.rating)
+    row = db.execute(upsert).first()
+    if row is not None:
+        return row, True
+    row = db.execute(
+        select(User.id, User.telegram_id, User.username, User.first_name, User.last_name, User.rating)
+        .where(User.telegram_id == telegram_id)
+    ).first()
+    return row, False
 
 @router.post("/auth/telegram")
-async def telegram_auth(request: Request, db: Session = Depends(get_db)):
-    data = await request.json()
-    print(f"Received Telegram auth data: {data}")
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
-        print("Bot token not configured")
+def telegram_auth(data: Dict[str, Any] = Body(...), db: Session = Depends(get_db)):
+    started = time.perf_counter()
+    if TELEGRAM_SECRET is None:
+        logger.error("telegram_auth event=misconfigured reason=no_bot_token")
         raise HTTPException(status_code=500, detail="Bot token not configured")
     
-    print(f"Checking Telegram auth with bot token: {bot_token[:10]}...")
-    
     # Временно отключаем проверку подписи для разработки
     # TODO: Включить обратно для продакшена
     skip_signature_check = os.getenv("SKIP_TELEGRAM_SIGNATURE", "true").lower() == "true"
     
-    if not skip_signature_check and not check_telegram_auth(data, bot_token):
-        print("Invalid Telegram signature")
+    if not skip_signature_check and not check_telegram_auth(data, TELEGRAM_SECRET):
+        logger.warning("telegram_auth event=rejected reason=invalid_signature telegram_id=%s", data.get("id"))
         raise HTTPException(status_code=400, detail="Invalid Telegram signature")
     
-    telegram_id = int(data["id"])
-    print(f"Processing user with telegram_id: {telegram_id}")
+    try:
+        telegram_id = int(data["id"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid Telegram data")
     
-    user = db.query(User).filter_by(telegram_id=telegram_id).first()
-    if not user:
-        print(f"Creating new user: {data.get('username')}")
-        user = User(
-            telegram_id=telegram_id,
-            username=data.get("username"),
-            first_name=data.get("first_name"),
-            last_name=data.get("last_name"),
-            avatar_url=data.get("photo_url")
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    else:
-        print(f"Updating existing user: {user.username}")
-        # Обновляем данные пользователя
-        user.username = data.get("username")
-        user.first_name = data.get("first_name")
-        user.last_name = data.get("last_name")
-        user.avatar_url = data.get("photo_url")
+    profile = {field: data.get(key) for field, key in PROFILE_FIELDS.items()}
+    user, written = upsert_telegram_user(db, telegram_id, profile)
+    if written:
+        if user.username:
+            db.execute(release_username(user.id, user.username))
         db.commit()
+        user_snapshots.invalidate(telegram_id)
+        rating_index.upsert(user.id, user.rating)
+        search_index.upsert_player(user.id, user.username, user.first_name, user.last_name, user.rating)
     
     # Генерируем JWT
-    payload = {
-        "sub": str(user.id),
-        "telegram_id": user.telegram_id,
-        "username": user.username,
-        "exp": datetime.utcnow() + timedelta(minutes=JWT_EXPIRE_MINUTES)
-    }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-    print(f"Generated JWT for user {user.id}")
+    token = create_access_token(user)
+    if random.random() < AUTH_LOG_SAMPLE_RATE:
+        logger.info(
+            "telegram_auth event=login user_id=%s written=%s duration_ms=%.1f sample_rate=%s",
+            user.id, written, (time.perf_counter() - started) * 1000, AUTH_LOG_SAMPLE_RATE,
+        )
     return {"access_token": token, "token_type": "bearer"}
 
-@router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(get_db)):
-    users = db.query(User).order_by(User.rating.desc()).all()
+@router.get("/leaderboard", dependencies=[Depends(query_budget(1))])
+async def get_leaderboard(db: AsyncSession = Depends(get_read_db)):
+    users = (await db.execute(select(User).order_by(User.rating.desc()))).scalars().all()
     leaderboard = [
         {
             "id": user.id,
@@ -98,14 +125,35 @@ def get_leaderboard(db: Session = Depends(get_db)):
     ]
     return leaderboard
 
-@router.get("/user/{user_id}/history")
-def get_user_history(user_id: int, db: Session = Depends(get_db)):
-    history = db.query(UserRatingHistory).filter(UserRatingHistory.user_id == user_id).order_by(UserRatingHistory.created_at.desc()).all()
+AUTOCOMPLETE_LIMIT = 20
+
+@router.get("/users/autocomplete")
+async def autocomplete_users(q: str = "", limit: int = 10, db: AsyncSession = Depends(get_async_db)):
+    """Игроки, у которых username или имя начинается с q (для формы вызова)"""
+    await db.run_sync(search_index.ensure_loaded)
+    players = search_index.players(q, min(max(limit, 1), AUTOCOMPLETE_LIMIT), with_username=True)
+    return [
+        {
+            "id": player["id"],
+            "username": player["username"],
+            "first_name": player["first_name"],
+            "last_name": player["last_name"],
+            "rating": player["rating"],
+        }
+        for player in players
+    ]
+
+@router.get("/user/{user_id}/history", dependencies=[Depends(query_budget(1))])
+async def get_user_history(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Матчи присоединяются в том же запросе; записи без матча пропускаются
+    rows = (await db.execute(
+        select(UserRatingHistory, Match)
+        .join(Match, Match.id == UserRatingHistory.match_id)
+        .where(UserRatingHistory.user_id == user_id)
+        .order_by(UserRatingHistory.created_at.desc())
+    )).all()
     result = []
-    for h in history:
-        match = db.query(Match).filter(Match.id == h.match_id).first()
-        if not match:
-            continue
+    for h, match in rows:
         opponent_id = match.player2_id if match.player1_id == user_id else match.player1_id
         result.append({
             "date": match.created_at,
@@ -116,4 +164,4 @@ def get_user_history(user_id: int, db: Session = Depends(get_db)):
             "change": h.change,
             "is_win": match.winner_id == user_id
         })
-    return result 
\ No newline at end of file
+    return result
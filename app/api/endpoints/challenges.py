@@ -1,7 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.database import get_db
-from app.database.models import Challenge, User, Match, UserRatingHistory
+from app.api.security import CurrentUser, user_snapshots
+from app.database.database import get_async_db, get_db
+from app.database.profiling import query_budget
+from app.database.models import Challenge, Location, User
+from app.services.challenge_service import ChallengeService, ChallengeError
+from app.services.matchmaking import recommend_opponents
+from app.services.search import username_matches
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timedelta
@@ -11,6 +17,7 @@ router = APIRouter()
 
 class ChallengeCreate(BaseModel):
     challenged_username: str
+    spot_id: Optional[int] = None  # где будет матч; учитывается в рекомендациях соперников
 
 class ChallengeResponse(BaseModel):
     challenger_username: str
@@ -19,18 +26,20 @@ class ChallengeResponse(BaseModel):
     created_at: datetime
 
 @router.post("/challenges")
-def create_challenge(challenge: ChallengeCreate, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    challenger_id = 1  # Временно используем фиксированный ID
+def create_challenge(challenge: ChallengeCreate, current_user: CurrentUser, db: Session = Depends(get_db)):
+    challenger_id = current_user.id
     
     # Находим пользователя, которого вызывают
-    challenged_user = db.query(User).filter(User.username == challenge.challenged_username).first()
+    challenged_user = db.query(User).filter(username_matches(challenge.challenged_username)).first()
     if not challenged_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     if challenged_user.id == challenger_id:
         raise HTTPException(status_code=400, detail="Cannot challenge yourself")
     
+    if challenge.spot_id is not None and not db.query(Location.id).filter(Location.id == challenge.spot_id).first():
+        raise HTTPException(status_code=404, detail="Location not found")
+    
     # Проверяем ограничение: 1 вызов в день
     today = datetime.now().date()
     existing_challenge = db.query(Challenge).filter(
@@ -58,6 +67,7 @@ def create_challenge(challenge: ChallengeCreate, db: Session = Depends(get_db)):
     new_challenge = Challenge(
         challenger_id=challenger_id,
         challenged_id=challenged_user.id,
+        spot_id=challenge.spot_id,
         status="pending"
     )
     db.add(new_challenge)
@@ -66,176 +76,74 @@ def create_challenge(challenge: ChallengeCreate, db: Session = Depends(get_db)):
     
     return {"id": new_challenge.id, "message": "Challenge created successfully"}
 
+CHALLENGE_ERRORS = {
+    "not_found": (404, "Challenge not found"),
+    "not_pending": (400, "Challenge is not pending"),
+    "not_accepted": (400, "Challenge is not accepted"),
+    "not_participant": (403, "You are not part of this challenge"),
+    "conflict": (400, "Both players cannot have the same result"),
+    "invalid_result": (400, "Result must be 'won' or 'lost'"),
+    "invalid_cursor": (400, "Invalid cursor"),
+}
+
+def raise_challenge_error(error: ChallengeError, forbidden_detail: str = "Forbidden"):
+    if error.code == "forbidden":
+        raise HTTPException(status_code=403, detail=forbidden_detail)
+    status_code, detail = CHALLENGE_ERRORS[error.code]
+    raise HTTPException(status_code=status_code, detail=detail)
+
 @router.post("/challenges/{challenge_id}/accept")
-def accept_challenge(challenge_id: int, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
-    
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        raise HTTPException(status_code=404, detail="Challenge not found")
-    
-    if challenge.challenged_id != user_id:
-        raise HTTPException(status_code=403, detail="You can only accept challenges sent to you")
+def accept_challenge(challenge_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    user_id = current_user.id
     
-    if challenge.status != "pending":
-        raise HTTPException(status_code=400, detail="Challenge is not pending")
-    
-    challenge.status = "accepted"
-    challenge.accepted_at = datetime.now()
-    db.commit()
+    try:
+        ChallengeService(db).accept(challenge_id, user_id)
+    except ChallengeError as e:
+        raise_challenge_error(e, "You can only accept challenges sent to you")
     
     return {"message": "Challenge accepted successfully"}
 
 @router.post("/challenges/{challenge_id}/decline")
-def decline_challenge(challenge_id: int, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
-    
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        raise HTTPException(status_code=404, detail="Challenge not found")
-    
-    if challenge.challenged_id != user_id:
-        raise HTTPException(status_code=403, detail="You can only decline challenges sent to you")
-    
-    if challenge.status != "pending":
-        raise HTTPException(status_code=400, detail="Challenge is not pending")
+def decline_challenge(challenge_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    user_id = current_user.id
     
-    challenge.status = "declined"
-    db.commit()
+    try:
+        ChallengeService(db).decline(challenge_id, user_id)
+    except ChallengeError as e:
+        raise_challenge_error(e, "You can only decline challenges sent to you")
     
     return {"message": "Challenge declined successfully"}
 
 @router.post("/challenges/{challenge_id}/result")
-def submit_result(challenge_id: int, result: str, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
-    
-    if result not in ["won", "lost"]:
-        raise HTTPException(status_code=400, detail="Result must be 'won' or 'lost'")
-    
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        raise HTTPException(status_code=404, detail="Challenge not found")
-    
-    if challenge.status != "accepted":
-        raise HTTPException(status_code=400, detail="Challenge is not accepted")
-    
-    # Определяем, кто подает результат
-    is_challenger = challenge.challenger_id == user_id
-    is_challenged = challenge.challenged_id == user_id
-    
-    if not (is_challenger or is_challenged):
-        raise HTTPException(status_code=403, detail="You are not part of this challenge")
-    
-    # Сохраняем результат
-    if is_challenger:
-        challenge.challenger_result = result
-    else:
-        challenge.challenged_result = result
-    
-    # Проверяем, оба ли игрока подали результаты
-    if challenge.challenger_result and challenge.challenged_result:
-        # Верифицируем результаты
-        if challenge.challenger_result == challenge.challenged_result:
-            raise HTTPException(status_code=400, detail="Both players cannot have the same result")
-        
-        # Определяем победителя и проигравшего
-        if challenge.challenger_result == "won":
-            winner_id = challenge.challenger_id
-            loser_id = challenge.challenged_id
-        else:
-            winner_id = challenge.challenged_id
-            loser_id = challenge.challenger_id
-        
-        # Создаем матч
-        match = Match(
-            player1_id=challenge.challenger_id,
-            player2_id=challenge.challenged_id,
-            winner_id=winner_id,
-            loser_id=loser_id,
-            score="21:19",  # TODO: Добавить ввод счета
-            is_rated=True
-        )
-        db.add(match)
-        db.commit()
-        db.refresh(match)
-        
-        # Обновляем рейтинги (Elo система)
-        update_ratings(winner_id, loser_id, match.id, db)
-        
-        # Завершаем вызов
-        challenge.status = "completed"
-        challenge.completed_at = datetime.now()
-        challenge.match_id = match.id
-        db.commit()
+def submit_result(challenge_id: int, result: str, current_user: CurrentUser, db: Session = Depends(get_db)):
+    user_id = current_user.id
+    
+    try:
+        ChallengeService(db, user_snapshots.invalidate_users).submit_result(challenge_id, user_id, result)
+    except ChallengeError as e:
+        raise_challenge_error(e)
     
     return {"message": "Result submitted successfully"}
 
-def update_ratings(winner_id: int, loser_id: int, match_id: int, db: Session):
-    """Обновляет рейтинги игроков по системе Elo"""
-    winner = db.query(User).filter(User.id == winner_id).first()
-    loser = db.query(User).filter(User.id == loser_id).first()
-    
-    if not winner or not loser:
-        return
-    
-    # Простая реализация Elo (можно улучшить)
-    K = 32  # Коэффициент изменения рейтинга
-    expected_winner = 1 / (1 + 10 ** ((loser.rating - winner.rating) / 400))
-    expected_loser = 1 - expected_winner
-    
-    # Сохраняем старые рейтинги
-    winner_rating_before = winner.rating
-    loser_rating_before = loser.rating
-    
-    # Обновляем рейтинги
-    winner.rating += int(K * (1 - expected_winner))
-    loser.rating += int(K * (0 - expected_loser))
-    
-    # Создаем записи в истории рейтинга
-    winner_history = UserRatingHistory(
-        user_id=winner_id,
-        match_id=match_id,
-        rating_before=winner_rating_before,
-        rating_after=winner.rating,
-        change=winner.rating - winner_rating_before
-    )
-    
-    loser_history = UserRatingHistory(
-        user_id=loser_id,
-        match_id=match_id,
-        rating_before=loser_rating_before,
-        rating_after=loser.rating,
-        change=loser.rating - loser_rating_before
-    )
-    
-    db.add(winner_history)
-    db.add(loser_history)
-    db.commit()
+@router.get("/challenges", dependencies=[Depends(query_budget(3))])
+async def get_challenges(
+    current_user: CurrentUser,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db)
+):
+    user_id = current_user.id
+    
+    try:
+        return await db.run_sync(
+            lambda session: ChallengeService(session).inbox(user_id, status=status, cursor=cursor, limit=limit)
+        )
+    except ChallengeError as e:
+        raise_challenge_error(e)
 
-@router.get("/challenges")
-def get_challenges(db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
-    
-    challenges = db.query(Challenge).filter(
-        (Challenge.challenger_id == user_id) | (Challenge.challenged_id == user_id)
-    ).order_by(Challenge.created_at.desc()).all()
-    
-    result = []
-    for challenge in challenges:
-        challenger = db.query(User).filter(User.id == challenge.challenger_id).first()
-        challenged = db.query(User).filter(User.id == challenge.challenged_id).first()
-        
-        result.append({
-            "id": challenge.id,
-            "challenger_username": challenger.username if challenger else "Unknown",
-            "challenged_username": challenged.username if challenged else "Unknown",
-            "status": challenge.status,
-            "created_at": challenge.created_at,
-            "is_challenger": challenge.challenger_id == user_id
-        })
-    
-    return result 
\ No newline at end of file
+@router.get("/challenges/recommendations")
+async def get_recommendations(current_user: CurrentUser, limit: int = 5, db: AsyncSession = Depends(get_async_db)):
+    user_id = current_user.id
+    
+    return await db.run_sync(recommend_opponents, user_id, limit=max(1, min(limit, 20)))
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 from datetime import datetime
 import os
 import logging
 import uuid
 
-from app.database.database import get_db
-from app.database.models import Location, Rating, User, Photo
+from app.api.security import CurrentUser
+from app.database.database import get_db, get_read_db
+from app.database.profiling import query_budget
+from app.database.models import Location, Rating, Photo
 from pydantic import BaseModel
 from app.schemas.location import LocationCreate, LocationResponse, PhotoResponse
 
@@ -44,116 +48,93 @@ class RatingCreate(BaseModel):
 class RatingResponse(BaseModel):
     id: int
     score: int
-    comment: str = None
+    comment: Optional[str] = None
     created_at: str
     user: dict
 
     class Config:
         from_attributes = True
 
-@router.get("/locations", response_model=List[LocationResponse])
-def get_locations(
-    db: Session = Depends(get_db),
-    has_roof: bool = None,
-    net_type: str = None
-):
-    query = db.query(Location)
-    
-    if has_roof is not None:
-        query = query.filter(Location.has_roof == has_roof)
-    if net_type:
-        query = query.filter(Location.net_type == net_type)
-    
-    locations = query.all()
-    
-    # Convert locations to response model with proper datetime serialization
-    response_locations = []
-    for loc in locations:
-        # Get author information
-        author = db.query(User).filter(User.id == loc.user_id).first()
-        author_info = {
-            "id": author.id,
-            "username": author.username,
-            "telegram_id": author.telegram_id
-        } if author else None
-        
-        # Convert photos to response model
-        photos = []
-        for photo in loc.photos:
-            photo_dict = {
-                "id": photo.id,
-                "url": f"/static/photos/{photo.file_path}",
-                "location_id": photo.location_id
-            }
-            photos.append(photo_dict)
-        
-        # Create location response with proper datetime serialization
-        response_locations.append(LocationResponse(
-            id=loc.id,
-            name=loc.name,
-            description=loc.description,
-            latitude=loc.latitude,
-            longitude=loc.longitude,
-            has_roof=loc.has_roof,
-            net_type=loc.net_type,
-            created_at=loc.created_at.isoformat() if loc.created_at else datetime.now().isoformat(),
-            user_id=loc.user_id,
-            author=author_info,
-            photos=photos
-        ))
-    
-    return response_locations
-
-@router.get("/locations/{location_id}", response_model=LocationResponse)
-def get_location(location_id: int, db: Session = Depends(get_db)):
-    location = db.query(Location).filter(Location.id == location_id).first()
-    if not location:
-        raise HTTPException(status_code=404, detail="Location not found")
-    
-    # Get author information
-    author = db.query(User).filter(User.id == location.user_id).first()
+def location_to_response(loc: Location) -> LocationResponse:
+    """LocationResponse из спота с загруженными author и photos"""
     author_info = {
-        "id": author.id,
-        "username": author.username,
-        "telegram_id": author.telegram_id
-    } if author else None
+        "id": loc.author.id,
+        "username": loc.author.username,
+        "telegram_id": loc.author.telegram_id
+    } if loc.author else None
     
-    # Convert photos to response model
-    photos = []
-    for photo in location.photos:
-        photo_dict = {
+    photos = [
+        {
             "id": photo.id,
             "url": f"/static/photos/{photo.file_path}",
             "location_id": photo.location_id
         }
-        photos.append(photo_dict)
+        for photo in loc.photos
+    ]
     
-    # Create location response with proper datetime serialization
     return LocationResponse(
-        id=location.id,
-        name=location.name,
-        description=location.description,
-        latitude=location.latitude,
-        longitude=location.longitude,
-        has_roof=location.has_roof,
-        net_type=location.net_type,
-        created_at=location.created_at.isoformat() if location.created_at else datetime.now().isoformat(),
-        user_id=location.user_id,
+        id=loc.id,
+        name=loc.name,
+        description=loc.description,
+        latitude=loc.latitude,
+        longitude=loc.longitude,
+        has_roof=loc.has_roof,
+        net_type=loc.net_type,
+        created_at=loc.created_at.isoformat() if loc.created_at else datetime.now().isoformat(),
+        user_id=loc.user_id,
         author=author_info,
         photos=photos
     )
 
+def rating_to_response(rating: Rating) -> RatingResponse:
+    """RatingResponse из оценки с загруженным user"""
+    return RatingResponse(
+        id=rating.id,
+        score=rating.score,
+        comment=rating.comment,
+        created_at=rating.created_at.isoformat() if rating.created_at else datetime.now().isoformat(),
+        user={
+            "id": rating.user.id,
+            "username": rating.user.username,
+            "telegram_id": rating.user.telegram_id
+        } if rating.user else {}
+    )
+
+@router.get("/locations", response_model=List[LocationResponse], dependencies=[Depends(query_budget(3))])
+async def get_locations(
+    db: AsyncSession = Depends(get_read_db),
+    has_roof: bool = None,
+    net_type: str = None
+):
+    # Авторы и фотографии загружаются двумя запросами на весь список, а не по запросу на спот
+    query = select(Location).options(selectinload(Location.author), selectinload(Location.photos))
+    
+    if has_roof is not None:
+        query = query.where(Location.has_roof == has_roof)
+    if net_type:
+        query = query.where(Location.net_type == net_type)
+    
+    locations = (await db.execute(query)).scalars().all()
+    return [location_to_response(loc) for loc in locations]
+
+@router.get("/locations/{location_id}", response_model=LocationResponse, dependencies=[Depends(query_budget(3))])
+async def get_location(location_id: int, db: AsyncSession = Depends(get_read_db)):
+    location = (await db.execute(
+        select(Location)
+        .options(selectinload(Location.author), selectinload(Location.photos))
+        .where(Location.id == location_id)
+    )).scalars().first()
+    if not location:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return location_to_response(location)
+
 @router.post("/locations/{location_id}/ratings", response_model=RatingResponse)
 def create_rating(
     location_id: int,
     rating: RatingCreate,
+    user: CurrentUser,
     db: Session = Depends(get_db)
 ):
-    # В реальном приложении здесь должна быть аутентификация пользователя
-    # Для демонстрации используем первого пользователя
-    user = db.query(User).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
 
     location = db.query(Location).filter(Location.id == location_id).first()
     if not location:
@@ -175,7 +156,7 @@ def create_rating(
         existing_rating.comment = rating.comment
         db.commit()
         db.refresh(existing_rating)
-        return existing_rating
+        return rating_to_response(existing_rating)
 
     # Создаем новую оценку
     new_rating = Rating(
@@ -187,17 +168,25 @@ def create_rating(
     db.add(new_rating)
     db.commit()
     db.refresh(new_rating)
-    return new_rating
+    return rating_to_response(new_rating)
 
-@router.get("/locations/{location_id}/ratings", response_model=List[RatingResponse])
+@router.get("/locations/{location_id}/ratings", response_model=List[RatingResponse],
+            dependencies=[Depends(query_budget(3))])
 def get_location_ratings(location_id: int, db: Session = Depends(get_db)):
-    location = db.query(Location).filter(Location.id == location_id).first()
+    # Авторы оценок загружаются одним запросом, а не по запросу на оценку
+    location = (
+        db.query(Location)
+        .options(selectinload(Location.ratings).selectinload(Rating.user))
+        .filter(Location.id == location_id)
+        .first()
+    )
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
-    return location.ratings
+    return [rating_to_response(rating) for rating in location.ratings]
 
 @router.post("/locations", response_model=LocationResponse)
 def create_location(
+    user: CurrentUser,
     db: Session = Depends(get_db),
     name: str = Form(...),
     description: str = Form(...),
@@ -210,11 +199,6 @@ def create_location(
 ):
     import logging
     logging.warning(f"has_roof={has_roof}, tables_count={tables_count}, photos={[f.filename for f in photos]}")
-    # Для демонстрации используем первого пользователя
-    user = db.query(User).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     try:
         tables_count_int = int(tables_count)
         if tables_count_int < 1:
@@ -253,27 +237,4 @@ def create_location(
     db.commit()
     db.refresh(location)
 
-    # Формируем ответ
-    author = db.query(User).filter(User.id == location.user_id).first()
-    author_info = {
-        "id": author.id,
-        "username": author.username,
-        "telegram_id": author.telegram_id
-    } if author else None
-    photos_response = [
-        {"id": p.id, "url": f"/static/photos/{p.file_path}", "location_id": p.location_id}
-        for p in location.photos
-    ]
-    return LocationResponse(
-        id=location.id,
-        name=location.name,
-        description=location.description,
-        latitude=location.latitude,
-        longitude=location.longitude,
-        has_roof=location.has_roof,
-        net_type=location.net_type,
-        created_at=location.created_at.isoformat() if location.created_at else datetime.now().isoformat(),
-        user_id=location.user_id,
-        author=author_info,
-        photos=photos_response
-    ) 
\ No newline at end of file
+    return location_to_response(location)
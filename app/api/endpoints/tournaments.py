@@ -1,19 +1,44 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.database import get_db
+from app.api.security import CurrentUser
+from app.database.database import get_async_db, get_db, get_read_db, SessionLocal
+from app.database.profiling import query_budget
 from app.database.models import Tournament, TournamentParticipant, User, Location, Match
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import random
+from sqlalchemy import func, insert, select, tuple_, update
+from app.services.brackets import FORMATS, SINGLE_ELIMINATION, build_bracket
+from app.services.tournament_results import TournamentError, match_to_dict, report_match_result
+from app.services.scheduler import replan_tournament, tournament_schedule
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.tournament_registration import MAX_BULK_PLAYERS, add_participants, bulk_register
+from app.services.matchmaking import DEFAULT_RATING
+from app.services.live import broadcaster, format_event, tournament_snapshot
+from app.services.simulation import SIMULATION_RUNS, SimulationError, tournament_outcomes
+from app.bot.fanout import enqueue_tournament_notifications, notification_counts, release_stale_claims
+import asyncio
 
 router = APIRouter()
 
+STREAM_KEEPALIVE_SECONDS = 15
+
 class TournamentCreate(BaseModel):
     title: str
     spot_id: int
     datetime: datetime
     description: Optional[str] = None
+    format: str = SINGLE_ELIMINATION
+
+class BulkRegistration(BaseModel):
+    players: List[str]  # @username или telegram id
+
+class MatchResult(BaseModel):
+    winner_id: int
+    score: Optional[str] = None
 
 class TournamentResponse(BaseModel):
     id: int
@@ -22,23 +47,21 @@ class TournamentResponse(BaseModel):
     datetime: datetime
     description: Optional[str]
     status: str
+    format: str
     created_at: datetime
     participants_count: int
 
-def is_admin(db: Session, user_id: int) -> bool:
-    """Проверяет, является ли пользователь администратором"""
-    user = db.query(User).filter(User.id == user_id).first()
-    return user and user.is_admin
-
 @router.post("/tournaments")
-def create_tournament(tournament: TournamentCreate, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
+def create_tournament(tournament: TournamentCreate, current_user: CurrentUser, db: Session = Depends(get_db)):
+    user_id = current_user.id
     
     # Проверяем права администратора
-    if not is_admin(db, user_id):
+    if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only administrators can create tournaments")
     
+    if tournament.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(FORMATS)}")
+    
     # Проверяем, что спот существует
     spot = db.query(Location).filter(Location.id == tournament.spot_id).first()
     if not spot:
@@ -50,7 +73,8 @@ def create_tournament(tournament: TournamentCreate, db: Session = Depends(get_db
         datetime=tournament.datetime,
         description=tournament.description,
         created_by=user_id,
-        status="open"
+        status="open",
+        format=tournament.format
     )
     db.add(new_tournament)
     db.commit()
@@ -58,33 +82,86 @@ def create_tournament(tournament: TournamentCreate, db: Session = Depends(get_db
     
     return {"id": new_tournament.id, "message": "Tournament created successfully"}
 
-@router.get("/tournaments")
-def get_tournaments(db: Session = Depends(get_db)):
-    tournaments = db.query(Tournament).order_by(Tournament.created_at.desc()).all()
-    result = []
-    
-    for tournament in tournaments:
-        participants_count = db.query(TournamentParticipant).filter(
-            TournamentParticipant.tournament_id == tournament.id
-        ).count()
-        
-        result.append({
+@router.get("/tournaments", dependencies=[Depends(query_budget(1))])
+async def get_tournaments(
+    status: Optional[str] = None,
+    spot_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    upcoming: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_read_db)
+):
+    limit = max(1, min(limit, 100))
+    
+    # Число участников - коррелированный подзапрос по индексу только для
+    # турниров страницы, а не группировка всей таблицы участников
+    participants_count = (
+        select(func.count())
+        .where(TournamentParticipant.tournament_id == Tournament.id)
+        .correlate(Tournament)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Tournament,
+            participants_count.label("participants_count"),
+            Location.name.label("spot_name"),
+            Location.latitude.label("spot_latitude"),
+            Location.longitude.label("spot_longitude"),
+        )
+        .outerjoin(Location, Location.id == Tournament.spot_id)
+        .order_by(Tournament.created_at.desc(), Tournament.id.desc())
+        .limit(limit + 1)
+    )
+    
+    if status:
+        query = query.where(Tournament.status == status)
+    if spot_id is not None:
+        query = query.where(Tournament.spot_id == spot_id)
+    if date_from:
+        query = query.where(Tournament.datetime >= date_from)
+    if date_to:
+        query = query.where(Tournament.datetime <= date_to)
+    if upcoming:
+        query = query.where(Tournament.datetime >= datetime.now(), Tournament.status != "completed")
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(tuple_(Tournament.created_at, Tournament.id) < position)
+    
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].Tournament.created_at, rows[-1].Tournament.id)
+    
+    items = []
+    for row in rows:
+        tournament = row.Tournament
+        items.append({
             "id": tournament.id,
             "title": tournament.title,
             "spot_id": tournament.spot_id,
+            "spot_name": row.spot_name,
+            "spot_latitude": row.spot_latitude,
+            "spot_longitude": row.spot_longitude,
             "datetime": tournament.datetime,
             "description": tournament.description,
             "status": tournament.status,
+            "format": tournament.format,
             "created_at": tournament.created_at,
-            "participants_count": participants_count
+            "participants_count": row.participants_count
         })
     
-    return result
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.post("/tournaments/{tournament_id}/join")
-def join_tournament(tournament_id: int, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
+def join_tournament(tournament_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    user_id = current_user.id
     
     tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
     if not tournament:
@@ -93,72 +170,244 @@ def join_tournament(tournament_id: int, db: Session = Depends(get_db)):
     if tournament.status != "open":
         raise HTTPException(status_code=400, detail="Tournament is not open for registration")
     
-    # Проверяем, что пользователь еще не зарегистрирован
-    existing_participant = db.query(TournamentParticipant).filter(
-        TournamentParticipant.tournament_id == tournament_id,
-        TournamentParticipant.user_id == user_id
-    ).first()
-    
-    if existing_participant:
+    # Уникальный ключ (tournament_id, user_id) отсекает повторную регистрацию
+    if not add_participants(db, tournament_id, [user_id]):
+        db.rollback()
         raise HTTPException(status_code=400, detail="Already registered for this tournament")
-    
-    participant = TournamentParticipant(
-        tournament_id=tournament_id,
-        user_id=user_id
-    )
-    db.add(participant)
     db.commit()
+    broadcaster.publish(tournament_id, "participants", {"added": [user_id]})
     
     return {"message": "Successfully joined tournament"}
 
-@router.post("/tournaments/{tournament_id}/start")
-def start_tournament(tournament_id: int, db: Session = Depends(get_db)):
-    # TODO: Получить user_id из JWT токена
-    user_id = 1  # Временно используем фиксированный ID
+@router.post("/tournaments/{tournament_id}/participants/bulk")
+def bulk_register_participants(
+    tournament_id: int,
+    registration: BulkRegistration,
+    current_user: CurrentUser,
+    db: Session = Depends(get_db)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only administrators can register players")
     
+    if len(registration.players) > MAX_BULK_PLAYERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_PLAYERS} players per request")
+    
+    tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    
+    if tournament.status != "open":
+        raise HTTPException(status_code=400, detail="Tournament is not open for registration")
+    
+    result = bulk_register(db, tournament_id, registration.players)
+    if result["added"]:
+        broadcaster.publish(tournament_id, "participants", {"added": [p["user_id"] for p in result["added"]]})
+    return result
+
+@router.post("/tournaments/{tournament_id}/start")
+def start_tournament(
+    tournament_id: int,
+    current_user: CurrentUser,
+    db: Session = Depends(get_db)
+):
     # Проверяем права администратора
-    if not is_admin(db, user_id):
+    if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Only administrators can start tournaments")
     
     tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
     if not tournament:
         raise HTTPException(status_code=404, detail="Tournament not found")
     
-    if tournament.status != "open":
+    # Захватываем старт атомарно: из двух одновременных запросов сетку строит только один
+    claimed = db.execute(
+        update(Tournament)
+        .where(Tournament.id == tournament_id, Tournament.status == "open")
+        .values(status="started")
+        .returning(Tournament.id)
+    ).first()
+    if claimed is None:
         raise HTTPException(status_code=400, detail="Tournament is not open")
     
-    participants = db.query(TournamentParticipant).filter(
-        TournamentParticipant.tournament_id == tournament_id
-    ).all()
+    # Посев по рейтингу: сильнейший игрок первый, игрок без рейтинга считается как DEFAULT_RATING
+    seeds = [
+        participant_id for (participant_id,) in db.query(TournamentParticipant.user_id)
+        .join(User, User.id == TournamentParticipant.user_id)
+        .filter(TournamentParticipant.tournament_id == tournament_id)
+        .order_by(func.coalesce(User.rating, DEFAULT_RATING).desc(), TournamentParticipant.registered_at,
+                  TournamentParticipant.id)
+    ]
     
-    if len(participants) < 2:
+    if len(seeds) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 participants to start tournament")
     
-    # Генерируем сетку (single elimination)
-    generate_tournament_bracket(tournament_id, participants, db)
+    generate_tournament_bracket(tournament, seeds, db)
+    replan_tournament(db, tournament)
     
-    # Обновляем статус турнира
-    tournament.status = "started"
+    # Строки доставки создаются в той же транзакции, рассылает их бот
+    enqueue_tournament_notifications(db, tournament_id)
     db.commit()
     
+    if broadcaster.subscribers_count(tournament_id):
+        broadcaster.publish(tournament_id, "snapshot", tournament_snapshot(db, tournament_id))
+    
     return {"message": "Tournament started successfully"}
 
-def generate_tournament_bracket(tournament_id: int, participants: List[TournamentParticipant], db: Session):
-    """Генерирует сетку турнира (single elimination)"""
-    user_ids = [p.user_id for p in participants]
-    
-    # Перемешиваем участников
-    random.shuffle(user_ids)
-    
-    # Создаем матчи для первого раунда
-    for i in range(0, len(user_ids), 2):
-        if i + 1 < len(user_ids):
-            match = Match(
-                player1_id=user_ids[i],
-                player2_id=user_ids[i + 1],
-                tournament_id=tournament_id,
-                is_rated=False  # Турнирные матчи не влияют на рейтинг
-            )
-            db.add(match)
-    
-    db.commit() 
\ No newline at end of file
+@router.get("/tournaments/{tournament_id}/notifications")
+def get_tournament_notifications(tournament_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    """Статусы доставки уведомления о старте турнира"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only administrators can view notifications")
+    
+    if not db.query(Tournament.id).filter(Tournament.id == tournament_id).first():
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return notification_counts(db, tournament_id)
+
+@router.post("/tournaments/{tournament_id}/notify")
+def resume_tournament_notifications(tournament_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    """Возвращает в очередь уведомления, зависшие после падения рассылки; досылает их бот"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only administrators can send notifications")
+    
+    tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    if tournament.status == "open":
+        raise HTTPException(status_code=400, detail="Tournament is not started")
+    
+    release_stale_claims(db, tournament_id)
+    db.commit()
+    return notification_counts(db, tournament_id)
+
+def generate_tournament_bracket(tournament: Tournament, seeds: List[int], db: Session):
+    """Создает все матчи всех раундов сетки одной массовой вставкой (без commit)"""
+    rows = build_bracket(tournament.format or SINGLE_ELIMINATION, seeds)
+    for row in rows:
+        row["tournament_id"] = tournament.id
+        row["spot_id"] = tournament.spot_id
+        row["is_rated"] = False  # Турнирные матчи не влияют на рейтинг
+    db.execute(insert(Match), rows)
+
+TOURNAMENT_ERRORS = {
+    "not_found": (404, "Tournament not found"),
+    "not_started": (400, "Tournament is not started"),
+    "match_not_found": (404, "Match not found"),
+    "forbidden": (403, "Only match players or administrators can report results"),
+    "already_reported": (400, "Match result already reported with a different winner"),
+    "not_ready": (400, "Match players are not known yet"),
+    "invalid_winner": (400, "Winner must be one of the match players"),
+}
+
+@router.get("/tournaments/{tournament_id}/matches", dependencies=[Depends(query_budget(1))])
+async def get_tournament_matches(tournament_id: int, db: AsyncSession = Depends(get_async_db)):
+    matches = (await db.execute(
+        select(Match).where(Match.tournament_id == tournament_id).order_by(Match.slot)
+    )).scalars().all()
+    return [match_to_dict(match) for match in matches]
+
+@router.get("/tournaments/{tournament_id}/schedule")
+async def get_tournament_schedule(tournament_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Расписание по столам: несыгранные матчи в порядке начала"""
+    return await db.run_sync(tournament_schedule, tournament_id)
+
+@router.post("/tournaments/{tournament_id}/schedule")
+def rebuild_tournament_schedule(tournament_id: int, current_user: CurrentUser, db: Session = Depends(get_db)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only administrators can reschedule tournaments")
+    
+    tournament = db.query(Tournament).filter(Tournament.id == tournament_id).first()
+    if not tournament:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    if tournament.status != "started":
+        raise HTTPException(status_code=400, detail="Tournament is not started")
+    
+    replan_tournament(db, tournament)
+    db.commit()
+    return tournament_schedule(db, tournament_id)
+
+@router.post("/tournaments/{tournament_id}/matches/{match_id}/result")
+def submit_match_result(
+    tournament_id: int,
+    match_id: int,
+    result: MatchResult,
+    current_user: CurrentUser,
+    db: Session = Depends(get_db)
+):
+    user_id = current_user.id
+    
+    # Администратор может внести любой результат, игрок - только своего матча
+    reported_by = None if current_user.is_admin else user_id
+    
+    try:
+        outcome = report_match_result(db, tournament_id, match_id, result.winner_id, result.score, reported_by)
+    except TournamentError as e:
+        status_code, detail = TOURNAMENT_ERRORS[e.code]
+        raise HTTPException(status_code=status_code, detail=detail)
+    
+    # Дельта считается один раз и рассылается всем зрителям турнира
+    broadcaster.publish(tournament_id, "result", outcome)
+    if broadcaster.subscribers_count(tournament_id):
+        if outcome["next_round_paired"]:
+            broadcaster.publish(tournament_id, "snapshot", tournament_snapshot(db, tournament_id))
+        elif not outcome["tournament_completed"]:
+            broadcaster.publish(tournament_id, "schedule", tournament_schedule(db, tournament_id))
+    
+    return outcome
+
+SIMULATION_ERRORS = {
+    "not_found": (404, "Tournament not found"),
+    "not_enough_participants": (400, "Need at least 2 participants to simulate tournament"),
+    "unsupported_format": (400, "Simulation is not supported for this tournament format"),
+    "broken_bracket": (409, "Tournament bracket is inconsistent"),
+}
+
+@router.get("/tournaments/{tournament_id}/simulation")
+def simulate_tournament(tournament_id: int, current_user: CurrentUser, runs: int = SIMULATION_RUNS,
+                        db: Session = Depends(get_db)):
+    """Шансы участников дойти до каждого раунда и выиграть турнир.
+
+    Моделирование нагружает CPU, поэтому доступно только вошедшим
+    пользователям, а runs округляется до одного из SIMULATION_RUN_STEPS.
+    """
+    try:
+        return tournament_outcomes(db, tournament_id, runs)
+    except SimulationError as e:
+        status_code, detail = SIMULATION_ERRORS[e.code]
+        raise HTTPException(status_code=status_code, detail=detail)
+
+def read_snapshot(tournament_id: int):
+    db = SessionLocal()
+    try:
+        return tournament_snapshot(db, tournament_id)
+    finally:
+        db.close()
+
+@router.get("/tournaments/{tournament_id}/stream")
+async def stream_tournament(tournament_id: int, request: Request):
+    """Server-Sent Events: снимок турнира, затем дельты результатов"""
+    # Подписываемся до чтения снимка, чтобы не потерять события между ними
+    queue = broadcaster.subscribe(tournament_id)
+    snapshot = await run_in_threadpool(read_snapshot, tournament_id)
+    if snapshot is None:
+        broadcaster.unsubscribe(tournament_id, queue)
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    
+    async def events():
+        try:
+            yield format_event("snapshot", snapshot)
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield payload
+        finally:
+            broadcaster.unsubscribe(tournament_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Annotated, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.user_cache import UserCache, UserSnapshot
+from app.database.database import get_async_db
+from app.database.models import User
+
+JWT_SECRET = os.getenv("JWT_SECRET", "jwtsecret")
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRE_MINUTES = 60 * 24 * 7  # 1 неделя
+
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Права и рейтинг меняются и в боте, поэтому снимок пользователя живет недолго
+USER_SNAPSHOT_TTL = float(os.getenv("AUTH_USER_TTL", "30"))
+
+bearer = HTTPBearer(auto_error=False)
+
+
+def create_access_token(user: User) -> str:
+    payload = {
+        "sub": str(user.id),
+        "telegram_id": user.telegram_id,
+        "username": user.username,
+        "exp": datetime.utcnow() + timedelta(minutes=JWT_EXPIRE_MINUTES),
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+class TokenCache:
+    """LRU проверенных токенов: sha256(токен) -> (exp, telegram_id).
+
+    Запись действительна до exp самого токена, поэтому повторная проверка
+    подписи для него не нужна. Ключ - хэш, а не сам токен, чтобы в памяти
+    не лежали действующие учетные данные.
+    """
+
+    def __init__(self, size: int = TOKEN_CACHE_SIZE):
+        self.size = size
+        self._items: "OrderedDict[bytes, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: bytes, exp: float, telegram_id: int):
+        with self._lock:
+            self._items[key] = (exp, telegram_id)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+token_cache = TokenCache()
+user_snapshots = UserCache(ttl=USER_SNAPSHOT_TTL)
+
+
+def verify_token(token: str) -> int:
+    """telegram_id из действующего токена; HTTPException 401, если токен не подходит"""
+    key = hashlib.sha256(token.encode()).digest()
+    telegram_id = token_cache.get(key)
+    if telegram_id is not None:
+        return telegram_id
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        telegram_id = int(payload["telegram_id"])
+        exp = float(payload["exp"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    token_cache.put(key, exp, telegram_id)
+    return telegram_id
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+    db: AsyncSession = Depends(get_async_db),
+) -> UserSnapshot:
+    """Пользователь из заголовка Authorization: Bearer <JWT из /auth/telegram>.
+
+    Зависимость асинхронная: при попадании в кэш запрос не занимает
+    поток из пула FastAPI и не берет соединение с БД.
+    """
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    telegram_id = verify_token(credentials.credentials)
+
+    user = user_snapshots.get(telegram_id)
+    if user is None:
+        row = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalars().first()
+        if row is None:
+            raise HTTPException(status_code=401, detail="User not found", headers={"WWW-Authenticate": "Bearer"})
+        user = UserSnapshot.from_user(row)
+        user_snapshots.put(user)
+    return user
+
+
+# Параметр эндпоинта: current_user: CurrentUser
+CurrentUser = Annotated[UserSnapshot, Depends(get_current_user)]
@@ -0,0 +1,14 @@
+import os
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+
+def create_bot() -> Bot:
+    """Бот с токеном BOT_TOKEN; TELEGRAM_API_URL задает другой адрес Bot API
+    (локальный сервер Telegram или фейковый API для тестов)"""
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if api_url:
+        return Bot(token=os.getenv("BOT_TOKEN"), session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    return Bot(token=os.getenv("BOT_TOKEN"))
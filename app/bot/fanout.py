@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.bot.outbox import GLOBAL_RATE, PRIORITY_BULK, Outbox
+from app.database.database import AsyncSessionLocal, dialect_insert
+from app.database.models import (
+    NOTIFICATION_ACTIVE_WHERE, Match, Tournament, TournamentNotification, TournamentParticipant, User
+)
+
+# Строк за одну порцию - примерно секунда отправки при лимите Telegram
+FANOUT_PAGE = int(os.getenv("BOT_FANOUT_PAGE", str(max(1, int(GLOBAL_RATE)))))
+# Как часто бот проверяет, нет ли новых рассылок
+FANOUT_POLL_SECONDS = float(os.getenv("BOT_FANOUT_POLL_SECONDS", "5"))
+# Строка, которая дольше этого остается в sending или delivering, считается брошенной упавшей рассылкой
+FANOUT_STALE_SECONDS = float(os.getenv("BOT_FANOUT_STALE_SECONDS", "300"))
+KIND_STARTED = "started"
+
+logger = logging.getLogger(__name__)
+
+# Рассылки, идущие в этом процессе: (tournament_id, kind) -> задача
+_running: Dict[Tuple[int, str], asyncio.Task] = {}
+
+
+def enqueue_tournament_notifications(db: Session, tournament_id: int, kind: str = KIND_STARTED) -> int:
+    """Создает строки доставки для всех участников одним INSERT ... SELECT (без commit).
+
+    Уже существующие строки не трогаются, поэтому повторный вызов не
+    приводит к повторной отправке. Отправляет их бот (watch_fan_outs).
+    """
+    insert = dialect_insert(db, TournamentNotification).from_select(
+        ["tournament_id", "user_id", "kind", "status"],
+        select(
+            TournamentParticipant.tournament_id, TournamentParticipant.user_id,
+            bindparam("kind", kind), bindparam("status", "pending"),
+        ).where(TournamentParticipant.tournament_id == tournament_id)
+    ).on_conflict_do_nothing(index_elements=["tournament_id", "user_id", "kind"])
+    return db.execute(insert).rowcount
+
+
+def notification_counts(db: Session, tournament_id: int, kind: str = KIND_STARTED) -> Dict[str, int]:
+    rows = db.execute(
+        select(TournamentNotification.status, func.count())
+        .where(TournamentNotification.tournament_id == tournament_id, TournamentNotification.kind == kind)
+        .group_by(TournamentNotification.status)
+    ).all()
+    counts = {"pending": 0, "sending": 0, "delivering": 0, "sent": 0, "failed": 0}
+    counts.update(dict(rows))
+    return counts
+
+
+def _active(status: str):
+    """status = :status вместе с условием частичного индекса ix_tournament_notifications_active.
+
+    Условие индекса повторяется в запросе дословно: иначе SQLite не видит,
+    что индекс подходит.
+    """
+    return and_(NOTIFICATION_ACTIVE_WHERE, TournamentNotification.status == status)
+
+
+def release_stale_claims(db: Session, tournament_id: Optional[int] = None,
+                         stale_seconds: float = FANOUT_STALE_SECONDS) -> int:
+    """Разбирает строки, брошенные упавшей рассылкой (без commit).
+
+    sending - строка взята, но запрос к Telegram по ней еще не начат:
+    зависшая дольше stale_seconds возвращается в pending и будет
+    отправлена заново. delivering - запрос начат, и дошло ли сообщение,
+    неизвестно: такая строка не отправляется повторно, а помечается
+    failed. Возвращает число строк, возвращенных в очередь.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_seconds)
+    stale = or_(TournamentNotification.claimed_at.is_(None), TournamentNotification.claimed_at < cutoff)
+    released_query = (
+        update(TournamentNotification)
+        .where(_active("sending"), stale)
+        .values(status="pending", claimed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    interrupted_query = (
+        update(TournamentNotification)
+        .where(_active("delivering"), stale)
+        .values(status="failed", error="interrupted, delivery unknown")
+        .execution_options(synchronize_session=False)
+    )
+    if tournament_id is not None:
+        released_query = released_query.where(TournamentNotification.tournament_id == tournament_id)
+        interrupted_query = interrupted_query.where(TournamentNotification.tournament_id == tournament_id)
+    released = db.execute(released_query).rowcount
+    interrupted = db.execute(interrupted_query).rowcount
+    if released or interrupted:
+        logger.warning("Зависшие уведомления: возвращено в очередь %s, прервано при отправке %s",
+                       released, interrupted)
+    return released
+
+
+def start_fan_out(tournament_id: int, kind: str, outbox: Outbox) -> bool:
+    """Запускает рассылку в текущем цикле событий, если она еще не идет"""
+    key = (tournament_id, kind)
+    task = _running.get(key)
+    if task is not None and not task.done():
+        return False
+    task = _running[key] = asyncio.create_task(fan_out(tournament_id, kind, outbox))
+    task.add_done_callback(lambda _: _running.pop(key, None))
+    return True
+
+
+async def watch_fan_outs(outbox: Outbox, interval: float = FANOUT_POLL_SECONDS):
+    """Фоновая задача бота: запускает рассылки по pending строкам.
+
+    API только создает строки доставки, а отправляет их бот через свой
+    outbox - так все сообщения процесса бота делят один лимит Telegram.
+    Заодно подбираются рассылки, прерванные перезапуском.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(release_stale_claims)
+                await db.commit()
+                pending = (await db.execute(
+                    select(TournamentNotification.tournament_id, TournamentNotification.kind)
+                    .where(_active("pending"))
+                    .distinct()
+                )).all()
+            for tournament_id, kind in pending:
+                if start_fan_out(tournament_id, kind, outbox):
+                    logger.info("Рассылка %s турнира %s", kind, tournament_id)
+        except Exception:
+            logger.exception("Не удалось проверить очередь рассылок")
+        await asyncio.sleep(interval)
+
+
+async def fan_out(tournament_id: int, kind: str, outbox: Outbox, page_size: int = FANOUT_PAGE) -> Dict[str, int]:
+    """Рассылает уведомления участникам по строкам доставки со статусом pending.
+
+    Получатели читаются страницами по page_size в коротких сессиях:
+    страница переводится из pending в sending (строку берет только тот,
+    кто ее перевел) и отправляется через outbox с приоритетом рассылки.
+    Состояние каждой строки записывается отдельно: перед запросом к
+    Telegram - delivering, после него - sent или failed. Поэтому после
+    падения release_stale_claims возвращает в очередь только строки, по
+    которым запрос еще не начинался, и повторной отправки не бывает.
+    """
+    totals = {"sent": 0, "failed": 0}
+    async with AsyncSessionLocal() as db:
+        tournament = (await db.execute(
+            select(Tournament.title).where(Tournament.id == tournament_id)
+        )).scalar()
+        first_matches = await db.run_sync(_first_matches, tournament_id)
+
+    writer = _StateWriter()
+    last_id = 0
+    while True:
+        claimed = await _claim_page(tournament_id, kind, last_id, page_size)
+        if claimed is None:
+            break
+        last_id, rows = claimed
+        names = await _names(
+            {first_matches[row.user_id][0] for row in rows if row.user_id in first_matches} - {None}
+        )
+
+        missing = [row.id for row in rows if not row.telegram_id]
+        await asyncio.gather(*(writer.save(_result(row_id, "failed", "no telegram_id")) for row_id in missing))
+        totals["failed"] += len(missing)
+
+        deliveries = [
+            _deliver_row(writer, row.id, outbox, row.telegram_id,
+                         _render(tournament, first_matches.get(row.user_id), names))
+            for row in rows if row.telegram_id
+        ]
+        for status in await asyncio.gather(*deliveries):
+            if status is not None:
+                totals[status] += 1
+
+    logger.info("Рассылка %s турнира %s: %s", kind, tournament_id, totals)
+    return totals
+
+
+async def _claim_page(tournament_id: int, kind: str, after_id: int, page_size: int):
+    """Следующая страница pending строк после after_id, переведенная в sending.
+
+    Возвращает (id последней просмотренной строки, взятые строки) или
+    None, если pending строк больше нет.
+    """
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(TournamentNotification.id, TournamentNotification.user_id, User.telegram_id)
+            .join(User, User.id == TournamentNotification.user_id)
+            .where(
+                TournamentNotification.tournament_id == tournament_id,
+                TournamentNotification.kind == kind,
+                TournamentNotification.status == "pending",
+                TournamentNotification.id > after_id,
+            )
+            .order_by(TournamentNotification.id)
+            .limit(page_size)
+        )).all()
+        if not rows:
+            return None
+        claimed = set((await db.execute(
+            update(TournamentNotification)
+            .where(
+                TournamentNotification.id.in_([row.id for row in rows]),
+                TournamentNotification.status == "pending",
+            )
+            .values(status="sending", claimed_at=datetime.now(timezone.utc))
+            .returning(TournamentNotification.id)
+            .execution_options(synchronize_session=False)
+        )).scalars())
+        await db.commit()
+    return rows[-1].id, [row for row in rows if row.id in claimed]
+
+
+async def _deliver_row(writer: "_StateWriter", notification_id: int, outbox: Outbox, chat_id: int,
+                       text: str) -> Optional[str]:
+    """Отправляет одно уведомление и записывает его итог, как только он известен.
+
+    Возвращает записанный статус или None, если запрос к Telegram так и
+    не начался (строка остается в sending до release_stale_claims).
+    """
+    started = False
+
+    async def mark_delivering():
+        nonlocal started
+        if not await writer.mark_delivering(notification_id):
+            # Строку уже вернули в очередь как зависшую - ее отправит следующий проход
+            raise RuntimeError(f"notification {notification_id} is no longer claimed")
+        started = True
+
+    try:
+        await outbox.send(chat_id, text, priority=PRIORITY_BULK, before_send=mark_delivering)
+        result = _result(notification_id, "sent")
+    except Exception as e:
+        if not started:
+            return None
+        result = _result(notification_id, "failed", str(e)[:200] or type(e).__name__)
+    await writer.save(result)
+    return result["b_status"]
+
+
+def _result(notification_id: int, status: str, error: Optional[str] = None) -> dict:
+    return {
+        "b_id": notification_id, "b_status": status, "b_error": error,
+        "b_sent_at": datetime.now(timezone.utc) if status == "sent" else None,
+    }
+
+
+class _StateWriter:
+    """Записывает состояние строк доставки по мере отправки.
+
+    Каждая строка получает свою запись, но записи, накопившиеся за время
+    предыдущей транзакции, уходят следующей одной транзакцией в одной
+    сессии: параллельные отправки не открывают по соединению на строку.
+    """
+
+    def __init__(self):
+        self._marks: Dict[int, asyncio.Future] = {}
+        self._results: List[Tuple[dict, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_delivering(self, notification_id: int) -> asyncio.Future:
+        """sending -> delivering; future с True, если строка еще была взята этой рассылкой"""
+        future = self._marks[notification_id] = asyncio.get_running_loop().create_future()
+        self._wake()
+        return future
+
+    def save(self, result: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._results.append((result, future))
+        self._wake()
+        return future
+
+    def _wake(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        table = TournamentNotification.__table__
+        while self._marks or self._results:
+            marks, self._marks = self._marks, {}
+            results, self._results = self._results, []
+            try:
+                async with AsyncSessionLocal() as db:
+                    marked = set()
+                    if marks:
+                        marked = set((await db.execute(
+                            update(table)
+                            .where(table.c.id.in_(list(marks)), table.c.status == "sending")
+                            .values(status="delivering", claimed_at=datetime.now(timezone.utc))
+                            .returning(table.c.id)
+                        )).scalars())
+                    if results:
+                        await db.execute(
+                            update(table)
+                            .where(table.c.id == bindparam("b_id"))
+                            .values(status=bindparam("b_status"), error=bindparam("b_error"),
+                                    sent_at=bindparam("b_sent_at")),
+                            [result for result, _ in results]
+                        )
+                    await db.commit()
+            except Exception as e:
+                for future in [*marks.values(), *(future for _, future in results)]:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for notification_id, future in marks.items():
+                if not future.done():
+                    future.set_result(notification_id in marked)
+            for _, future in results:
+                if not future.done():
+                    future.set_result(None)
+
+
+async def _names(user_ids) -> Dict[int, str]:
+    if not user_ids:
+        return {}
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(User.id, User.username, User.first_name).where(User.id.in_(user_ids))
+        )).all()
+    return {
+        user_id: f"@{username}" if username else (first_name or "игрок")
+        for user_id, username, first_name in rows
+    }
+
+
+def _first_matches(db: Session, tournament_id: int) -> Dict[int, tuple]:
+    """Первый матч каждого игрока: {user_id: (opponent_id, table_number, scheduled_at, bye)}.
+
+    bye - игрок пропускает первый тур: в первом туре основной сетки у
+    него нет матча с соперником. Так выглядит bye в любом формате: в
+    сетках на выбывание игрок сразу стоит во втором раунде, в круговой
+    не играет в первом туре, в швейцарской у него строка без соперника.
+    """
+    rows = db.execute(
+        select(
+            Match.bracket, Match.round, Match.player1_id, Match.player2_id, Match.winner_id,
+            Match.table_number, Match.scheduled_at,
+        )
+        .where(Match.tournament_id == tournament_id)
+        .order_by(Match.slot)
+    ).all()
+    # Нижняя сетка и финал двойного выбывания - не место входа в турнир
+    first_round = {
+        player_id
+        for bracket, round_, player1_id, player2_id, *_ in rows
+        if round_ == 1 and bracket not in ("losers", "final") and player1_id is not None and player2_id is not None
+        for player_id in (player1_id, player2_id)
+    }
+    first: Dict[int, tuple] = {}
+    for bracket, round_, player1_id, player2_id, winner_id, table_number, scheduled_at in rows:
+        if winner_id is not None:
+            continue
+        for player_id, opponent_id in ((player1_id, player2_id), (player2_id, player1_id)):
+            if player_id is not None and player_id not in first:
+                first[player_id] = (opponent_id, table_number, scheduled_at, player_id not in first_round)
+    # Швейцарский bye - уже сыгранная строка, а соперник следующего тура еще не известен
+    for _, _, player1_id, player2_id, *_ in rows:
+        for player_id in (player1_id, player2_id):
+            if player_id is not None:
+                first.setdefault(player_id, (None, None, None, player_id not in first_round))
+    return first
+
+
+def _render(title: str, first_match: Optional[tuple], names: Dict[int, str]) -> str:
+    text = f"🏆 Турнир «{title}» начался!\n\n"
+    if first_match is None:
+        return text + "Ваш первый матч определится позже."
+    opponent_id, table_number, scheduled_at, bye = first_match
+    if bye:
+        text += "В первом туре у вас нет соперника (bye)."
+        if opponent_id is None:
+            return text + " Он засчитывается как победа, соперник следующего тура определится по итогам первого."
+        text += "\n"
+    if opponent_id is None:
+        text += "Ваш соперник определится по итогам предыдущего матча."
+    else:
+        text += f"Ваш первый соперник: {names.get(opponent_id, 'игрок')}."
+    if table_number:
+        text += f"\nСтол {table_number}"
+        if scheduled_at:
+            text += f", начало в {scheduled_at.strftime('%H:%M')}"
+    return text
@@ -0,0 +1,58 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.database.database import AsyncSessionLocal
+from app.database.profiling import track_queries
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна сессия из пула на обновление.
+
+    Сессия передается обработчикам аргументом db и закрывается после
+    обработки в любом случае, в том числе при исключении, поэтому
+    соединение всегда возвращается в пул.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_factory() as db:
+            data["db"] = db
+            return await handler(event, data)
+
+
+def describe_update(update: Update) -> str:
+    """Тип обновления и команда или префикс callback_data - без текста сообщений"""
+    if update.message and update.message.text and update.message.text.startswith("/"):
+        return f"message {update.message.text.split()[0][:32]}"
+    if update.callback_query and update.callback_query.data:
+        return f"callback {update.callback_query.data.split('_')[0][:32]}"
+    return update.event_type
+
+
+class SqlProfileMiddleware(BaseMiddleware):
+    """Число и время SQL на обновление: предупреждения о N+1 и лимите запросов в лог.
+
+    Регистрируется раньше DbSessionMiddleware, чтобы учитывать все
+    запросы обработки. Лимит - SQL_QUERY_BUDGET, в строгом режиме
+    превышение поднимает QueryBudgetExceeded.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with track_queries() as stats:
+            result = await handler(event, data)
+        stats.report(describe_update(event))
+        return result
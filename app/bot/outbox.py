@@ -0,0 +1,252 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+# Ограничения Telegram: около 30 сообщений в секунду всего и 1 в секунду в один чат
+GLOBAL_RATE = float(os.getenv("BOT_OUTBOX_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("BOT_OUTBOX_CHAT_RATE", "1"))
+MAX_RETRIES = 5
+
+# Меньше - важнее
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFICATION = 1
+PRIORITY_BULK = 2
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - уже доступен)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("kind", "chat_id", "message_id", "text", "kwargs", "futures", "attempts", "before_send")
+
+    def __init__(self, kind: str, chat_id: int, text: str, kwargs: dict, message_id: Optional[int] = None,
+                 before_send: Optional[Callable[[], Awaitable]] = None):
+        self.kind = kind
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.kwargs = kwargs
+        self.futures: List[asyncio.Future] = []
+        self.attempts = 0
+        self.before_send = before_send
+
+
+class Outbox:
+    """Очередь исходящих сообщений бота с ограничением скорости.
+
+    Сообщения отправляются по приоритету, но не чаще global_rate в
+    секунду всего и chat_rate в секунду в один чат; чат, исчерпавший
+    лимит, не задерживает остальные. На 429 (TelegramRetryAfter) отправка
+    приостанавливается на указанное сервером время и сообщение
+    повторяется. Несколько ожидающих правок одного сообщения
+    объединяются в одну - уходит только последний текст.
+
+    send/edit возвращают future с результатом Bot API; ждать его не
+    обязательно. before_send у send вызывается один раз непосредственно
+    перед первым запросом к Telegram; если он падает, сообщение не
+    отправляется, а future получает его исключение.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 max_retries: int = MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._ready: List[tuple] = []    # (priority, seq, job)
+        self._delayed: List[tuple] = []  # (ready_at, priority, seq, job)
+        self._edits: Dict[Tuple[int, int], _Job] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    def send(self, chat_id: int, text: str, priority: int = PRIORITY_NOTIFICATION,
+             before_send: Optional[Callable[[], Awaitable]] = None, **kwargs) -> asyncio.Future:
+        job = _Job("send", chat_id, text, kwargs, before_send=before_send)
+        future = self._attach(job)
+        self._push(priority, next(self._seq), job)
+        return future
+
+    def edit(self, chat_id: int, message_id: int, text: str, priority: int = PRIORITY_NOTIFICATION,
+             **kwargs) -> asyncio.Future:
+        pending = self._edits.get((chat_id, message_id))
+        if pending is not None:
+            pending.text = text
+            pending.kwargs = kwargs
+            self.coalesced += 1
+            return self._attach(pending)
+        job = _Job("edit", chat_id, text, kwargs, message_id)
+        future = self._attach(job)
+        self._edits[(chat_id, message_id)] = job
+        self._push(priority, next(self._seq), job)
+        return future
+
+    def pending(self) -> int:
+        return len(self._ready) + len(self._delayed) + len(self._sending)
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает цикл"""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    def _attach(self, job: _Job) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку отправки, которую никто не ждет, не считаем необработанной
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job.futures.append(future)
+        return future
+
+    def _push(self, priority: int, seq: int, job: _Job):
+        heapq.heappush(self._ready, (priority, seq, job))
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def _sleep(self, seconds: Optional[float]):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Полное ведро ничем не отличается от нового
+                self._chats = {c: b for c, b in self._chats.items() if not b.is_full(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, job))
+
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self._ready:
+                await self._sleep(self._delayed[0][0] - now if self._delayed else None)
+                continue
+
+            priority, seq, job = heapq.heappop(self._ready)
+            chat = self._chat_bucket(job.chat_id, now)
+            chat_wait = chat.wait_time(now)
+            if chat_wait > 0:
+                heapq.heappush(self._delayed, (now + chat_wait, priority, seq, job))
+                continue
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                heapq.heappush(self._ready, (priority, seq, job))
+                await asyncio.sleep(global_wait)
+                continue
+
+            self._global.consume(now)
+            chat.consume(now)
+            if job.kind == "edit":
+                self._edits.pop((job.chat_id, job.message_id), None)
+            task = asyncio.create_task(self._deliver(priority, seq, job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, priority: int, seq: int, job: _Job):
+        try:
+            if job.before_send is not None:
+                before_send, job.before_send = job.before_send, None
+                await before_send()
+            if job.kind == "send":
+                result = await self.bot.send_message(job.chat_id, job.text, **job.kwargs)
+            else:
+                result = await self.bot.edit_message_text(
+                    job.text, chat_id=job.chat_id, message_id=job.message_id, **job.kwargs
+                )
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            self.retries += 1
+            if job.attempts > self.max_retries:
+                self._finish(job, error=e)
+                return
+            logger.warning("Telegram просит подождать %s с, повторяем отправку в чат %s", e.retry_after, job.chat_id)
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self._retry(priority, seq, job)
+            return
+        except TelegramAPIError as e:
+            logger.warning("Не удалось отправить сообщение в чат %s: %s", job.chat_id, e)
+            self._finish(job, error=e)
+            return
+        except Exception as e:
+            # Сетевые ошибки и таймауты тоже должны завершить future, иначе
+            # ожидающие send/edit (рассылка, track_deliveries) зависнут
+            logger.warning("Ошибка отправки в чат %s: %r", job.chat_id, e)
+            self._finish(job, error=e)
+            return
+        self.sent += 1
+        self._finish(job, result=result)
+
+    def _retry(self, priority: int, seq: int, job: _Job):
+        if job.kind == "edit":
+            newer = self._edits.get((job.chat_id, job.message_id))
+            if newer is not None:
+                # Пока ждали, пришла более свежая правка - она заменяет эту
+                newer.futures.extend(job.futures)
+                return
+            self._edits[(job.chat_id, job.message_id)] = job
+        self._push(priority, seq, job)
+
+    @staticmethod
+    def _finish(job: _Job, result=None, error: Optional[Exception] = None):
+        for future in job.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
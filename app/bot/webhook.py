@@ -0,0 +1,120 @@
+import asyncio
+import hmac
+import logging
+import os
+import secrets
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("BOT_WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("BOT_WEBHOOK_QUEUE_SIZE", "1000"))
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений и фиксированное число обработчиков.
+
+    Webhook только кладет обновление в очередь и сразу отвечает
+    Telegram, а обработку выполняют workers задач. Так число
+    одновременно обрабатываемых обновлений (и занятых соединений с БД)
+    ограничено, а при переполнении очереди Telegram получает 503 и
+    повторит доставку позже.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = WEBHOOK_WORKERS,
+                 size: int = WEBHOOK_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self._tasks: List[asyncio.Task] = []
+
+    def offer(self, update: Update) -> bool:
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Дорабатываем уже принятые обновления: Telegram не пришлет их повторно
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Ошибка обработки обновления %s", update.update_id)
+            finally:
+                self.queue.task_done()
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, secret: str, path: str = WEBHOOK_PATH,
+                       workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE) -> web.Application:
+    """aiohttp-приложение, принимающее обновления от Telegram"""
+    updates = UpdateQueue(dp, bot, workers, queue_size)
+
+    async def handle(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except ValueError:
+            return web.Response(status=400)
+        if not updates.offer(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(app: web.Application):
+        await updates.start()
+
+    async def on_cleanup(app: web.Application):
+        await updates.stop()
+
+    app = web.Application()
+    app["updates"] = updates
+    app.router.add_post(path, handle)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, base_url: str, secret: Optional[str] = None,
+                      host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    """Поднимает сервер обновлений и регистрирует webhook в Telegram.
+
+    Если Telegram отклонил webhook, сервер останавливается и исключение
+    пробрасывается, чтобы вызывающий код мог перейти на polling.
+    """
+    secret = secret or secrets.token_urlsafe(32)
+    app = create_webhook_app(dp, bot, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await bot.set_webhook(
+            base_url.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Webhook запущен на %s:%s%s", host, port, WEBHOOK_PATH)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
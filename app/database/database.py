@@ -1,20 +1,118 @@
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database.metrics import track_pool
+from app.database.profiling import instrument
+from app.database.routing import ReplicaPins, RoutingSession
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Реплика только для чтения; без нее все запросы идут в DATABASE_URL
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# Сколько секунд после записи пользователь читает из основной БД
+DB_REPLICA_PIN_SECONDS = float(os.getenv("DB_REPLICA_PIN_SECONDS", "5"))
 
-engine = create_engine(DATABASE_URL)
+def pool_options(url: str, kind: str = "") -> dict:
+    """Параметры пула соединений одного движка из окружения (для SQLite - по умолчанию).
+
+    Лимиты действуют на каждый движок отдельно. В процессе два движка
+    (sync и async, плюс async для реплики), поэтому процесс может открыть
+    до pool_size + max_overflow соединений на каждый. Для async-движков
+    (kind="ASYNC_") размер задается отдельно через DB_ASYNC_POOL_SIZE и
+    DB_ASYNC_MAX_OVERFLOW, по умолчанию - как у синхронного.
+    """
+    if url.startswith("sqlite"):
+        return {}
+    def setting(name: str, default: str) -> str:
+        return os.getenv(f"DB_{kind}{name}") or os.getenv(f"DB_{name}", default)
+    return {
+        "pool_size": int(setting("POOL_SIZE", "5")),
+        "max_overflow": int(setting("MAX_OVERFLOW", "10")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def async_database_url(url: str) -> str:
+    """Тот же DATABASE_URL, но с асинхронным драйвером (asyncpg или aiosqlite)"""
+    scheme, _, rest = url.partition("://")
+    drivers = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+    return f"{drivers.get(scheme.split('+')[0], scheme)}://{rest}"
+
+# Асинхронный движок для бота и async-эндпоинтов API: запросы не блокируют цикл событий
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool_options(DATABASE_URL, "ASYNC_"))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Сессии эндпоинтов только на чтение: SELECT идут в реплику, если она задана
+async_replica_engine = (
+    create_async_engine(async_database_url(DATABASE_REPLICA_URL), **pool_options(DATABASE_REPLICA_URL, "ASYNC_"))
+    if DATABASE_REPLICA_URL else None
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False, sync_session_class=RoutingSession,
+    replica=async_replica_engine.sync_engine if async_replica_engine else None,
+)
+replica_pins = ReplicaPins(DB_REPLICA_PIN_SECONDS)
+
+def process_name() -> str:
+    """Имя процесса для метрик: APP_PROCESS_NAME или запущенная программа (uvicorn, telegram_bot)"""
+    if os.getenv("APP_PROCESS_NAME"):
+        return os.getenv("APP_PROCESS_NAME")
+    path = sys.argv[0] if sys.argv and sys.argv[0] not in ("", "-c") else "python"
+    name = os.path.splitext(os.path.basename(path))[0]
+    # python -m uvicorn: программа - пакет, а не его __main__.py
+    return os.path.basename(os.path.dirname(path)) if name == "__main__" else name
+
+# Модуль импортируют и API, и бот, поэтому метрики пулов подписываются процессом и движком
+PROCESS_NAME = process_name()
+
+pool_metrics = {
+    f"{PROCESS_NAME}/sync": track_pool(engine),
+    f"{PROCESS_NAME}/async": track_pool(async_engine.sync_engine),
+}
+
+# Число и время SQL на HTTP-запрос и обновление бота (см. profiling.track_queries)
+instrument(engine)
+instrument(async_engine.sync_engine)
+
+if async_replica_engine:
+    pool_metrics[f"{PROCESS_NAME}/replica"] = track_pool(async_replica_engine.sync_engine)
+    instrument(async_replica_engine.sync_engine)
+
 # Dependency
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db(request: Request):
+    """Сессия для чтения из реплики.
+
+    Пользователь, недавно писавший в БД (request.state.db_user, см.
+    middleware в main.py), читает из основной, чтобы видеть свои записи.
+    """
+    async with AsyncReadSessionLocal() as db:
+        if replica_pins.pinned(getattr(request.state, "db_user", None)):
+            db.sync_session.info["primary"] = True
+        yield db
+
+def dialect_insert(db, model):
+    """INSERT с поддержкой ON CONFLICT для текущей БД (PostgreSQL или SQLite)"""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
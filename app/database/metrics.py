@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class PoolMetrics:
+    """Счетчики пула соединений одного движка.
+
+    checkouts - сколько раз соединение выдавалось из пула, connects -
+    сколько физических соединений открыто. Ожидание - время вызова
+    pool.connect() до выдачи соединения из пула: очередь за
+    свободным соединением и, если его нет, подключение к БД.
+    """
+
+    def __init__(self, engine: Engine):
+        self.pool = None
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "connect", self._on_connect)
+        # dispose() заменяет пул движка новым - оборачиваем и его
+        event.listen(engine, "engine_disposed", lambda engine: self._wrap(engine.pool))
+        self._wrap(engine.pool)
+
+    def _wrap(self, pool):
+        """Засекает время pool.connect(): через него проходят все выдачи соединений движка"""
+        self.pool = pool
+        connect = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            connection = connect()
+            self.record_wait(time.perf_counter() - started)
+            return connection
+
+        pool.connect = timed_connect
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else None,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "wait_avg_ms": round(self.wait_total / self.waits * 1000, 2) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 2)
+            }
+
+
+_metrics: Dict[Engine, PoolMetrics] = {}
+
+
+def track_pool(engine: Engine) -> PoolMetrics:
+    metrics = _metrics.get(engine)
+    if metrics is None:
+        metrics = _metrics[engine] = PoolMetrics(engine)
+    return metrics
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, func, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, func, Text, Index, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -18,6 +18,11 @@ class User(Base):
     rating = Column(Integer, default=1200)  # Elo рейтинг
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
+    # Поиск по username без учета регистра: func.lower(User.username) == ...
+    __table_args__ = (
+        Index("ix_users_username_lower", func.lower(username)),
+    )
+    
     # Relationships
     locations = relationship("Location", back_populates="author")
     ratings = relationship("Rating", back_populates="user")
@@ -52,7 +57,7 @@ class Photo(Base):
     __tablename__ = "photos"
     
     id = Column(Integer, primary_key=True, index=True)
-    location_id = Column(Integer, ForeignKey("locations.id"))
+    location_id = Column(Integer, ForeignKey("locations.id"), index=True)
     file_path = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, default=datetime.now)
     
@@ -64,7 +69,7 @@ class Rating(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    location_id = Column(Integer, ForeignKey("locations.id"))
+    location_id = Column(Integer, ForeignKey("locations.id"), index=True)
     score = Column(Integer)  # 1-5 stars
     comment = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, default=datetime.now)
@@ -83,8 +88,14 @@ class Tournament(Base):
     description = Column(Text, nullable=True)
     created_by = Column(Integer, ForeignKey("users.id"))
     status = Column(String, default="open")  # open, started, completed
+    format = Column(String, default="single_elimination", nullable=False)  # single_elimination, double_elimination, round_robin, swiss
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
+    # Постраничный список турниров: ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index("ix_tournaments_created_at_id", "created_at", "id"),
+    )
+    
     # Relationships
     spot = relationship("Location", back_populates="tournaments")
     created_by_user = relationship("User", back_populates="tournaments_created")
@@ -100,10 +111,41 @@ class TournamentParticipant(Base):
     result_place = Column(Integer, nullable=True)  # 1, 2, 3, etc.
     registered_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
+    __table_args__ = (
+        UniqueConstraint("tournament_id", "user_id", name="uq_tournament_participants_tournament_user"),
+    )
+    
     # Relationships
     tournament = relationship("Tournament", back_populates="participants")
     user = relationship("User", back_populates="tournament_participants")
 
+# Строки доставки, по которым рассылка еще не закончена
+NOTIFICATION_ACTIVE_WHERE = text("status IN ('pending', 'sending', 'delivering')")
+
+class TournamentNotification(Base):
+    """Состояние доставки личного уведомления участнику турнира"""
+    __tablename__ = "tournament_notifications"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tournament_id = Column(Integer, ForeignKey("tournaments.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # started
+    status = Column(String, default="pending", nullable=False)  # pending, sending, delivering, sent, failed
+    error = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # когда строку взяли в отправку (sending)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("tournament_id", "user_id", "kind", name="uq_tournament_notifications_recipient"),
+        Index("ix_tournament_notifications_status", "tournament_id", "kind", "status"),
+        # Частичный индекс для опроса очереди ботом: в нем только незаконченные строки, поэтому он не
+        # растет вместе с историей рассылок. SQLite использует его, только если в запросе повторено
+        # условие индекса (см. app.bot.fanout._active)
+        Index("ix_tournament_notifications_active", "status", "tournament_id", "kind",
+              postgresql_where=NOTIFICATION_ACTIVE_WHERE, sqlite_where=NOTIFICATION_ACTIVE_WHERE),
+    )
+
 class Match(Base):
     __tablename__ = "matches"
     
@@ -118,6 +160,21 @@ class Match(Base):
     tournament_id = Column(Integer, ForeignKey("tournaments.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
+    # Позиция в турнирной сетке (только для турнирных матчей)
+    bracket = Column(String, nullable=True)  # winners, losers, final, round_robin, swiss
+    round = Column(Integer, nullable=True)
+    slot = Column(Integer, nullable=True)  # номер матча внутри турнира
+    next_slot = Column(Integer, nullable=True)  # куда проходит победитель
+    next_slot_side = Column(Integer, nullable=True)  # 1 - player1, 2 - player2
+    loser_next_slot = Column(Integer, nullable=True)  # куда попадает проигравший (double elimination)
+    loser_next_slot_side = Column(Integer, nullable=True)
+    table_number = Column(Integer, nullable=True)  # стол на споте по расписанию
+    scheduled_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_matches_tournament_slot", "tournament_id", "slot", unique=True),
+    )
+    
     # Relationships
     player1 = relationship("User", foreign_keys=[player1_id], back_populates="matches_as_player1")
     player2 = relationship("User", foreign_keys=[player2_id], back_populates="matches_as_player2")
@@ -137,6 +194,11 @@ class UserRatingHistory(Base):
     change = Column(Integer, nullable=False)  # может быть отрицательным
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
+    # История игрока, новые сверху
+    __table_args__ = (
+        Index("ix_user_rating_history_user_created", "user_id", "created_at"),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="rating_history")
     match = relationship("Match") 
@@ -158,6 +220,15 @@ class Challenge(Base):
     
     # Связь с матчем (если вызов принят)
     match_id = Column(Integer, ForeignKey("matches.id"), nullable=True)
+    # Спот, где играется матч; переносится в matches.spot_id при завершении
+    spot_id = Column(Integer, ForeignKey("locations.id"), nullable=True)
+    
+    # Вызовы игрока: challenger_id = ? OR challenged_id = ?, новые сверху;
+    # входящие ожидающие вызовы - по challenged_id и status
+    __table_args__ = (
+        Index("ix_challenges_challenger_created", "challenger_id", "created_at"),
+        Index("ix_challenges_challenged_status", "challenged_id", "status"),
+    )
     
     # Relationships
     challenger = relationship("User", foreign_keys=[challenger_id])
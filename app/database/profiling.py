@@ -0,0 +1,122 @@
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Столько одинаковых по форме запросов за один HTTP-запрос или обновление - признак N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+# Лимит запросов по умолчанию (0 - без лимита); эндпоинт задает свой через query_budget
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))
+# 1 - превышение лимита считается ошибкой (для тестов), иначе только предупреждение в логе
+SQL_BUDGET_STRICT = os.getenv("SQL_BUDGET_STRICT", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_PARAM = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_IN_LIST = re.compile(rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})*\s*\)")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: без лишних пробелов и с IN (?, ?, ...) в виде IN (?)"""
+    return _IN_LIST.sub("(?)", _SPACES.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """SQL одного HTTP-запроса или обновления бота.
+
+    Значения параметров в текст запроса не попадают, поэтому одинаковая
+    форма, повторенная много раз, - это запрос в цикле (N+1). Вложенная
+    статистика (track_queries внутри track_queries) учитывается и во
+    внешней.
+    """
+
+    def __init__(self, budget: int = SQL_QUERY_BUDGET, parent: Optional["QueryStats"] = None):
+        self.budget = budget
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.duration += seconds
+        self.shapes[statement_shape(statement)] += 1
+        if self.parent is not None:
+            self.parent.record(statement, seconds)
+
+    def repeated(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Формы запросов, выполненные не меньше threshold раз"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget > 0 and self.count > self.budget
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} SQL"'
+
+    def report(self, name: str):
+        """Предупреждения в лог о N+1 и превышении лимита; в строгом режиме лимит - ошибка"""
+        for shape, count in self.repeated():
+            logger.warning("sql event=n_plus_one where=%s repeats=%s statement=%s", name, count, shape[:300])
+        if self.over_budget:
+            logger.warning("sql event=over_budget where=%s queries=%s budget=%s", name, self.count, self.budget)
+            if SQL_BUDGET_STRICT:
+                raise QueryBudgetExceeded(f"SQL query budget exceeded in {name}: {self.count} > {self.budget}")
+
+
+current_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("current_stats", default=None)
+
+
+@contextmanager
+def track_queries(budget: int = SQL_QUERY_BUDGET):
+    """Считает SQL, выполненные внутри блока (в том числе в задачах и потоках, унаследовавших контекст)"""
+    stats = QueryStats(budget, parent=current_stats.get())
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+def query_budget(limit: int):
+    """Зависимость FastAPI: не больше limit SQL на вызов эндпоинта.
+
+    @router.get("/path", dependencies=[Depends(query_budget(2))])
+    """
+    async def set_budget():
+        stats = current_stats.get()
+        if stats is not None:
+            stats.budget = limit
+    return set_budget
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and current_stats.get() is not None:
+        context._sql_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    started = getattr(context, "_sql_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def instrument(engine: Engine):
+    """Подключает подсчет запросов к движку (для асинхронного - к его sync_engine)"""
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Чаще этого устаревшие закрепления не вычищаются
+PINS_PRUNE_SIZE = 10000
+
+
+class RoutingSession(Session):
+    """Сессия, которая читает из реплики и пишет в основную БД.
+
+    В реплику уходят только SELECT без FOR UPDATE вне flush. После первой
+    записи сессия до конца живет на основной БД, чтобы видеть свои же
+    изменения; info["primary"] = True закрепляет ее там с самого начала.
+    """
+
+    def __init__(self, *, replica: Optional[Engine] = None, **kw):
+        super().__init__(**kw)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica is None or self.info.get("primary") or self._flushing:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if getattr(clause, "is_select", False) and getattr(clause, "_for_update_arg", None) is None:
+            return self.replica
+        self.info["primary"] = True
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class ReplicaPins:
+    """Пользователи, недавно писавшие в БД: их чтения идут в основную БД.
+
+    Реплика отстает от основной БД, и без закрепления пользователь мог бы
+    не увидеть только что созданный турнир или спот. Закрепление живет
+    seconds секунд с последней записи и хранится в памяти процесса.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def pin(self, key: int):
+        now = time.monotonic()
+        with self._lock:
+            self._until[key] = now + self.seconds
+            if len(self._until) > PINS_PRUNE_SIZE:
+                self._until = {k: until for k, until in self._until.items() if until > now}
+
+    def pinned(self, key: Optional[int]) -> bool:
+        if key is None:
+            return False
+        until = self._until.get(key)
+        return until is not None and until > time.monotonic()
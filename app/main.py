@@ -1,10 +1,16 @@
-from fastapi import FastAPI
+import os
+from contextlib import suppress
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.endpoints import locations
 from app.api.endpoints import auth
 from app.api.endpoints import tournaments
 from app.api.endpoints import challenges
+from app.api.security import verify_token
+from app.database.database import replica_pins
+from app.database.profiling import QueryBudgetExceeded, track_queries
 
 app = FastAPI()
 
@@ -17,10 +23,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Заголовок Server-Timing с числом и временем SQL (видно во вкладке Network браузера)
+SQL_SERVER_TIMING = os.getenv("SQL_SERVER_TIMING", "1") == "1"
+
+@app.middleware("http")
+async def profile_sql(request: Request, call_next):
+    """Число и время SQL на запрос: Server-Timing, предупреждения о N+1 и лимит запросов"""
+    def name():
+        route = request.scope.get("route")
+        return f"{request.method} {route.path if route else request.url.path}"
+    
+    with track_queries() as stats:
+        try:
+            response = await call_next(request)
+        except Exception:
+            # Исходная ошибка важнее превышения лимита
+            with suppress(QueryBudgetExceeded):
+                stats.report(name())
+            raise
+    try:
+        stats.report(name())
+    except QueryBudgetExceeded as e:
+        response = JSONResponse(status_code=500, content={"detail": str(e)})
+    if SQL_SERVER_TIMING:
+        response.headers["Server-Timing"] = stats.server_timing()
+    return response
+
+# Методы, которые не пишут в БД
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    """Read-your-writes: после успешной записи пользователь какое-то время читает из основной БД"""
+    request.state.db_user = None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            request.state.db_user = verify_token(token)
+        except HTTPException:
+            pass
+    response = await call_next(request)
+    if request.method not in READ_METHODS and response.status_code < 400 and request.state.db_user is not None:
+        replica_pins.pin(request.state.db_user)
+    return response
+
 # Монтируем статические файлы
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 app.include_router(locations.router, prefix="/api", tags=["locations"])
 app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(tournaments.router, prefix="/api", tags=["tournaments"])
-app.include_router(challenges.router, prefix="/api", tags=["challenges"]) 
\ No newline at end of file
+app.include_router(challenges.router, prefix="/api", tags=["challenges"]) 
@@ -0,0 +1,249 @@
+from typing import List, Optional, Sequence, Set, Tuple
+
+SINGLE_ELIMINATION = "single_elimination"
+DOUBLE_ELIMINATION = "double_elimination"
+ROUND_ROBIN = "round_robin"
+SWISS = "swiss"
+FORMATS = (SINGLE_ELIMINATION, DOUBLE_ELIMINATION, ROUND_ROBIN, SWISS)
+
+
+def seed_order(size: int) -> List[int]:
+    """Порядок посева для сетки из size позиций (степень двойки).
+
+    Возвращает индексы посева по позициям сетки так, что 1-й и 2-й
+    номера встречаются только в финале: для 8 - [0, 7, 3, 4, 1, 6, 2, 5].
+    """
+    order = [0]
+    while len(order) < size:
+        total = len(order) * 2
+        order = [seed for top in order for seed in (top, total - 1 - top)]
+    return order
+
+
+class _Node:
+    __slots__ = ("bracket", "round", "sources", "slot", "winner_to", "loser_to")
+
+    def __init__(self, bracket: str, round_: int, sources):
+        self.bracket = bracket
+        self.round = round_
+        self.sources = sources
+        self.slot = None
+        self.winner_to = None
+        self.loser_to = None
+
+
+class _BracketBuilder:
+    """Строит дерево матчей, сразу схлопывая матчи с пустой стороной.
+
+    Источник стороны матча - ("player", user_id), ("winner", node),
+    ("loser", node) или None (пустая позиция). Матч с одним источником
+    не создается: его "победителем" считается этот источник, а
+    "проигравшего" у него нет. Так обрабатываются и первые раунды с
+    byes, и соответствующие матчи нижней сетки.
+    """
+
+    def __init__(self):
+        self.nodes: List[_Node] = []
+
+    def match(self, bracket: str, round_: int, a, b):
+        """Добавляет матч и возвращает (источник победителя, источник проигравшего)"""
+        if a is None or b is None:
+            return (a if a is not None else b), None
+        node = _Node(bracket, round_, (a, b))
+        self.nodes.append(node)
+        return ("winner", node), ("loser", node)
+
+    def rows(self) -> List[dict]:
+        for slot, node in enumerate(self.nodes, start=1):
+            node.slot = slot
+
+        for node in self.nodes:
+            for side, source in enumerate(node.sources, start=1):
+                kind, value = source
+                if kind == "winner":
+                    value.winner_to = (node.slot, side)
+                elif kind == "loser":
+                    value.loser_to = (node.slot, side)
+
+        rows = []
+        for node in self.nodes:
+            players = [value if kind == "player" else None for kind, value in node.sources]
+            rows.append(_row(
+                node.bracket, node.round, node.slot, players[0], players[1],
+                next_to=node.winner_to, loser_to=node.loser_to,
+            ))
+        return rows
+
+
+def _row(bracket: str, round_: int, slot: int, player1_id: Optional[int], player2_id: Optional[int],
+         next_to: Optional[Tuple[int, int]] = None, loser_to: Optional[Tuple[int, int]] = None,
+         winner_id: Optional[int] = None) -> dict:
+    return {
+        "bracket": bracket,
+        "round": round_,
+        "slot": slot,
+        "player1_id": player1_id,
+        "player2_id": player2_id,
+        "winner_id": winner_id,
+        "next_slot": next_to[0] if next_to else None,
+        "next_slot_side": next_to[1] if next_to else None,
+        "loser_next_slot": loser_to[0] if loser_to else None,
+        "loser_next_slot_side": loser_to[1] if loser_to else None,
+    }
+
+
+def _first_round(seeds: Sequence[int]) -> List:
+    size = 1 << (len(seeds) - 1).bit_length()
+    return [("player", seeds[i]) if i < len(seeds) else None for i in seed_order(size)]
+
+
+def _elimination(builder: _BracketBuilder, seeds: Sequence[int]):
+    """Верхняя сетка. Возвращает (чемпион, проигравшие по раундам)"""
+    current = _first_round(seeds)
+    losers_by_round = []
+    round_ = 1
+    while len(current) > 1:
+        winners, losers = [], []
+        for i in range(0, len(current), 2):
+            winner, loser = builder.match("winners", round_, current[i], current[i + 1])
+            winners.append(winner)
+            losers.append(loser)
+        losers_by_round.append(losers)
+        current = winners
+        round_ += 1
+    return current[0], losers_by_round
+
+
+def build_single_elimination(seeds: Sequence[int]) -> List[dict]:
+    builder = _BracketBuilder()
+    _elimination(builder, seeds)
+    return builder.rows()
+
+
+def build_double_elimination(seeds: Sequence[int]) -> List[dict]:
+    builder = _BracketBuilder()
+    champion, losers_by_round = _elimination(builder, seeds)
+
+    # Нижняя сетка: проигравшие первого раунда играют между собой, затем
+    # раунды чередуются: победители нижней сетки против выбывших из
+    # очередного раунда верхней (в обратном порядке, чтобы избежать
+    # повторных встреч) и игры между собой.
+    lower = losers_by_round[0]
+    round_ = 1
+    if len(losers_by_round) > 1:
+        lower = [
+            builder.match("losers", round_, lower[i], lower[i + 1])[0]
+            for i in range(0, len(lower), 2)
+        ]
+        round_ += 1
+        for dropped in losers_by_round[1:]:
+            dropped = dropped[::-1]
+            lower = [
+                builder.match("losers", round_, lower[i], dropped[i])[0]
+                for i in range(len(lower))
+            ]
+            round_ += 1
+            if len(lower) > 1:
+                lower = [
+                    builder.match("losers", round_, lower[i], lower[i + 1])[0]
+                    for i in range(0, len(lower), 2)
+                ]
+                round_ += 1
+
+    builder.match("final", 1, champion, lower[0])
+    return builder.rows()
+
+
+def build_round_robin(seeds: Sequence[int]) -> List[dict]:
+    """Круговая система, расписание туров по методу вращения"""
+    players: List[Optional[int]] = list(seeds)
+    if len(players) % 2:
+        players.append(None)
+    half = len(players) // 2
+
+    rows = []
+    for round_ in range(1, len(players)):
+        for i in range(half):
+            player1, player2 = players[i], players[-1 - i]
+            if player1 is not None and player2 is not None:
+                rows.append(_row(ROUND_ROBIN, round_, len(rows) + 1, player1, player2))
+        players = [players[0], players[-1]] + players[1:-1]
+    return rows
+
+
+def swiss_rounds(participants_count: int) -> int:
+    return max(1, (participants_count - 1).bit_length())
+
+
+def swiss_pairings(standings: Sequence[int], played: Set[Tuple[int, int]],
+                   had_bye: Set[int]) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Пары очередного тура швейцарской системы.
+
+    standings - игроки от лидера к последнему месту, played - уже
+    сыгранные пары (min_id, max_id). Возвращает пары и игрока с bye.
+    """
+    order = list(standings)
+    bye = None
+    if len(order) % 2:
+        for player in reversed(order):
+            if player not in had_bye:
+                bye = player
+                break
+        else:
+            bye = order[-1]
+        order.remove(bye)
+
+    pairs = []
+    while order:
+        player = order.pop(0)
+        opponent_index = 0
+        for i, candidate in enumerate(order):
+            if (min(player, candidate), max(player, candidate)) not in played:
+                opponent_index = i
+                break
+        pairs.append((player, order.pop(opponent_index)))
+    return pairs, bye
+
+
+def swiss_round_rows(round_: int, pairs: List[Tuple[int, int]], bye: Optional[int],
+                     first_slot: int) -> List[dict]:
+    rows = [
+        _row(SWISS, round_, first_slot + i, player1, player2)
+        for i, (player1, player2) in enumerate(pairs)
+    ]
+    if bye is not None:
+        # Bye засчитывается как победа и сразу считается сыгранным
+        rows.append(_row(SWISS, round_, first_slot + len(rows), bye, None, winner_id=bye))
+    return rows
+
+
+def build_swiss(seeds: Sequence[int]) -> List[dict]:
+    """Первый тур: верхняя половина посева против нижней.
+
+    Следующие туры зависят от результатов и генерируются по ходу турнира.
+    """
+    half = len(seeds) // 2
+    upper, lower = list(seeds[:half]), list(seeds[half:2 * half])
+    bye = seeds[-1] if len(seeds) % 2 else None
+    return swiss_round_rows(1, list(zip(upper, lower)), bye, first_slot=1)
+
+
+BUILDERS = {
+    SINGLE_ELIMINATION: build_single_elimination,
+    DOUBLE_ELIMINATION: build_double_elimination,
+    ROUND_ROBIN: build_round_robin,
+    SWISS: build_swiss,
+}
+
+
+def build_bracket(format_: str, seeds: Sequence[int]) -> List[dict]:
+    """Все матчи турнира в виде строк для одной массовой вставки.
+
+    seeds - id игроков в порядке посева (сильнейший первый). Для
+    сеток на выбывание строятся все раунды сразу: матчи следующих
+    раундов создаются без игроков, а next_slot/loser_next_slot
+    указывают, в какую позицию попадет победитель и проигравший.
+    """
+    if len(seeds) < 2:
+        raise ValueError("Need at least 2 participants")
+    return BUILDERS[format_](seeds)
@@ -0,0 +1,341 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, case, func, or_, select, tuple_, update
+from sqlalchemy.orm import Session, aliased
+
+from app.database.models import Challenge, Match, User, UserRatingHistory
+from app.services.matchmaking import rating_index
+from app.services.pagination import decode_cursor, encode_cursor
+
+RESULTS = ("won", "lost")
+STATUSES = ("pending", "accepted", "declined", "completed")
+INBOX_MAX_LIMIT = 100
+
+
+class ChallengeError(Exception):
+    """Переход вызова невозможен. code - машинно-читаемая причина"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+@dataclass
+class ChallengeOutcome:
+    challenge_id: int
+    status: str
+    challenger_id: int
+    challenged_id: int
+    winner_id: Optional[int] = None
+    loser_id: Optional[int] = None
+    match_id: Optional[int] = None
+    # True только у того запроса, который перевел вызов в completed
+    completed_now: bool = False
+
+
+class ChallengeService:
+    """Машина состояний вызова: pending -> accepted/declined, accepted -> completed.
+
+    Каждый переход - один условный UPDATE ... WHERE status = ... RETURNING,
+    поэтому двойное нажатие кнопки или гонка бота и веба не могут
+    применить переход дважды. Дополнительный SELECT выполняется только
+    когда переход не удался, чтобы объяснить причину.
+
+    on_ratings_changed получает {user_id: новый рейтинг} после commit
+    завершенного матча - так бот и API сбрасывают свои кэши пользователей.
+    """
+
+    def __init__(self, db: Session, on_ratings_changed: Optional[Callable[[Dict[int, int]], None]] = None):
+        self.db = db
+        self.on_ratings_changed = on_ratings_changed
+
+    def accept(self, challenge_id: int, user_id: int) -> ChallengeOutcome:
+        return self._respond(challenge_id, user_id, "accepted", accepted_at=datetime.now())
+
+    def decline(self, challenge_id: int, user_id: int) -> ChallengeOutcome:
+        return self._respond(challenge_id, user_id, "declined")
+
+    def _respond(self, challenge_id: int, user_id: int, status: str, **values) -> ChallengeOutcome:
+        row = self.db.execute(
+            update(Challenge)
+            .where(
+                Challenge.id == challenge_id,
+                Challenge.challenged_id == user_id,
+                Challenge.status == "pending",
+            )
+            .values(status=status, **values)
+            .returning(Challenge.id, Challenge.status, Challenge.challenger_id, Challenge.challenged_id)
+            .execution_options(synchronize_session=False)
+        ).first()
+
+        if row is None:
+            self.db.rollback()
+            current = self._load_state(challenge_id)
+            if current.challenged_id != user_id:
+                raise ChallengeError("forbidden")
+            raise ChallengeError("not_pending")
+
+        self.db.commit()
+        return ChallengeOutcome(*row)
+
+    def submit_result(self, challenge_id: int, user_id: int, result: str) -> ChallengeOutcome:
+        """Записывает результат игрока; второй совпадающий ответ завершает вызов.
+
+        Повторная отправка того же результата (в том числе после завершения)
+        ничего не меняет и возвращает текущее состояние.
+        """
+        if result not in RESULTS:
+            raise ChallengeError("invalid_result")
+
+        challenger_result = case(
+            (Challenge.challenger_id == user_id, result), else_=Challenge.challenger_result
+        )
+        challenged_result = case(
+            (Challenge.challenged_id == user_id, result), else_=Challenge.challenged_result
+        )
+        completes = and_(challenger_result.isnot(None), challenged_result.isnot(None))
+        now = datetime.now()
+
+        row = self.db.execute(
+            update(Challenge)
+            .where(
+                Challenge.id == challenge_id,
+                Challenge.status == "accepted",
+                # Ответ соперника, если он уже есть, должен быть противоположным
+                or_(
+                    and_(
+                        Challenge.challenger_id == user_id,
+                        or_(Challenge.challenged_result.is_(None), Challenge.challenged_result != result),
+                    ),
+                    and_(
+                        Challenge.challenged_id == user_id,
+                        or_(Challenge.challenger_result.is_(None), Challenge.challenger_result != result),
+                    ),
+                ),
+            )
+            .values(
+                challenger_result=challenger_result,
+                challenged_result=challenged_result,
+                status=case((completes, "completed"), else_=Challenge.status),
+                completed_at=case((completes, now), else_=Challenge.completed_at),
+            )
+            .returning(
+                Challenge.id,
+                Challenge.status,
+                Challenge.challenger_id,
+                Challenge.challenged_id,
+                Challenge.challenger_result,
+                Challenge.spot_id,
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+
+        if row is None:
+            self.db.rollback()
+            return self._result_not_applied(challenge_id, user_id, result)
+
+        outcome = ChallengeOutcome(row.id, row.status, row.challenger_id, row.challenged_id)
+        if outcome.status != "completed":
+            self.db.commit()
+            return outcome
+
+        # Строка вызова заблокирована нашим UPDATE до commit, поэтому матч
+        # и изменение рейтинга создаются ровно одним запросом.
+        outcome.winner_id, outcome.loser_id = _winner_loser(
+            row.challenger_id, row.challenged_id, row.challenger_result
+        )
+        match = Match(
+            player1_id=row.challenger_id,
+            player2_id=row.challenged_id,
+            winner_id=outcome.winner_id,
+            loser_id=outcome.loser_id,
+            score="21:19",  # TODO: Добавить ввод счета
+            spot_id=row.spot_id,
+            is_rated=True
+        )
+        self.db.add(match)
+        self.db.flush()
+
+        ratings = update_ratings(outcome.winner_id, outcome.loser_id, match.id, self.db)
+        self.db.execute(
+            update(Challenge)
+            .where(Challenge.id == challenge_id)
+            .values(match_id=match.id)
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+        # Состояние в памяти меняется только после commit: при откате
+        # индекс и кэши не должны расходиться с БД
+        for rated_user_id, rating in ratings.items():
+            rating_index.upsert(rated_user_id, rating)
+        if ratings and self.on_ratings_changed:
+            self.on_ratings_changed(ratings)
+
+        outcome.match_id = match.id
+        outcome.completed_now = True
+        return outcome
+
+    def _result_not_applied(self, challenge_id: int, user_id: int, result: str) -> ChallengeOutcome:
+        current = self._load_state(challenge_id)
+        if user_id == current.challenger_id:
+            own_result = current.challenger_result
+        elif user_id == current.challenged_id:
+            own_result = current.challenged_result
+        else:
+            raise ChallengeError("not_participant")
+
+        if current.status == "completed" and own_result == result:
+            winner_id, loser_id = _winner_loser(
+                current.challenger_id, current.challenged_id, current.challenger_result
+            )
+            return ChallengeOutcome(
+                current.id, current.status, current.challenger_id, current.challenged_id,
+                winner_id, loser_id, current.match_id
+            )
+        if current.status == "accepted":
+            raise ChallengeError("conflict")
+        raise ChallengeError("not_accepted")
+
+    def inbox(self, user_id: int, status: Optional[str] = None, cursor: Optional[str] = None,
+              limit: int = 20) -> dict:
+        """Страница вызовов игрока (новые сверху) и счетчики по статусам.
+
+        Имена обоих игроков подгружаются в том же запросе через join,
+        страницы листаются по ключу (created_at, id): cursor - значение
+        next_cursor предыдущей страницы.
+        """
+        limit = max(1, min(limit, INBOX_MAX_LIMIT))
+        challenger = aliased(User)
+        challenged = aliased(User)
+        involves_user = or_(Challenge.challenger_id == user_id, Challenge.challenged_id == user_id)
+
+        query = (
+            select(
+                Challenge.id,
+                Challenge.challenger_id,
+                Challenge.status,
+                Challenge.created_at,
+                challenger.username.label("challenger_username"),
+                challenged.username.label("challenged_username"),
+            )
+            .outerjoin(challenger, challenger.id == Challenge.challenger_id)
+            .outerjoin(challenged, challenged.id == Challenge.challenged_id)
+            .where(involves_user)
+            .order_by(Challenge.created_at.desc(), Challenge.id.desc())
+            .limit(limit + 1)
+        )
+        if status:
+            query = query.where(Challenge.status == status)
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError:
+                raise ChallengeError("invalid_cursor")
+            query = query.where(tuple_(Challenge.created_at, Challenge.id) < position)
+
+        rows = self.db.execute(query).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self.db.execute(
+            select(Challenge.status, func.count())
+            .where(involves_user)
+            .group_by(Challenge.status)
+        ).all())
+
+        return {
+            "items": [
+                {
+                    "id": row.id,
+                    "challenger_username": row.challenger_username or "Unknown",
+                    "challenged_username": row.challenged_username or "Unknown",
+                    "status": row.status,
+                    "created_at": row.created_at,
+                    "is_challenger": row.challenger_id == user_id
+                }
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+            "counts": counts,
+        }
+
+    def _load_state(self, challenge_id: int):
+        current = self.db.execute(
+            select(
+                Challenge.id,
+                Challenge.status,
+                Challenge.challenger_id,
+                Challenge.challenged_id,
+                Challenge.challenger_result,
+                Challenge.challenged_result,
+                Challenge.match_id,
+            ).where(Challenge.id == challenge_id)
+        ).first()
+        if current is None:
+            raise ChallengeError("not_found")
+        return current
+
+
+def _winner_loser(challenger_id: int, challenged_id: int, challenger_result: str):
+    if challenger_result == "won":
+        return challenger_id, challenged_id
+    return challenged_id, challenger_id
+
+
+def expected_score(rating, opponent_rating):
+    """Ожидаемый результат игрока по Elo; работает и с массивами NumPy"""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def update_ratings(winner_id: int, loser_id: int, match_id: int, db: Session) -> Dict[int, int]:
+    """Обновляет рейтинги игроков по системе Elo (без commit); возвращает {user_id: новый рейтинг}"""
+    # Блокируем обе строки, чтобы параллельные матчи тех же игроков
+    # не перезаписали рейтинг друг друга
+    players = {
+        user.id: user
+        for user in db.query(User).filter(User.id.in_([winner_id, loser_id])).with_for_update()
+    }
+    winner = players.get(winner_id)
+    loser = players.get(loser_id)
+
+    if not winner or not loser:
+        return {}
+
+    # Простая реализация Elo (можно улучшить)
+    K = 32  # Коэффициент изменения рейтинга
+    expected_winner = expected_score(winner.rating, loser.rating)
+    expected_loser = 1 - expected_winner
+
+    # Сохраняем старые рейтинги
+    winner_rating_before = winner.rating
+    loser_rating_before = loser.rating
+
+    # Обновляем рейтинги
+    winner.rating += int(K * (1 - expected_winner))
+    loser.rating += int(K * (0 - expected_loser))
+
+    # Создаем записи в истории рейтинга
+    db.add_all([
+        UserRatingHistory(
+            user_id=winner_id,
+            match_id=match_id,
+            rating_before=winner_rating_before,
+            rating_after=winner.rating,
+            change=winner.rating - winner_rating_before
+        ),
+        UserRatingHistory(
+            user_id=loser_id,
+            match_id=match_id,
+            rating_before=loser_rating_before,
+            rating_after=loser.rating,
+            change=loser.rating - loser_rating_before
+        ),
+    ])
+    db.flush()
+    return {winner.id: winner.rating, loser.id: loser.rating}
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+from typing import Dict, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database.models import Match, Tournament, TournamentParticipant, User
+from app.services.tournament_results import match_to_dict
+
+CLIENT_QUEUE_SIZE = 100
+RESYNC_EVENT = "event: resync\ndata: {}\n\n"
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class TournamentBroadcaster:
+    """Рассылка событий турнира подписчикам SSE внутри процесса.
+
+    Событие сериализуется один раз и раскладывается по очередям
+    клиентов. Очереди ограничены: если клиент не успевает читать, его
+    очередь очищается и он получает resync, после которого заново
+    запрашивает снимок турнира, вместо того чтобы копить память.
+    publish можно вызывать и из потоков пула (синхронные эндпоинты).
+    """
+
+    def __init__(self, queue_size: int = CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, tournament_id: int) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(tournament_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, tournament_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(tournament_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[tournament_id]
+
+    def subscribers_count(self, tournament_id: int) -> int:
+        return len(self._subscribers.get(tournament_id, ()))
+
+    def publish(self, tournament_id: int, event: str, data):
+        if tournament_id not in self._subscribers or self._loop is None:
+            return
+        payload = format_event(event, data)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._fan_out(tournament_id, payload)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._fan_out, tournament_id, payload)
+
+    def _fan_out(self, tournament_id: int, payload: str):
+        with self._lock:
+            queues = list(self._subscribers.get(tournament_id, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+
+
+broadcaster = TournamentBroadcaster()
+
+
+def tournament_snapshot(db: Session, tournament_id: int) -> Optional[dict]:
+    """Полное состояние турнира для первой отрисовки: сетка и таблица"""
+    tournament = db.execute(select(Tournament).where(Tournament.id == tournament_id)).scalar_one_or_none()
+    if tournament is None:
+        return None
+
+    matches = db.execute(
+        select(Match).where(Match.tournament_id == tournament_id).order_by(Match.slot)
+    ).scalars().all()
+
+    wins = func.count(Match.id)
+    standings = db.execute(
+        select(
+            TournamentParticipant.user_id, User.username, User.rating,
+            TournamentParticipant.result_place, wins.label("wins"),
+        )
+        .join(User, User.id == TournamentParticipant.user_id)
+        .outerjoin(Match, (Match.tournament_id == tournament_id) & (Match.winner_id == TournamentParticipant.user_id))
+        .where(TournamentParticipant.tournament_id == tournament_id)
+        .group_by(TournamentParticipant.user_id, User.username, User.rating, TournamentParticipant.result_place)
+        .order_by(TournamentParticipant.result_place.is_(None), TournamentParticipant.result_place,
+                  wins.desc(), User.rating.desc())
+    ).all()
+
+    return {
+        "tournament": {
+            "id": tournament.id,
+            "title": tournament.title,
+            "status": tournament.status,
+            "format": tournament.format,
+            "datetime": tournament.datetime
+        },
+        "matches": [match_to_dict(match) for match in matches],
+        "standings": [
+            {
+                "user_id": row.user_id,
+                "username": row.username,
+                "rating": row.rating,
+                "wins": row.wins,
+                "result_place": row.result_place
+            }
+            for row in standings
+        ]
+    }
@@ -0,0 +1,200 @@
+import bisect
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app.database.models import Challenge, Location, Match, User
+
+# Сколько кандидатов по рейтингу рассматривать на одну рекомендацию
+CANDIDATES_PER_SUGGESTION = 10
+# Матчи старше этого срока не учитываются при оценке близости спотов
+RECENT_MATCHES_DAYS = 90
+RECENT_SPOTS_LIMIT = 20
+# Вес разницы рейтинга и расстояния в итоговой оценке (меньше - лучше)
+RATING_SCALE = 100.0
+DISTANCE_SCALE_KM = 10.0
+MAX_DISTANCE_KM = 50.0
+# Рейтинг игрока, у которого он еще не записан (как default в модели User)
+DEFAULT_RATING = 1200
+
+
+class RatingIndex:
+    """Отсортированный список (rating, user_id) для поиска соперников.
+
+    Загружается из БД один раз и затем поддерживается точечными
+    upsert при изменении рейтинга или появлении игрока. Раз в ttl
+    секунд индекс перечитывается целиком, чтобы подхватить изменения,
+    сделанные другими процессами (API и бот работают раздельно).
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._entries: List[Tuple[int, int]] = []
+        self._ratings: Dict[int, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        rows = db.execute(select(User.id, User.rating)).all()
+        ratings = {user_id: rating if rating is not None else DEFAULT_RATING for user_id, rating in rows}
+        entries = sorted((rating, user_id) for user_id, rating in ratings.items())
+        with self._lock:
+            self._ratings = ratings
+            self._entries = entries
+            self._loaded_at = time.monotonic()
+
+    def upsert(self, user_id: int, rating: int):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            old = self._ratings.get(user_id)
+            if old == rating:
+                return
+            if old is not None:
+                pos = bisect.bisect_left(self._entries, (old, user_id))
+                if pos < len(self._entries) and self._entries[pos] == (old, user_id):
+                    del self._entries[pos]
+            bisect.insort(self._entries, (rating, user_id))
+            self._ratings[user_id] = rating
+
+    def rating_of(self, user_id: int) -> Optional[int]:
+        return self._ratings.get(user_id)
+
+    def nearest(self, rating: int, count: int, exclude: Iterable[int] = ()) -> List[Tuple[int, int]]:
+        """До count игроков с рейтингом, ближайшим к rating: [(user_id, rating)]"""
+        exclude = set(exclude)
+        result = []
+        with self._lock:
+            entries = self._entries
+            right = bisect.bisect_left(entries, (rating, -1))
+            left = right - 1
+            while len(result) < count and (left >= 0 or right < len(entries)):
+                take_right = left < 0 or (
+                    right < len(entries) and entries[right][0] - rating <= rating - entries[left][0]
+                )
+                if take_right:
+                    candidate_rating, user_id = entries[right]
+                    right += 1
+                else:
+                    candidate_rating, user_id = entries[left]
+                    left -= 1
+                if user_id not in exclude:
+                    result.append((user_id, candidate_rating))
+        return result
+
+
+rating_index = RatingIndex()
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли (формула гаверсинусов)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def recommend_opponents(db: Session, user_id: int, limit: int = 5) -> List[dict]:
+    """Подбирает соперников с близким рейтингом, играющих неподалеку.
+
+    Кандидаты берутся из rating_index, исключаются игроки, с которыми
+    уже есть ожидающий вызов. Среди кандидатов выше оцениваются те, кто
+    недавно играл на спотах рядом со спотами запрашивающего.
+    """
+    rating_index.ensure_loaded(db)
+    rating = rating_index.rating_of(user_id)
+    if rating is None:
+        row = db.execute(select(User.rating).where(User.id == user_id)).first()
+        if row is None:
+            return []
+        rating = row.rating if row.rating is not None else DEFAULT_RATING
+        rating_index.upsert(user_id, rating)
+
+    pending = db.execute(
+        select(Challenge.challenger_id, Challenge.challenged_id).where(
+            Challenge.status == "pending",
+            or_(Challenge.challenger_id == user_id, Challenge.challenged_id == user_id),
+        )
+    ).all()
+    exclude = {user_id}
+    for challenger_id, challenged_id in pending:
+        exclude.update((challenger_id, challenged_id))
+
+    candidates = dict(rating_index.nearest(rating, limit * CANDIDATES_PER_SUGGESTION, exclude))
+    if not candidates:
+        return []
+
+    own_spots = _recent_spots(db, [user_id]).get(user_id, set())
+    candidate_spots = _recent_spots(db, list(candidates)) if own_spots else {}
+
+    scored = []
+    for candidate_id, candidate_rating in candidates.items():
+        distance = None
+        for lat, lon in candidate_spots.get(candidate_id, ()):
+            for own_lat, own_lon in own_spots:
+                d = distance_km(own_lat, own_lon, lat, lon)
+                if distance is None or d < distance:
+                    distance = d
+        penalty = MAX_DISTANCE_KM if distance is None else min(distance, MAX_DISTANCE_KM)
+        score = abs(candidate_rating - rating) / RATING_SCALE + penalty / DISTANCE_SCALE_KM
+        scored.append((score, candidate_id, distance))
+    scored.sort()
+    scored = scored[:limit]
+
+    users = {
+        user.id: user
+        for user in db.query(User).filter(User.id.in_([candidate_id for _, candidate_id, _ in scored]))
+    }
+    result = []
+    for _, candidate_id, distance in scored:
+        user = users.get(candidate_id)
+        if not user:
+            continue
+        result.append({
+            "id": user.id,
+            "username": user.username,
+            "first_name": user.first_name,
+            "rating": user.rating,
+            "rating_diff": (user.rating if user.rating is not None else DEFAULT_RATING) - rating,
+            "distance_km": round(distance, 1) if distance is not None else None
+        })
+    return result
+
+
+def _recent_spots(db: Session, user_ids: List[int]) -> Dict[int, set]:
+    """Координаты спотов последних RECENT_SPOTS_LIMIT матчей каждого игрока за RECENT_MATCHES_DAYS.
+
+    Лимит считается на игрока (row_number по игроку): один очень активный
+    кандидат не вытесняет споты остальных.
+    """
+    since = datetime.now() - timedelta(days=RECENT_MATCHES_DAYS)
+    sides = union_all(*(
+        select(player.label("player_id"), Match.spot_id, Match.created_at)
+        .where(player.in_(user_ids), Match.created_at >= since, Match.spot_id.isnot(None))
+        for player in (Match.player1_id, Match.player2_id)
+    )).subquery()
+    ranked = select(
+        sides.c.player_id, sides.c.spot_id,
+        func.row_number().over(partition_by=sides.c.player_id, order_by=sides.c.created_at.desc()).label("n"),
+    ).subquery()
+    rows = db.execute(
+        select(ranked.c.player_id, Location.latitude, Location.longitude)
+        .join(Location, Location.id == ranked.c.spot_id)
+        .where(ranked.c.n <= RECENT_SPOTS_LIMIT)
+    ).all()
+
+    spots: Dict[int, set] = {}
+    for player_id, lat, lon in rows:
+        if lat is None or lon is None:
+            continue
+        spots.setdefault(player_id, set()).add((lat, lon))
+    return spots
@@ -0,0 +1,13 @@
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Курсор keyset-пагинации по (created_at, id)"""
+    return f"{created_at.isoformat()},{row_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Обратное к encode_cursor; ValueError, если курсор поврежден"""
+    created_at, row_id = cursor.rsplit(",", 1)
+    return datetime.fromisoformat(created_at), int(row_id)
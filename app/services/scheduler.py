@@ -0,0 +1,187 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from app.database.models import Location, Match, Tournament
+
+MATCH_MINUTES = 20
+REST_MINUTES = 10
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def plan_schedule(matches: List, tables_count: int, start: datetime, now: datetime,
+                  match_minutes: int = MATCH_MINUTES, rest_minutes: int = REST_MINUTES) -> Dict[int, tuple]:
+    """Раскладывает несыгранные матчи по столам и времени.
+
+    Списочное планирование: готовым считается матч, все матчи-источники
+    которого уже размещены. Из готовых, которые могут начаться к моменту
+    освобождения ближайшего стола, выбирается матч с самым длинным
+    путем до финала (критический путь), что сокращает общее время
+    турнира. Игрок не может начать матч раньше, чем через rest_minutes
+    после своего предыдущего. Сыгранные и уже идущие матчи остаются
+    на своих местах, поэтому повторный вызов после каждого результата
+    перепланирует только оставшуюся часть сетки.
+
+    matches - строки с id, slot, next_slot, loser_next_slot, player1_id,
+    player2_id, winner_id, table_number, scheduled_at.
+    Возвращает {match_id: (table_number, scheduled_at)} для несыгранных матчей.
+    """
+    duration = timedelta(minutes=match_minutes)
+    rest = timedelta(minutes=rest_minutes)
+    now = _aware(now)
+    start = max(_aware(start), now)
+    by_slot = {m.slot: m for m in matches}
+
+    feeders: Dict[int, List[int]] = {m.slot: [] for m in matches}
+    for m in matches:
+        for target in (m.next_slot, m.loser_next_slot):
+            if target in feeders:
+                feeders[target].append(m.slot)
+
+    # Длина пути до конца турнира; следующие матчи всегда имеют больший slot
+    bottom_level: Dict[int, timedelta] = {}
+    for m in sorted(matches, key=lambda m: m.slot, reverse=True):
+        tail = max(
+            (bottom_level[t] for t in (m.next_slot, m.loser_next_slot) if t in bottom_level),
+            default=timedelta(0),
+        )
+        bottom_level[m.slot] = duration + tail
+
+    end_of: Dict[int, datetime] = {}
+    player_free: Dict[int, datetime] = {}
+
+    def occupy(begin: datetime, m) -> datetime:
+        finish = begin + duration
+        for player in (m.player1_id, m.player2_id):
+            if player is not None:
+                player_free[player] = max(player_free.get(player, start), finish + rest)
+        return finish
+
+    # Сыгранные и идущие матчи фиксированы
+    pending = []
+    busy_until = {number: start for number in range(1, max(tables_count or 1, 1) + 1)}
+    for m in matches:
+        scheduled_at = _aware(m.scheduled_at)
+        if m.winner_id is not None:
+            # Матч без времени (например, bye в швейцарке) не занимает игроков
+            end_of[m.slot] = min(scheduled_at + duration, now) if scheduled_at else now
+            if scheduled_at:
+                occupy(end_of[m.slot] - duration, m)
+        elif scheduled_at is not None and scheduled_at <= now and m.table_number:
+            end_of[m.slot] = max(scheduled_at + duration, now)
+            occupy(scheduled_at, m)
+            if m.table_number in busy_until:
+                busy_until[m.table_number] = max(busy_until[m.table_number], end_of[m.slot])
+        else:
+            pending.append(m)
+    tables = [(free, number) for number, free in busy_until.items()]
+    heapq.heapify(tables)
+
+    def earliest_start(m) -> datetime:
+        moment = start
+        for feeder in feeders[m.slot]:
+            moment = max(moment, end_of[feeder] + rest)
+        for player in (m.player1_id, m.player2_id):
+            if player is not None:
+                moment = max(moment, player_free.get(player, start))
+        return moment
+
+    waiting_feeders = {m.slot: sum(1 for f in feeders[m.slot] if f not in end_of) for m in pending}
+    # waiting: (earliest_start, slot), available: (-bottom_level, slot)
+    waiting = [(earliest_start(m), m.slot) for m in pending if waiting_feeders[m.slot] == 0]
+    heapq.heapify(waiting)
+    available = []
+    successors: Dict[int, List[int]] = {}
+    for m in pending:
+        for feeder in feeders[m.slot]:
+            successors.setdefault(feeder, []).append(m.slot)
+
+    plan = {}
+    while waiting or available:
+        table_free, table_number = heapq.heappop(tables)
+        if not available and waiting[0][0] > table_free:
+            table_free = waiting[0][0]
+        while waiting and waiting[0][0] <= table_free:
+            _, slot = heapq.heappop(waiting)
+            heapq.heappush(available, (-bottom_level[slot], slot))
+
+        _, slot = heapq.heappop(available)
+        m = by_slot[slot]
+        moment = earliest_start(m)
+        if moment > table_free:
+            # Игрок оказался занят в матче, размещенном позже - ждем
+            heapq.heappush(waiting, (moment, slot))
+            heapq.heappush(tables, (table_free, table_number))
+            continue
+
+        plan[m.id] = (table_number, table_free)
+        end_of[slot] = occupy(table_free, m)
+        heapq.heappush(tables, (end_of[slot], table_number))
+
+        for successor in successors.get(slot, ()):
+            waiting_feeders[successor] -= 1
+            if waiting_feeders[successor] == 0:
+                heapq.heappush(waiting, (earliest_start(by_slot[successor]), successor))
+    return plan
+
+
+def replan_tournament(db: Session, tournament: Tournament) -> Dict[int, tuple]:
+    """Перепланирует несыгранные матчи турнира и сохраняет план (без commit)"""
+    tables_count = db.execute(
+        select(Location.tables_count).where(Location.id == tournament.spot_id)
+    ).scalar()
+    matches = db.execute(
+        select(
+            Match.id, Match.slot, Match.next_slot, Match.loser_next_slot, Match.player1_id,
+            Match.player2_id, Match.winner_id, Match.table_number, Match.scheduled_at,
+        ).where(Match.tournament_id == tournament.id, Match.slot.isnot(None))
+    ).all()
+
+    now = datetime.now(timezone.utc)
+    plan = plan_schedule(matches, tables_count or 1, tournament.datetime or now, now)
+    if plan:
+        table = Match.__table__
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(table_number=bindparam("b_table"), scheduled_at=bindparam("b_at")),
+            [
+                {"b_id": match_id, "b_table": table_number, "b_at": scheduled_at}
+                for match_id, (table_number, scheduled_at) in plan.items()
+            ]
+        )
+    return plan
+
+
+def tournament_schedule(db: Session, tournament_id: int) -> List[dict]:
+    """Несыгранные запланированные матчи, сгруппированные по столам"""
+    rows = db.execute(
+        select(Match.id, Match.table_number, Match.scheduled_at, Match.round, Match.bracket,
+               Match.player1_id, Match.player2_id)
+        .where(
+            Match.tournament_id == tournament_id,
+            Match.winner_id.is_(None),
+            Match.table_number.isnot(None),
+        )
+        .order_by(Match.table_number, Match.scheduled_at)
+    ).all()
+
+    tables: Dict[int, List[dict]] = {}
+    for row in rows:
+        tables.setdefault(row.table_number, []).append({
+            "match_id": row.id,
+            "scheduled_at": row.scheduled_at,
+            "round": row.round,
+            "bracket": row.bracket,
+            "player1_id": row.player1_id,
+            "player2_id": row.player2_id
+        })
+    return [{"table_number": number, "matches": matches} for number, matches in tables.items()]
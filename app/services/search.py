@@ -0,0 +1,236 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.database.models import Location, User
+from app.services.matchmaking import distance_km
+
+# Сколько совпадений по префиксу хранится в кэше на один запрос
+PREFIX_CANDIDATES = 200
+QUERY_CACHE_SIZE = 5000
+
+
+def normalize(text: Optional[str]) -> str:
+    """Ключ поиска: без регистра, @ и различия е/ё"""
+    return (text or "").strip().lstrip("@").casefold().replace("ё", "е")
+
+
+def username_key(username: Optional[str]) -> str:
+    """username в том виде, в котором он сравнивается: без @ и регистра"""
+    return (username or "").strip().lstrip("@").lower()
+
+
+def username_matches(username: str):
+    """Условие поиска пользователя по username без учета регистра (индекс ix_users_username_lower)"""
+    return func.lower(User.username) == username_key(username)
+
+
+def release_username(user_id: int, username: str):
+    """UPDATE, снимающий username с других пользователей.
+
+    username в Telegram уникален, поэтому совпадение у другого игрока -
+    устаревшее значение того, кто с тех пор переименовался.
+    """
+    return (
+        update(User)
+        .where(username_matches(username), User.id != user_id)
+        .values(username=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def search_terms(*texts: Optional[str]) -> List[str]:
+    """Ключи для индекса: каждый текст целиком и каждое его слово"""
+    terms = set()
+    for text in texts:
+        key = normalize(text)
+        if key:
+            terms.add(key)
+            terms.update(key.split())
+    return sorted(terms)
+
+
+class PrefixIndex:
+    """Отсортированный список (ключ, id) для поиска по началу слова.
+
+    Поиск - bisect к первому ключу не меньше префикса и проход вперед,
+    пока ключи начинаются с префикса. Вставка и удаление одного объекта
+    стоят O(n) на сдвиг списка, что для тысяч игроков и спотов дешевле
+    перестройки дерева.
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[str, int]] = []
+        self._terms: Dict[int, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def rebuild(self, items: Iterable[Tuple[int, List[str]]]):
+        terms = {item_id: item_terms for item_id, item_terms in items}
+        self._entries = sorted((term, item_id) for item_id, item_terms in terms.items() for term in item_terms)
+        self._terms = terms
+
+    def upsert(self, item_id: int, terms: List[str]):
+        self.remove(item_id)
+        for term in terms:
+            bisect.insort(self._entries, (term, item_id))
+        self._terms[item_id] = terms
+
+    def remove(self, item_id: int):
+        for term in self._terms.pop(item_id, ()):
+            pos = bisect.bisect_left(self._entries, (term, item_id))
+            if pos < len(self._entries) and self._entries[pos] == (term, item_id):
+                del self._entries[pos]
+
+    def search(self, prefix: str, limit: int) -> List[int]:
+        """До limit id объектов, у которых есть ключ с началом prefix (в порядке ключей)"""
+        result = []
+        seen = set()
+        entries = self._entries
+        pos = bisect.bisect_left(entries, (prefix, -1))
+        while pos < len(entries) and len(result) < limit and entries[pos][0].startswith(prefix):
+            item_id = entries[pos][1]
+            if item_id not in seen:
+                seen.add(item_id)
+                result.append(item_id)
+            pos += 1
+        return result
+
+
+class SearchIndex:
+    """Поиск игроков и спотов по префиксу: inline-режим бота и автодополнение.
+
+    Индексы загружаются из БД один раз и поддерживаются точечными
+    upsert; раз в ttl секунд перечитываются целиком, чтобы подхватить
+    изменения других процессов. Найденные по префиксу id кэшируются
+    (LRU), любое изменение индекса сбрасывает кэш.
+    """
+
+    def __init__(self, ttl: float = 600, cache_size: int = QUERY_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._players = PrefixIndex()
+        self._spots = PrefixIndex()
+        self._player_info: Dict[int, tuple] = {}  # id -> (username, first_name, last_name, rating)
+        self._spot_info: Dict[int, tuple] = {}    # id -> (name, description, latitude, longitude)
+        self._cache: "OrderedDict[Tuple[str, str], List[int]]" = OrderedDict()
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        users = db.execute(select(User.id, User.username, User.first_name, User.last_name, User.rating)).all()
+        spots = db.execute(select(Location.id, Location.name, Location.description, Location.latitude, Location.longitude)).all()
+        with self._lock:
+            self._player_info = {row[0]: tuple(row[1:]) for row in users}
+            self._players.rebuild((row[0], search_terms(*row[1:4])) for row in users)
+            self._spot_info = {row[0]: tuple(row[1:]) for row in spots}
+            self._spots.rebuild((row[0], search_terms(row[1])) for row in spots)
+            self._cache.clear()
+            self._loaded_at = time.monotonic()
+
+    def upsert_player(self, user_id: int, username: Optional[str], first_name: Optional[str],
+                      last_name: Optional[str], rating: Optional[int]):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            if username:
+                # Тот же username у другого игрока устарел (см. release_username)
+                key = username_key(username)
+                for other_id in self._players.search(key, PREFIX_CANDIDATES):
+                    other = self._player_info.get(other_id)
+                    if other_id != user_id and other and username_key(other[0]) == key:
+                        self._player_info[other_id] = (None,) + other[1:]
+                        self._players.upsert(other_id, search_terms(*other[1:3]))
+            self._player_info[user_id] = (username, first_name, last_name, rating)
+            self._players.upsert(user_id, search_terms(username, first_name, last_name))
+            self._cache.clear()
+
+    def upsert_spot(self, spot_id: int, name: str, description: Optional[str], latitude: float, longitude: float):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._spot_info[spot_id] = (name, description, latitude, longitude)
+            self._spots.upsert(spot_id, search_terms(name))
+            self._cache.clear()
+
+    def remove_spot(self, spot_id: int):
+        with self._lock:
+            self._spot_info.pop(spot_id, None)
+            self._spots.remove(spot_id)
+            self._cache.clear()
+
+    def _candidates(self, kind: str, prefix: str) -> List[int]:
+        key = (kind, prefix)
+        ids = self._cache.get(key)
+        if ids is not None:
+            self._cache.move_to_end(key)
+            return ids
+        index = self._players if kind == "players" else self._spots
+        ids = index.search(prefix, PREFIX_CANDIDATES)
+        self._cache[key] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return ids
+
+    def players(self, query: str, limit: int = 10, exclude: Iterable[int] = (),
+                with_username: bool = False) -> List[dict]:
+        """Игроки с username или именем на query, сильнейшие первыми.
+
+        Сортируются первые PREFIX_CANDIDATES совпадений в порядке ключей,
+        для коротких префиксов это не обязательно самые сильные игроки.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        exclude = set(exclude)
+        with self._lock:
+            found = [
+                (user_id, self._player_info[user_id]) for user_id in self._candidates("players", prefix)
+                if user_id not in exclude and user_id in self._player_info
+                and (self._player_info[user_id][0] or not with_username)
+            ]
+        found.sort(key=lambda item: -(item[1][3] or 0))
+        return [
+            {"id": user_id, "username": username, "first_name": first_name, "last_name": last_name, "rating": rating}
+            for user_id, (username, first_name, last_name, rating) in found[:limit]
+        ]
+
+    def spots(self, query: str, limit: int = 10, latitude: Optional[float] = None,
+              longitude: Optional[float] = None) -> List[dict]:
+        """Споты с названием на query; если известно местоположение - ближайшие первыми.
+
+        Пустой query с местоположением возвращает ближайшие споты вообще.
+        """
+        prefix = normalize(query)
+        near = latitude is not None and longitude is not None
+        if not prefix and not near:
+            return []
+        with self._lock:
+            if prefix:
+                found = [(spot_id, self._spot_info[spot_id]) for spot_id in self._candidates("spots", prefix)
+                         if spot_id in self._spot_info]
+            else:
+                found = list(self._spot_info.items())
+        result = []
+        for spot_id, (name, description, spot_latitude, spot_longitude) in found:
+            distance = None
+            if near and spot_latitude is not None and spot_longitude is not None:
+                distance = round(distance_km(latitude, longitude, spot_latitude, spot_longitude), 1)
+            result.append({
+                "id": spot_id, "name": name, "description": description,
+                "latitude": spot_latitude, "longitude": spot_longitude, "distance_km": distance,
+            })
+        if near:
+            result.sort(key=lambda spot: (spot["distance_km"] is None, spot["distance_km"] or 0))
+        return result[:limit]
+
+
+search_index = SearchIndex()
@@ -0,0 +1,286 @@
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database.models import Match, Tournament, TournamentParticipant, User
+from app.services.brackets import ROUND_ROBIN, SINGLE_ELIMINATION, SWISS, build_bracket
+from app.services.challenge_service import expected_score
+from app.services.matchmaking import DEFAULT_RATING
+
+SIMULATION_RUNS = 100_000
+MAX_SIMULATION_RUNS = 200_000
+# Допустимые числа прогонов: запрошенное округляется вверх до ближайшего,
+# чтобы произвольный runs не обходил кэш результатов
+SIMULATION_RUN_STEPS = (10_000, 50_000, 100_000, MAX_SIMULATION_RUNS)
+# Прогоны считаются порциями не больше CHUNK_ELEMENTS элементов (прогоны x матчи),
+# чтобы память не росла вместе с размером сетки
+CHUNK_ELEMENTS = 2_000_000
+CACHE_SIZE = 64
+
+
+def chunk_runs(matches: int) -> int:
+    """Прогонов в порции для сетки из matches матчей"""
+    return max(1, CHUNK_ELEMENTS // max(matches, 1))
+
+
+def snap_runs(runs: int) -> int:
+    """Ближайшее допустимое число прогонов не меньше runs"""
+    return next((step for step in SIMULATION_RUN_STEPS if step >= runs), SIMULATION_RUN_STEPS[-1])
+
+
+class SimulationError(Exception):
+    """Турнир нельзя промоделировать. code - причина"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+def simulate_elimination(matches: Sequence, ratings: Dict[int, int], runs: int = SIMULATION_RUNS,
+                         seed: Optional[int] = None) -> dict:
+    """Монте-Карло для сеток на выбывание по указателям next_slot/loser_next_slot.
+
+    Матчи проходятся один раз в порядке slot (следующие матчи всегда
+    имеют больший slot), а каждая сторона матча - это либо известный
+    игрок, либо массив игроков по всем прогонам сразу. Исход несыгранного
+    матча разыгрывается вектором случайных чисел против ожидания Elo,
+    сыгранные матчи берутся как есть.
+    Возвращает {"stages": [...], "reach": {user_id: [count...]}, "wins": {user_id: count}}.
+    """
+    players = list(ratings)
+    index = {user_id: i for i, user_id in enumerate(players)}
+    rating = np.array([ratings[user_id] for user_id in players], dtype=float)
+    rng = np.random.default_rng(seed)
+    ordered = sorted(matches, key=lambda m: m.slot)
+
+    stages: List[str] = []
+    stage_of = {}
+    for m in ordered:
+        stage = f"{m.bracket}_{m.round}"
+        if stage not in stage_of:
+            stage_of[stage] = len(stages)
+            stages.append(stage)
+
+    reach = np.zeros((len(stages), len(players)), dtype=np.int64)
+    wins = np.zeros(len(players), dtype=np.int64)
+
+    def count(side, size: int) -> np.ndarray:
+        if isinstance(side, np.ndarray):
+            return np.bincount(side, minlength=len(players))
+        counts = np.zeros(len(players), dtype=np.int64)
+        counts[side] = size
+        return counts
+
+    chunk = chunk_runs(len(ordered))
+    for start in range(0, runs, chunk):
+        size = min(chunk, runs - start)
+        sides: Dict[int, list] = {}
+        for m in ordered:
+            fed = sides.pop(m.slot, [None, None])
+            a = index[m.player1_id] if m.player1_id is not None else fed[0]
+            b = index[m.player2_id] if m.player2_id is not None else fed[1]
+            if a is None or b is None:
+                raise SimulationError("broken_bracket")
+
+            stage = stage_of[f"{m.bracket}_{m.round}"]
+            reach[stage] += count(a, size) + count(b, size)
+
+            if m.winner_id is not None:
+                winner = index[m.winner_id]
+                loser = index[m.loser_id] if m.loser_id is not None else (b if winner == a else a)
+            else:
+                first_wins = rng.random(size) < expected_score(rating[a], rating[b])
+                winner = np.where(first_wins, a, b)
+                loser = np.where(first_wins, b, a)
+
+            if m.next_slot is None:
+                wins += count(winner, size)
+            else:
+                sides.setdefault(m.next_slot, [None, None])[m.next_slot_side - 1] = winner
+            if m.loser_next_slot is not None:
+                sides.setdefault(m.loser_next_slot, [None, None])[m.loser_next_slot_side - 1] = loser
+
+    return {
+        "stages": stages,
+        "reach": {user_id: reach[:, i].tolist() for i, user_id in enumerate(players)},
+        "wins": {user_id: int(wins[i]) for i, user_id in enumerate(players)},
+    }
+
+
+def simulate_round_robin(matches: Sequence, ratings: Dict[int, int], runs: int = SIMULATION_RUNS,
+                         seed: Optional[int] = None) -> dict:
+    """Монте-Карло для круговой системы.
+
+    Все несыгранные матчи разыгрываются матрицей (прогоны x матчи), а
+    победы игроков получаются умножением на матрицы принадлежности.
+    Победитель - игрок с наибольшим числом побед, при равенстве выше
+    рейтинг (как в _standings).
+    """
+    players = list(ratings)
+    index = {user_id: i for i, user_id in enumerate(players)}
+    rating = np.array([ratings[user_id] for user_id in players], dtype=float)
+    rng = np.random.default_rng(seed)
+
+    fixed = np.zeros(len(players))
+    pending = []
+    for m in matches:
+        if m.winner_id is not None:
+            fixed[index[m.winner_id]] += 1
+        else:
+            pending.append((index[m.player1_id], index[m.player2_id]))
+
+    first_index = np.array([a for a, _ in pending], dtype=np.int64)
+    second_index = np.array([b for _, b in pending], dtype=np.int64)
+    probability = expected_score(rating[first_index], rating[second_index])
+    # Очки за прогон: победа первого игрока дает +1 ему и -1 второму
+    # относительно исхода, в котором все матчи выиграли вторые игроки
+    swing = np.zeros((len(pending), len(players)), dtype=np.float32)
+    swing[np.arange(len(pending)), first_index] = 1
+    swing[np.arange(len(pending)), second_index] = -1
+    base = fixed + np.bincount(second_index, minlength=len(players))
+
+    # Добавка меньше одной победы упорядочивает равных по рейтингу
+    by_rating = np.argsort(np.argsort(-rating, kind="stable"), kind="stable")
+    tiebreak = (len(players) - by_rating) / (len(players) + 1)
+
+    wins = np.zeros(len(players), dtype=np.int64)
+    total = np.zeros(len(players))
+    chunk = chunk_runs(max(len(pending), len(players)))
+    for start in range(0, runs, chunk):
+        size = min(chunk, runs - start)
+        # float32 считает целые очки точно и вдвое экономит память и время умножения
+        first_wins = (rng.random((size, len(pending)), dtype=np.float32) < probability).astype(np.float32)
+        points = base + first_wins @ swing
+        total += points.sum(axis=0)
+        wins += np.bincount(np.argmax(points + tiebreak, axis=1), minlength=len(players))
+
+    return {
+        "stages": [],
+        "reach": {user_id: [] for user_id in players},
+        "wins": {user_id: int(wins[i]) for i, user_id in enumerate(players)},
+        "expected_wins": {user_id: float(total[i]) / runs for i, user_id in enumerate(players)},
+    }
+
+
+def simulate_bracket(format_: str, matches: Sequence, ratings: Dict[int, int],
+                     runs: int = SIMULATION_RUNS, seed: Optional[int] = None) -> dict:
+    if format_ == SWISS:
+        # Пары следующих туров зависят от результатов - векторно не моделируется
+        raise SimulationError("unsupported_format")
+    if format_ == ROUND_ROBIN:
+        return simulate_round_robin(matches, ratings, runs, seed)
+    return simulate_elimination(matches, ratings, runs, seed)
+
+
+def seeding_check(format_: str, seeds: Sequence[int], ratings: Dict[int, int],
+                  runs: int = SIMULATION_RUNS, seed: Optional[int] = None) -> dict:
+    """Моделирует сетку, которая была бы построена для данного посева"""
+    rows = [SimpleNamespace(loser_id=None, **row) for row in build_bracket(format_, seeds)]
+    return simulate_bracket(format_, rows, {user_id: ratings[user_id] for user_id in seeds}, runs, seed)
+
+
+def _outcome_probabilities(result: dict, ratings: Dict[int, int], runs: int) -> List[dict]:
+    players = []
+    for user_id, rating in ratings.items():
+        item = {
+            "user_id": user_id,
+            "rating": rating,
+            "win_probability": result["wins"][user_id] / runs,
+            "reach": {
+                stage: count / runs
+                for stage, count in zip(result["stages"], result["reach"][user_id])
+            }
+        }
+        if "expected_wins" in result:
+            item["expected_wins"] = round(result["expected_wins"][user_id], 3)
+        players.append(item)
+    players.sort(key=lambda p: (-p["win_probability"], -p["rating"]))
+    return players
+
+
+class _SimulationCache:
+    """LRU результатов по состоянию сетки: новый результат или изменение
+    рейтинга дают другой ключ, поэтому явная инвалидация не нужна"""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+simulation_cache = _SimulationCache()
+
+
+def tournament_outcomes(db: Session, tournament_id: int, runs: int = SIMULATION_RUNS) -> dict:
+    """Вероятности дойти до каждого раунда и выиграть турнир.
+
+    Для начатого турнира моделируется текущая сетка с учетом сыгранных
+    матчей, для еще не начатого - сетка, которую построит посев по
+    рейтингу при старте.
+    """
+    tournament = db.execute(select(Tournament).where(Tournament.id == tournament_id)).scalar_one_or_none()
+    if tournament is None:
+        raise SimulationError("not_found")
+    format_ = tournament.format or SINGLE_ELIMINATION
+    runs = snap_runs(runs)
+
+    participants = db.execute(
+        select(TournamentParticipant.user_id, func.coalesce(User.rating, DEFAULT_RATING))
+        .join(User, User.id == TournamentParticipant.user_id)
+        .where(TournamentParticipant.tournament_id == tournament_id)
+        .order_by(func.coalesce(User.rating, DEFAULT_RATING).desc(), TournamentParticipant.registered_at,
+                  TournamentParticipant.id)
+    ).all()
+    if len(participants) < 2:
+        raise SimulationError("not_enough_participants")
+    # Порядок совпадает с посевом при старте турнира
+    ratings = dict(participants)
+
+    matches = db.execute(
+        select(
+            Match.slot, Match.bracket, Match.round, Match.player1_id, Match.player2_id,
+            Match.winner_id, Match.loser_id, Match.next_slot, Match.next_slot_side,
+            Match.loser_next_slot, Match.loser_next_slot_side,
+        ).where(Match.tournament_id == tournament_id, Match.slot.isnot(None))
+    ).all()
+
+    state = tuple(sorted((m.slot, m.player1_id, m.player2_id, m.winner_id) for m in matches))
+    key = (tournament_id, format_, runs, state, tuple(sorted(ratings.items())))
+    cached = simulation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if matches:
+        result = simulate_bracket(format_, matches, ratings, runs)
+    else:
+        result = seeding_check(format_, list(ratings), ratings, runs)
+
+    outcome = {
+        "tournament_id": tournament_id,
+        "format": format_,
+        "runs": runs,
+        "projected": not matches,
+        "stages": result["stages"],
+        "players": _outcome_probabilities(result, ratings, runs)
+    }
+    simulation_cache.put(key, outcome)
+    return outcome
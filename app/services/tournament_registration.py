@@ -0,0 +1,86 @@
+from typing import Dict, List
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.database.database import dialect_insert
+from app.database.models import TournamentParticipant, User
+from app.services.search import username_key
+
+MAX_BULK_PLAYERS = 500
+
+
+def add_participants(db: Session, tournament_id: int, user_ids: List[int]) -> List[int]:
+    """Регистрирует игроков одним INSERT ... ON CONFLICT DO NOTHING (без commit).
+
+    Возвращает id действительно добавленных игроков: уже
+    зарегистрированные отсекаются уникальным ключом (tournament_id, user_id).
+    """
+    if not user_ids:
+        return []
+    stmt = (
+        dialect_insert(db, TournamentParticipant)
+        .values([{"tournament_id": tournament_id, "user_id": user_id} for user_id in user_ids])
+        .on_conflict_do_nothing(index_elements=["tournament_id", "user_id"])
+        .returning(TournamentParticipant.user_id)
+    )
+    return list(db.execute(stmt).scalars())
+
+
+def bulk_register(db: Session, tournament_id: int, players: List[str]) -> Dict[str, list]:
+    """Регистрирует игроков по @username (без учета регистра) или telegram id.
+
+    Все идентификаторы разрешаются одним запросом к users. Возвращает
+    added (добавленные) и skipped (не найденные, повторенные в списке
+    или уже зарегистрированные) с указанием причины. Делает commit.
+    """
+    keys = [_parse_player(raw) for raw in players]
+    telegram_ids = {value for kind, value in keys if kind == "telegram_id"}
+    usernames = {value for kind, value in keys if kind == "username"}
+
+    conditions = []
+    if telegram_ids:
+        conditions.append(User.telegram_id.in_(telegram_ids))
+    if usernames:
+        conditions.append(func.lower(User.username).in_(usernames))
+    users = {}
+    if conditions:
+        for user in db.execute(select(User.id, User.telegram_id, User.username).where(or_(*conditions))):
+            users[("telegram_id", user.telegram_id)] = user
+            if user.username:
+                users[("username", username_key(user.username))] = user
+
+    resolved = []
+    seen = set()
+    skipped = []
+    for raw, key in zip(players, keys):
+        user = users.get(key)
+        if user is None:
+            skipped.append({"player": raw, "reason": "not_found"})
+        elif user.id in seen:
+            skipped.append({"player": raw, "reason": "duplicate"})
+        else:
+            seen.add(user.id)
+            resolved.append((raw, user))
+
+    added_ids = set(add_participants(db, tournament_id, [user.id for _, user in resolved]))
+    db.commit()
+
+    added = []
+    for raw, user in resolved:
+        if user.id in added_ids:
+            added.append({"player": raw, "user_id": user.id, "username": user.username})
+        else:
+            skipped.append({"player": raw, "reason": "already_registered"})
+    return {"added": added, "skipped": skipped}
+
+
+def _parse_player(raw: str):
+    identifier = raw.strip()
+    if identifier.lstrip("-").isdigit():
+        return "telegram_id", int(identifier)
+    username = username_key(identifier)
+    if not username:
+        # Пустая строка или одиночный "@" не должны совпасть с пользователем без username
+        return "invalid", identifier
+    return "username", username
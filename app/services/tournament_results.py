@@ -0,0 +1,289 @@
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database.models import Match, Tournament, TournamentParticipant, User
+from app.services.brackets import (
+    ROUND_ROBIN, SWISS, swiss_pairings, swiss_round_rows, swiss_rounds,
+)
+from app.services.scheduler import replan_tournament
+
+
+class TournamentError(Exception):
+    """Результат турнирного матча не может быть записан. code - причина"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+def report_match_result(db: Session, tournament_id: int, match_id: int, winner_id: int,
+                        score: Optional[str] = None, reported_by: Optional[int] = None) -> dict:
+    """Записывает победителя турнирного матча и продвигает сетку.
+
+    Победитель (и проигравший в double elimination) переносится в
+    позицию next_slot/loser_next_slot одним UPDATE по индексу
+    (tournament_id, slot) без перебора матчей. Строка турнира
+    блокируется на время транзакции, поэтому одновременные отчеты с
+    разных столов применяются по очереди и проверка "последний ли это
+    матч" всегда видит актуальные данные. reported_by ограничивает
+    запись участниками матча (None - администратор).
+    """
+    tournament = db.execute(
+        select(Tournament).where(Tournament.id == tournament_id).with_for_update()
+    ).scalar_one_or_none()
+    if tournament is None:
+        raise TournamentError("not_found")
+    if tournament.status == "completed":
+        return _result_not_applied(db, tournament_id, match_id, winner_id, reported_by)
+    if tournament.status != "started":
+        raise TournamentError("not_started")
+
+    conditions = [
+        Match.id == match_id,
+        Match.tournament_id == tournament_id,
+        Match.winner_id.is_(None),
+        Match.player1_id.isnot(None),
+        Match.player2_id.isnot(None),
+        or_(Match.player1_id == winner_id, Match.player2_id == winner_id),
+    ]
+    if reported_by is not None:
+        conditions.append(or_(Match.player1_id == reported_by, Match.player2_id == reported_by))
+
+    row = db.execute(
+        update(Match)
+        .where(*conditions)
+        .values(
+            winner_id=winner_id,
+            loser_id=case((Match.player1_id == winner_id, Match.player2_id), else_=Match.player1_id),
+            score=score,
+        )
+        .returning(
+            Match.loser_id, Match.bracket, Match.round, Match.next_slot, Match.next_slot_side,
+            Match.loser_next_slot, Match.loser_next_slot_side,
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    if row is None:
+        db.rollback()
+        return _result_not_applied(db, tournament_id, match_id, winner_id, reported_by)
+
+    advanced = [
+        {"slot": slot, "side": side, "user_id": user_id}
+        for slot, side, user_id in (
+            (row.next_slot, row.next_slot_side, winner_id),
+            (row.loser_next_slot, row.loser_next_slot_side, row.loser_id),
+        )
+        if _place_player(db, tournament_id, slot, side, user_id)
+    ]
+
+    places = None
+    next_round = False
+    if row.bracket == ROUND_ROBIN:
+        if _unfinished_matches(db, tournament_id) == 0:
+            places = _finalize_by_wins(db, tournament)
+    elif row.bracket == SWISS:
+        if _unfinished_matches(db, tournament_id, row.round) == 0:
+            if row.round < swiss_rounds(_participants_count(db, tournament_id)):
+                _pair_next_swiss_round(db, tournament, row.round + 1)
+                next_round = True
+            else:
+                places = _finalize_by_wins(db, tournament)
+    elif row.next_slot is None:
+        # У финала нет следующего матча
+        places = _finalize_elimination(db, tournament)
+
+    completed = places is not None
+    if not completed:
+        replan_tournament(db, tournament)
+    db.commit()
+    return {
+        "match_id": match_id,
+        "winner_id": winner_id,
+        "loser_id": row.loser_id,
+        "score": score,
+        "next_slot": row.next_slot,
+        "advanced": advanced,
+        "next_round_paired": next_round,
+        "tournament_completed": completed,
+        "places": places
+    }
+
+
+def _result_not_applied(db: Session, tournament_id: int, match_id: int, winner_id: int,
+                        reported_by: Optional[int]) -> dict:
+    match = db.execute(
+        select(Match).where(Match.id == match_id, Match.tournament_id == tournament_id)
+    ).scalar_one_or_none()
+    if match is None:
+        raise TournamentError("match_not_found")
+    if reported_by is not None and reported_by not in (match.player1_id, match.player2_id):
+        raise TournamentError("forbidden")
+    if match.winner_id is not None:
+        if match.winner_id != winner_id:
+            raise TournamentError("already_reported")
+        # Повторный отчет с тем же победителем ничего не меняет
+        return {
+            "match_id": match_id,
+            "winner_id": match.winner_id,
+            "loser_id": match.loser_id,
+            "score": match.score,
+            "next_slot": match.next_slot,
+            "advanced": [],
+            "next_round_paired": False,
+            "tournament_completed": False,
+            "places": None
+        }
+    if match.player1_id is None or match.player2_id is None:
+        raise TournamentError("not_ready")
+    raise TournamentError("invalid_winner")
+
+
+def _place_player(db: Session, tournament_id: int, slot: Optional[int], side: Optional[int],
+                  user_id: Optional[int]) -> bool:
+    if slot is None or user_id is None:
+        return False
+    column = "player1_id" if side == 1 else "player2_id"
+    db.execute(
+        update(Match)
+        .where(Match.tournament_id == tournament_id, Match.slot == slot)
+        .values({column: user_id})
+        .execution_options(synchronize_session=False)
+    )
+    return True
+
+
+def _unfinished_matches(db: Session, tournament_id: int, round_: Optional[int] = None) -> int:
+    query = select(func.count()).select_from(Match).where(
+        Match.tournament_id == tournament_id,
+        Match.winner_id.is_(None),
+    )
+    if round_ is not None:
+        query = query.where(Match.round == round_)
+    return db.execute(query).scalar()
+
+
+def _participants_count(db: Session, tournament_id: int) -> int:
+    return db.execute(
+        select(func.count()).select_from(TournamentParticipant)
+        .where(TournamentParticipant.tournament_id == tournament_id)
+    ).scalar()
+
+
+def _standings(db: Session, tournament_id: int) -> List[tuple]:
+    """[(user_id, wins)] от лидера к последнему месту; при равенстве выше рейтинг"""
+    participants = db.execute(
+        select(TournamentParticipant.user_id, User.rating)
+        .join(User, User.id == TournamentParticipant.user_id)
+        .where(TournamentParticipant.tournament_id == tournament_id)
+    ).all()
+    wins: Dict[int, int] = dict(db.execute(
+        select(Match.winner_id, func.count())
+        .where(Match.tournament_id == tournament_id, Match.winner_id.isnot(None))
+        .group_by(Match.winner_id)
+    ).all())
+    ranked = sorted(participants, key=lambda p: (-wins.get(p.user_id, 0), -(p.rating or 0)))
+    return [(p.user_id, wins.get(p.user_id, 0)) for p in ranked]
+
+
+def _pair_next_swiss_round(db: Session, tournament: Tournament, round_: int):
+    tournament_id = tournament.id
+    played_rows = db.execute(
+        select(Match.player1_id, Match.player2_id).where(Match.tournament_id == tournament_id)
+    ).all()
+    played = set()
+    had_bye = set()
+    for player1_id, player2_id in played_rows:
+        if player2_id is None:
+            had_bye.add(player1_id)
+        else:
+            played.add((min(player1_id, player2_id), max(player1_id, player2_id)))
+
+    last_slot = db.execute(
+        select(func.max(Match.slot)).where(Match.tournament_id == tournament_id)
+    ).scalar() or 0
+    standings = [user_id for user_id, _ in _standings(db, tournament_id)]
+    pairs, bye = swiss_pairings(standings, played, had_bye)
+
+    rows = swiss_round_rows(round_, pairs, bye, first_slot=last_slot + 1)
+    for row in rows:
+        row["tournament_id"] = tournament_id
+        row["spot_id"] = tournament.spot_id
+        row["is_rated"] = False
+    db.execute(Match.__table__.insert(), rows)
+
+
+def _finalize_by_wins(db: Session, tournament: Tournament):
+    """Места по числу побед; игроки с равным числом побед делят место"""
+    places = {}
+    previous_wins = None
+    place = 0
+    for position, (user_id, wins) in enumerate(_standings(db, tournament.id), start=1):
+        if wins != previous_wins:
+            place = position
+            previous_wins = wins
+        places[user_id] = place
+    _save_places(db, tournament, places)
+    return places
+
+
+def _finalize_elimination(db: Session, tournament: Tournament):
+    """Места по моменту вылета: чем позже выбыл игрок, тем выше место.
+
+    Выбывает проигравший матча без loser_next_slot; проигравшие одного
+    раунда делят место (например, 3-4 в single elimination).
+    """
+    matches = db.execute(
+        select(Match.bracket, Match.round, Match.winner_id, Match.loser_id,
+               Match.next_slot, Match.loser_next_slot)
+        .where(Match.tournament_id == tournament.id, Match.winner_id.isnot(None))
+    ).all()
+
+    final = next(m for m in matches if m.next_slot is None)
+    groups: Dict[tuple, List[int]] = {}
+    for m in matches:
+        if m.loser_next_slot is None and m.loser_id is not None:
+            key = (1 if m.bracket == "final" else 0, m.round)
+            groups.setdefault(key, []).append(m.loser_id)
+
+    places = {final.winner_id: 1}
+    place = 2
+    for key in sorted(groups, reverse=True):
+        for user_id in groups[key]:
+            places[user_id] = place
+        place += len(groups[key])
+    _save_places(db, tournament, places)
+    return places
+
+
+def _save_places(db: Session, tournament: Tournament, places: Dict[int, int]):
+    table = TournamentParticipant.__table__
+    db.execute(
+        update(table)
+        .where(table.c.tournament_id == bindparam("b_tournament_id"), table.c.user_id == bindparam("b_user_id"))
+        .values(result_place=bindparam("b_place")),
+        [
+            {"b_tournament_id": tournament.id, "b_user_id": user_id, "b_place": place}
+            for user_id, place in places.items()
+        ]
+    )
+    tournament.status = "completed"
+
+
+def match_to_dict(match) -> dict:
+    return {
+        "id": match.id,
+        "bracket": match.bracket,
+        "round": match.round,
+        "slot": match.slot,
+        "player1_id": match.player1_id,
+        "player2_id": match.player2_id,
+        "winner_id": match.winner_id,
+        "score": match.score,
+        "next_slot": match.next_slot,
+        "loser_next_slot": match.loser_next_slot,
+        "table_number": match.table_number,
+        "scheduled_at": match.scheduled_at
+    }
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300.0
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Неизменяемая копия полей пользователя, нужных обработчикам бота и авторизации API"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    is_admin: bool
+    rating: int
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            is_admin=bool(user.is_admin),
+            rating=user.rating,
+        )
+
+
+class UserCache:
+    """LRU telegram_id -> UserSnapshot с ограниченным временем жизни.
+
+    Изменения, сделанные в этом процессе (права администратора,
+    рейтинг), удаляют запись сразу. Изменения из других процессов (бот,
+    API, scripts/setup_admin.py) становятся видны не позже чем через ttl.
+    Каждый процесс держит свой экземпляр: бот - в app.telegram_bot, API -
+    в app.api.security.
+    """
+
+    def __init__(self, size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._items: "OrderedDict[int, Tuple[float, UserSnapshot]]" = OrderedDict()
+        self._telegram_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> Optional[UserSnapshot]:
+        with self._lock:
+            item = self._items.get(telegram_id)
+            if item is None or time.monotonic() - item[0] > self.ttl:
+                if item is not None:
+                    self._drop(telegram_id)
+                self.misses += 1
+                return None
+            self._items.move_to_end(telegram_id)
+            self.hits += 1
+            return item[1]
+
+    def put(self, snapshot: UserSnapshot):
+        with self._lock:
+            self._items[snapshot.telegram_id] = (time.monotonic(), snapshot)
+            self._items.move_to_end(snapshot.telegram_id)
+            self._telegram_ids[snapshot.id] = snapshot.telegram_id
+            while len(self._items) > self.size:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._telegram_ids.pop(evicted.id, None)
+
+    def invalidate(self, telegram_id: int):
+        with self._lock:
+            self._drop(telegram_id)
+
+    def invalidate_user(self, user_id: int):
+        """Удаляет запись по id пользователя (например, после смены рейтинга)"""
+        with self._lock:
+            telegram_id = self._telegram_ids.get(user_id)
+            if telegram_id is not None:
+                self._drop(telegram_id)
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        """То же для нескольких пользователей; подходит как on_ratings_changed ChallengeService"""
+        for user_id in user_ids:
+            self.invalidate_user(user_id)
+
+    def _drop(self, telegram_id: int):
+        item = self._items.pop(telegram_id, None)
+        if item is not None:
+            self._telegram_ids.pop(item[1].id, None)
+
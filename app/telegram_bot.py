@@ -1,4 +1,5 @@
 import asyncio
+import dataclasses
 import logging
 import sys
 import os
@@ -6,25 +7,62 @@ import os
 # Добавляем корневую директорию в путь
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
+from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InlineQueryResultVenue,
+    InputTextMessageContent,
+)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database.database import get_db
-from app.database.models import User, Challenge
+from app.bot.client import create_bot
+from app.bot.fanout import watch_fan_outs
+from app.bot.middlewares import DbSessionMiddleware, SqlProfileMiddleware
+from app.bot.outbox import Outbox
+from app.bot.webhook import run_webhook
+from app.database.database import pool_metrics
+from app.database.models import User, Challenge, Tournament, UserRatingHistory
+from app.services.challenge_service import ChallengeService, ChallengeError
+from app.services.matchmaking import rating_index, recommend_opponents
+from app.services.scheduler import tournament_schedule
+from app.services.search import release_username, search_index, username_matches
+from app.services.tournament_registration import MAX_BULK_PLAYERS, bulk_register
+from app.services.user_cache import UserCache, UserSnapshot
 from datetime import datetime
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 # Инициализация бота
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(token=BOT_TOKEN)
+bot = create_bot()
 dp = Dispatcher()
+dp.update.outer_middleware(SqlProfileMiddleware())
+dp.update.outer_middleware(DbSessionMiddleware())
+# Уведомления, которые бот отправляет сам, идут через очередь с лимитами Telegram
+outbox = Outbox(bot)
+background_tasks = set()
+# Снимки пользователей для обработчиков: не читать users на каждое обновление
+user_cache = UserCache(
+    size=int(os.getenv("BOT_USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("BOT_USER_CACHE_TTL", "300")),
+)
 
-def get_or_create_user(db, tg_user: types.User):
-    user = db.query(User).filter(User.telegram_id == tg_user.id).first()
+async def load_user(db: AsyncSession, telegram_id: int):
+    """Снимок пользователя по telegram_id: из кэша, а при промахе из БД"""
+    snapshot = user_cache.get(telegram_id)
+    if snapshot is None:
+        user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        user_cache.put(snapshot)
+    return snapshot
+
+async def get_or_create_user(db: AsyncSession, tg_user: types.User):
+    user = await load_user(db, tg_user.id)
     if not user:
         user = User(
             telegram_id=tg_user.id,
@@ -35,26 +73,56 @@ def get_or_create_user(db, tg_user: types.User):
             created_at=datetime.now()  # Добавляем текущее время
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        if tg_user.username:
+            await db.flush()
+            await db.execute(release_username(user.id, tg_user.username))
+        await db.commit()
+        await db.refresh(user)
+        rating_index.upsert(user.id, user.rating)
+        search_index.upsert_player(user.id, user.username, user.first_name, user.last_name, user.rating)
+        user = UserSnapshot.from_user(user)
+        user_cache.put(user)
+        return user
+    
+    # Профиль из Telegram записываем, только если он изменился
+    profile = {"username": tg_user.username, "first_name": tg_user.first_name, "last_name": tg_user.last_name}
+    changed = {field: value for field, value in profile.items() if getattr(user, field) != value}
+    if changed:
+        await db.execute(update(User).where(User.id == user.id).values(**changed))
+        if changed.get("username"):
+            await db.execute(release_username(user.id, changed["username"]))
+        await db.commit()
+        user = dataclasses.replace(user, **changed)
+        user_cache.put(user)
+        search_index.upsert_player(user.id, user.username, user.first_name, user.last_name, user.rating)
     return user
 
-def is_admin(db, user_id: int) -> bool:
+async def is_admin(db: AsyncSession, user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором"""
-    user = db.query(User).filter(User.telegram_id == user_id).first()
-    return user and user.is_admin
+    user = await load_user(db, user_id)
+    return bool(user and user.is_admin)
+
+async def find_user_by_username(db: AsyncSession, username: str):
+    """Пользователь по username без учета регистра"""
+    return (await db.execute(select(User).where(username_matches(username)).limit(1))).scalar_one_or_none()
+
+async def find_tournament(db: AsyncSession, tournament_id: int):
+    return (await db.execute(select(Tournament).where(Tournament.id == tournament_id))).scalar_one_or_none()
 
 # Команда /start
 @dp.message(Command("start"))
-async def cmd_start(message: types.Message):
-    db = next(get_db())
-    user = get_or_create_user(db, message.from_user)
+async def cmd_start(message: types.Message, db: AsyncSession):
+    user = await get_or_create_user(db, message.from_user)
     
     help_text = (
         f"Привет, {user.first_name or user.username or 'игрок'}! Я бот для игры в настольный теннис.\n\n"
         "Команды:\n"
         "/вызов @username - вызвать игрока на матч\n"
-        "/challenges - посмотреть ваши вызовы"
+        "/opponents - подобрать соперников\n"
+        "/challenges [pending|accepted|declined|completed] - посмотреть ваши вызовы\n"
+        "/schedule <id турнира> - расписание турнира по столам\n\n"
+        "В любом чате наберите имя бота и начало имени игрока или спота, "
+        "чтобы найти его без точного @username"
     )
     
     # Добавляем админские команды, если пользователь админ
@@ -62,13 +130,16 @@ async def cmd_start(message: types.Message):
         help_text += "\n\nАдминские команды:\n"
         help_text += "/addadmin @username - добавить администратора\n"
         help_text += "/removeadmin @username - убрать администратора\n"
-        help_text += "/tournament - создать турнир (только для админов)"
+        help_text += "/tournament - создать турнир (только для админов)\n"
+        help_text += "/callnext <id турнира> - позвать игроков к столам\n"
+        help_text += "/register <id турнира> @user1 @user2 ... - зарегистрировать игроков\n"
+        help_text += "/dbstats - состояние пулов соединений с БД"
     
     await message.answer(help_text)
 
 # Команда /вызов
 @dp.message(Command("вызов"))
-async def cmd_challenge(message: types.Message):
+async def cmd_challenge(message: types.Message, db: AsyncSession):
     if not message.entities:
         await message.answer("Использование: /вызов @username")
         return
@@ -84,9 +155,8 @@ async def cmd_challenge(message: types.Message):
         await message.answer("Использование: /вызов @username")
         return
     
-    db = next(get_db())
-    challenger = get_or_create_user(db, message.from_user)
-    challenged = db.query(User).filter(User.username == username).first()
+    challenger = await get_or_create_user(db, message.from_user)
+    challenged = await find_user_by_username(db, username)
     
     if not challenged:
         await message.answer(f"Пользователь @{username} не найден в системе.")
@@ -98,10 +168,12 @@ async def cmd_challenge(message: types.Message):
     
     # Проверяем ограничение: 1 вызов в день
     today = datetime.now().date()
-    existing_challenge = db.query(Challenge).filter(
-        Challenge.challenger_id == challenger.id,
-        Challenge.created_at >= today
-    ).first()
+    existing_challenge = (await db.execute(
+        select(Challenge.id).where(
+            Challenge.challenger_id == challenger.id,
+            Challenge.created_at >= today
+        ).limit(1)
+    )).scalar()
     
     if existing_challenge:
         await message.answer("Вы уже создали вызов сегодня. Попробуйте завтра.")
@@ -114,8 +186,7 @@ async def cmd_challenge(message: types.Message):
         status="pending"
     )
     db.add(new_challenge)
-    db.commit()
-    db.refresh(new_challenge)
+    await db.commit()
     
     # Создаем inline кнопки для принятия/отклонения
     keyboard = InlineKeyboardBuilder()
@@ -129,31 +200,100 @@ async def cmd_challenge(message: types.Message):
         f"Примите или отклоните вызов:",
         reply_markup=keyboard.as_markup()
     )
+    
+    # Вызванный игрок получает вызов и в личные сообщения
+    if challenged.telegram_id and challenged.telegram_id != message.chat.id:
+        outbox.send(
+            challenged.telegram_id,
+            f"🎾 @{challenger.username} вызывает вас на матч!",
+            reply_markup=keyboard.as_markup()
+        )
+
+CHALLENGE_ERRORS = {
+    "not_found": "Вызов не найден",
+    "not_pending": "Вызов уже не в ожидании",
+    "not_accepted": "Вызов не принят",
+    "not_participant": "Вы не участвуете в этом вызове",
+    "conflict": "Ошибка: оба игрока не могут иметь одинаковый результат",
+    "invalid_result": "Неизвестный результат",
+}
+
+# Команда подбора соперников
+@dp.message(Command("opponents"))
+async def cmd_opponents(message: types.Message, db: AsyncSession):
+    user = await get_or_create_user(db, message.from_user)
+    
+    suggestions = [s for s in await db.run_sync(recommend_opponents, user.id) if s["username"]]
+    if not suggestions:
+        await message.answer("Пока не удалось подобрать соперников.")
+        return
+    
+    text = "Соперники вашего уровня:\n\n"
+    for s in suggestions:
+        text += f"@{s['username']} - рейтинг {s['rating']} ({s['rating_diff']:+d})"
+        if s["distance_km"] is not None:
+            text += f", играет в {s['distance_km']} км от ваших спотов"
+        text += "\n"
+    text += "\nЧтобы вызвать игрока: /вызов @username"
+    
+    await message.answer(text)
+
+# Inline-режим: "@bot нов" в любом чате ищет игроков и споты
+INLINE_PLAYERS_LIMIT = 10
+INLINE_SPOTS_LIMIT = 10
+
+@dp.inline_query()
+async def inline_search(query: types.InlineQuery, db: AsyncSession):
+    # Индекс в памяти, БД нужна только для его загрузки раз в ttl
+    await db.run_sync(search_index.ensure_loaded)
+    
+    location = query.location
+    results = []
+    for player in search_index.players(query.query, INLINE_PLAYERS_LIMIT, with_username=True):
+        name = " ".join(filter(None, (player["first_name"], player["last_name"])))
+        results.append(InlineQueryResultArticle(
+            id=f"user_{player['id']}",
+            title=f"@{player['username']}",
+            description=f"{name + ', ' if name else ''}рейтинг {player['rating']}",
+            input_message_content=InputTextMessageContent(message_text=f"/вызов @{player['username']}"),
+        ))
+    for spot in search_index.spots(
+        query.query, INLINE_SPOTS_LIMIT,
+        latitude=location.latitude if location else None,
+        longitude=location.longitude if location else None,
+    ):
+        if spot["latitude"] is None or spot["longitude"] is None:
+            continue
+        address = spot["description"] or ""
+        if spot["distance_km"] is not None:
+            address = f"{spot['distance_km']} км" + (f" · {address}" if address else "")
+        results.append(InlineQueryResultVenue(
+            id=f"spot_{spot['id']}",
+            latitude=spot["latitude"],
+            longitude=spot["longitude"],
+            title=spot["name"],
+            address=address[:200] or "Спот для настольного тенниса",
+        ))
+    
+    # Результаты с расстоянием зависят от местоположения пользователя
+    await query.answer(results, cache_time=30, is_personal=location is not None)
 
 # Обработка принятия вызова
 @dp.callback_query(lambda c: c.data.startswith("accept_"))
-async def accept_challenge(callback: types.CallbackQuery):
+async def accept_challenge(callback: types.CallbackQuery, db: AsyncSession):
     challenge_id = int(callback.data.split("_")[1])
-    db = next(get_db())
     
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        await callback.answer("Вызов не найден")
-        return
-    
-    user = db.query(User).filter(User.telegram_id == callback.from_user.id).first()
-    if not user or user.id != challenge.challenged_id:
+    user = await load_user(db, callback.from_user.id)
+    if not user:
         await callback.answer("Вы не можете принять этот вызов")
         return
     
-    if challenge.status != "pending":
-        await callback.answer("Вызов уже не в ожидании")
+    try:
+        await db.run_sync(lambda session: ChallengeService(session).accept(challenge_id, user.id))
+    except ChallengeError as e:
+        await callback.answer(CHALLENGE_ERRORS.get(e.code, "Вы не можете принять этот вызов"))
         return
     
-    challenge.status = "accepted"
-    challenge.accepted_at = datetime.now()
-    db.commit()
-    
     # Создаем кнопки для ввода результатов
     keyboard = InlineKeyboardBuilder()
     keyboard.add(
@@ -169,116 +309,97 @@ async def accept_challenge(callback: types.CallbackQuery):
 
 # Обработка отклонения вызова
 @dp.callback_query(lambda c: c.data.startswith("decline_"))
-async def decline_challenge(callback: types.CallbackQuery):
+async def decline_challenge(callback: types.CallbackQuery, db: AsyncSession):
     challenge_id = int(callback.data.split("_")[1])
-    db = next(get_db())
-    
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        await callback.answer("Вызов не найден")
-        return
     
-    user = db.query(User).filter(User.telegram_id == callback.from_user.id).first()
-    if not user or user.id != challenge.challenged_id:
+    user = await load_user(db, callback.from_user.id)
+    if not user:
         await callback.answer("Вы не можете отклонить этот вызов")
         return
     
-    if challenge.status != "pending":
-        await callback.answer("Вызов уже не в ожидании")
+    try:
+        await db.run_sync(lambda session: ChallengeService(session).decline(challenge_id, user.id))
+    except ChallengeError as e:
+        await callback.answer(CHALLENGE_ERRORS.get(e.code, "Вы не можете отклонить этот вызов"))
         return
     
-    challenge.status = "declined"
-    db.commit()
-    
     await callback.message.edit_text("❌ Вызов отклонен")
 
 # Обработка ввода результатов
 @dp.callback_query(lambda c: c.data.startswith("result_"))
-async def submit_result(callback: types.CallbackQuery):
+async def submit_result(callback: types.CallbackQuery, db: AsyncSession):
     parts = callback.data.split("_")
     challenge_id = int(parts[1])
     result = parts[2]
     
-    db = next(get_db())
-    challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-    if not challenge:
-        await callback.answer("Вызов не найден")
-        return
-    
-    user = db.query(User).filter(User.telegram_id == callback.from_user.id).first()
+    user = await load_user(db, callback.from_user.id)
     if not user:
         await callback.answer("Вы не зарегистрированы")
         return
     
-    # Определяем, кто подает результат
-    is_challenger = challenge.challenger_id == user.id
-    is_challenged = challenge.challenged_id == user.id
-    
-    if not (is_challenger or is_challenged):
-        await callback.answer("Вы не участвуете в этом вызове")
+    try:
+        outcome = await db.run_sync(
+            lambda session: ChallengeService(session, user_cache.invalidate_users).submit_result(
+                challenge_id, user.id, result
+            )
+        )
+    except ChallengeError as e:
+        await callback.answer(CHALLENGE_ERRORS.get(e.code, "Не удалось записать результат"))
         return
     
-    if challenge.status != "accepted":
-        await callback.answer("Вызов не принят")
+    # Сообщение о завершении редактирует только тот, кто завершил матч,
+    # повторные нажатия просто получают подтверждение
+    if not outcome.completed_now:
+        await callback.answer(f"Результат записан: {result}")
         return
     
-    # Сохраняем результат
-    if is_challenger:
-        challenge.challenger_result = result
-    else:
-        challenge.challenged_result = result
+    players = {
+        u.id: u for u in (await db.execute(
+            select(User).where(User.id.in_([outcome.winner_id, outcome.loser_id]))
+        )).scalars()
+    }
+    winner = players.get(outcome.winner_id)
+    loser = players.get(outcome.loser_id)
     
-    # Проверяем, оба ли игрока подали результаты
-    if challenge.challenger_result and challenge.challenged_result:
-        # Верифицируем результаты
-        if challenge.challenger_result == challenge.challenged_result:
-            await callback.answer("Ошибка: оба игрока не могут иметь одинаковый результат")
-            return
-        
-        # Определяем победителя
-        if challenge.challenger_result == "won":
-            winner_id = challenge.challenger_id
-            loser_id = challenge.challenged_id
-        else:
-            winner_id = challenge.challenged_id
-            loser_id = challenge.challenger_id
-        
-        # Обновляем рейтинги (упрощенная версия)
-        winner = db.query(User).filter(User.id == winner_id).first()
-        loser = db.query(User).filter(User.id == loser_id).first()
-        
-        if winner and loser:
-            winner.rating += 10
-            loser.rating = max(0, loser.rating - 10)
-        
-        # Завершаем вызов
-        challenge.status = "completed"
-        challenge.completed_at = datetime.now()
-        db.commit()
-        
-        await callback.message.edit_text(
-            f"🏆 Матч завершен!\n\n"
-            f"Победитель: @{winner.username if winner else 'Unknown'}\n"
-            f"Проигравший: @{loser.username if loser else 'Unknown'}\n\n"
-            f"Рейтинги обновлены!"
-        )
-    else:
-        await callback.answer(f"Результат записан: {result}")
-        db.commit()
+    await callback.message.edit_text(
+        f"🏆 Матч завершен!\n\n"
+        f"Победитель: @{winner.username if winner else 'Unknown'}\n"
+        f"Проигравший: @{loser.username if loser else 'Unknown'}\n\n"
+        f"Рейтинги обновлены!"
+    )
+    
+    # Каждому игроку - изменение его рейтинга
+    changes = (await db.execute(
+        select(UserRatingHistory.user_id, UserRatingHistory.rating_after, UserRatingHistory.change)
+        .where(UserRatingHistory.match_id == outcome.match_id)
+    )).all()
+    for user_id, rating_after, change in changes:
+        player = players.get(user_id)
+        if player and player.telegram_id:
+            outbox.send(player.telegram_id, f"📈 Ваш рейтинг: {rating_after} ({change:+d})")
+
+STATUS_EMOJI = {
+    "pending": "⏳",
+    "accepted": "✅",
+    "declined": "❌",
+    "completed": "🏆"
+}
 
 # Команда для просмотра вызовов
 @dp.message(Command("challenges"))
-async def cmd_challenges(message: types.Message):
-    db = next(get_db())
-    user = db.query(User).filter(User.telegram_id == message.from_user.id).first()
+async def cmd_challenges(message: types.Message, db: AsyncSession):
+    user = await load_user(db, message.from_user.id)
     
     if not user:
         await message.answer("Вы не зарегистрированы в системе.")
         return
     
-    challenges = db.query(Challenge).filter(
-        (Challenge.challenger_id == user.id) | (Challenge.challenged_id == user.id)
-    ).order_by(Challenge.created_at.desc()).limit(5).all()
+    # /challenges pending - показать только вызовы с этим статусом
+    args = message.text.split()[1:]
+    status = args[0] if args and args[0] in STATUS_EMOJI else None
+    
+    inbox = await db.run_sync(lambda session: ChallengeService(session).inbox(user.id, status=status, limit=5))
+    challenges = inbox["items"]
     
     if not challenges:
         await message.answer("У вас нет активных вызовов.")
@@ -286,26 +407,23 @@ async def cmd_challenges(message: types.Message):
     
     text = "Ваши последние вызовы:\n\n"
     for challenge in challenges:
-        challenger = db.query(User).filter(User.id == challenge.challenger_id).first()
-        challenged = db.query(User).filter(User.id == challenge.challenged_id).first()
-        
-        status_emoji = {
-            "pending": "⏳",
-            "accepted": "✅",
-            "declined": "❌",
-            "completed": "🏆"
-        }.get(challenge.status, "❓")
-        
-        text += f"{status_emoji} @{challenger.username} vs @{challenged.username} - {challenge.status}\n"
+        status_emoji = STATUS_EMOJI.get(challenge["status"], "❓")
+        text += (
+            f"{status_emoji} @{challenge['challenger_username']} vs "
+            f"@{challenge['challenged_username']} - {challenge['status']}\n"
+        )
+    
+    text += "\n" + " ".join(
+        f"{STATUS_EMOJI[name]} {count}" for name, count in inbox["counts"].items()
+    )
     
     await message.answer(text)
 
 # Команда для добавления администратора
 @dp.message(Command("addadmin"))
-async def cmd_add_admin(message: types.Message):
+async def cmd_add_admin(message: types.Message, db: AsyncSession):
     # Проверяем права администратора
-    db = next(get_db())
-    if not is_admin(db, message.from_user.id):
+    if not await is_admin(db, message.from_user.id):
         await message.answer("❌ У вас нет прав для выполнения этой команды.")
         return
     
@@ -325,7 +443,7 @@ async def cmd_add_admin(message: types.Message):
         return
     
     # Находим пользователя
-    target_user = db.query(User).filter(User.username == username).first()
+    target_user = await find_user_by_username(db, username)
     if not target_user:
         await message.answer(f"Пользователь @{username} не найден в системе.")
         return
@@ -336,16 +454,16 @@ async def cmd_add_admin(message: types.Message):
     
     # Делаем пользователя администратором
     target_user.is_admin = True
-    db.commit()
+    await db.commit()
+    user_cache.invalidate(target_user.telegram_id)
     
     await message.answer(f"✅ @{username} назначен администратором!")
 
 # Команда для удаления администратора
 @dp.message(Command("removeadmin"))
-async def cmd_remove_admin(message: types.Message):
+async def cmd_remove_admin(message: types.Message, db: AsyncSession):
     # Проверяем права администратора
-    db = next(get_db())
-    if not is_admin(db, message.from_user.id):
+    if not await is_admin(db, message.from_user.id):
         await message.answer("❌ У вас нет прав для выполнения этой команды.")
         return
     
@@ -365,7 +483,7 @@ async def cmd_remove_admin(message: types.Message):
         return
     
     # Находим пользователя
-    target_user = db.query(User).filter(User.username == username).first()
+    target_user = await find_user_by_username(db, username)
     if not target_user:
         await message.answer(f"Пользователь @{username} не найден в системе.")
         return
@@ -376,16 +494,16 @@ async def cmd_remove_admin(message: types.Message):
     
     # Убираем права администратора
     target_user.is_admin = False
-    db.commit()
+    await db.commit()
+    user_cache.invalidate(target_user.telegram_id)
     
     await message.answer(f"✅ @{username} больше не является администратором.")
 
 # Команда для создания турнира (только для админов)
 @dp.message(Command("tournament"))
-async def cmd_create_tournament(message: types.Message):
+async def cmd_create_tournament(message: types.Message, db: AsyncSession):
     # Проверяем права администратора
-    db = next(get_db())
-    if not is_admin(db, message.from_user.id):
+    if not await is_admin(db, message.from_user.id):
         await message.answer("❌ Создавать турниры могут только администраторы.")
         return
     
@@ -397,8 +515,193 @@ async def cmd_create_tournament(message: types.Message):
         "Пока что используйте веб-интерфейс для создания турниров."
     )
 
+# Массовая регистрация игроков на турнир (только для админов)
+@dp.message(Command("register"))
+async def cmd_register(message: types.Message, db: AsyncSession):
+    if not await is_admin(db, message.from_user.id):
+        await message.answer("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = message.text.split()[1:]
+    if len(args) < 2 or not args[0].isdigit():
+        await message.answer("Использование: /register <id турнира> @user1 @user2 ... (или telegram id)")
+        return
+    
+    tournament_id = int(args[0])
+    players = args[1:MAX_BULK_PLAYERS + 1]
+    
+    tournament = await find_tournament(db, tournament_id)
+    if not tournament:
+        await message.answer("Турнир не найден.")
+        return
+    if tournament.status != "open":
+        await message.answer("Регистрация на этот турнир закрыта.")
+        return
+    
+    result = await db.run_sync(bulk_register, tournament_id, players)
+    
+    reasons = {
+        "not_found": "не найден",
+        "duplicate": "повтор в списке",
+        "already_registered": "уже зарегистрирован"
+    }
+    text = f"✅ Зарегистрировано: {len(result['added'])}"
+    if result["skipped"]:
+        text += f"\n⚠️ Пропущено: {len(result['skipped'])}\n"
+        text += "\n".join(f"{s['player']} - {reasons[s['reason']]}" for s in result["skipped"])
+    
+    await message.answer(text)
+
+def parse_tournament_id(message: types.Message):
+    args = message.text.split()[1:]
+    if not args or not args[0].isdigit():
+        return None
+    return int(args[0])
+
+def schedule_with_players(db: Session, tournament_id: int):
+    """Расписание турнира и игроки из него одним запросом: (tables, {user_id: User})"""
+    tables = tournament_schedule(db, tournament_id)
+    player_ids = {
+        player_id
+        for table in tables
+        for match in table["matches"]
+        for player_id in (match["player1_id"], match["player2_id"])
+        if player_id is not None
+    }
+    players = {u.id: u for u in db.query(User).filter(User.id.in_(player_ids))} if player_ids else {}
+    return tables, players
+
+def player_name(players: dict, player_id):
+    player = players.get(player_id)
+    if player is None:
+        return "победитель предыдущего матча" if player_id is None else "?"
+    return f"@{player.username}" if player.username else (player.first_name or "игрок")
+
+# Команда для просмотра расписания турнира по столам
+@dp.message(Command("schedule"))
+async def cmd_schedule(message: types.Message, db: AsyncSession):
+    tournament_id = parse_tournament_id(message)
+    if tournament_id is None:
+        await message.answer("Использование: /schedule <id турнира>")
+        return
+    
+    tables, players = await db.run_sync(schedule_with_players, tournament_id)
+    if not tables:
+        await message.answer("Для этого турнира нет запланированных матчей.")
+        return
+    
+    text = "📋 Расписание по столам:\n"
+    for table in tables:
+        text += f"\nСтол {table['table_number']}:\n"
+        for match in table["matches"][:5]:
+            time = match["scheduled_at"].strftime("%H:%M") if match["scheduled_at"] else "--:--"
+            text += (
+                f"  {time} {player_name(players, match['player1_id'])} vs "
+                f"{player_name(players, match['player2_id'])}\n"
+            )
+    
+    await message.answer(text)
+
+# Команда для вызова игроков к столам (только для админов)
+@dp.message(Command("callnext"))
+async def cmd_call_next(message: types.Message, db: AsyncSession):
+    if not await is_admin(db, message.from_user.id):
+        await message.answer("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    tournament_id = parse_tournament_id(message)
+    if tournament_id is None:
+        await message.answer("Использование: /callnext <id турнира>")
+        return
+    
+    tables, players = await db.run_sync(schedule_with_players, tournament_id)
+    deliveries = []
+    for table in tables:
+        # Первый несыгранный матч стола, если оба игрока уже известны
+        match = table["matches"][0]
+        if match["player1_id"] is None or match["player2_id"] is None:
+            continue
+        for player_id, opponent_id in (
+            (match["player1_id"], match["player2_id"]),
+            (match["player2_id"], match["player1_id"]),
+        ):
+            player = players.get(player_id)
+            if not player or not player.telegram_id:
+                continue
+            deliveries.append(outbox.send(
+                player.telegram_id,
+                f"🏓 Ваш матч за столом {table['table_number']}! "
+                f"Соперник: {player_name(players, opponent_id)}"
+            ))
+    
+    if not deliveries:
+        await message.answer("Уведомлено игроков: 0")
+        return
+    
+    progress = await message.answer(f"Отправляем уведомления: 0 из {len(deliveries)}")
+    task = asyncio.create_task(track_deliveries(progress, deliveries))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def track_deliveries(progress: types.Message, deliveries: list):
+    """Обновляет сообщение о ходе рассылки; частые правки outbox объединяет"""
+    notified = 0
+    for done, delivery in enumerate(asyncio.as_completed(deliveries), start=1):
+        try:
+            await delivery
+            notified += 1
+        except Exception as e:
+            logging.warning(f"Не удалось уведомить игрока: {e!r}")
+        if done < len(deliveries):
+            outbox.edit(progress.chat.id, progress.message_id, f"Отправляем уведомления: {done} из {len(deliveries)}")
+    outbox.edit(progress.chat.id, progress.message_id, f"Уведомлено игроков: {notified}")
+
+# Состояние пулов соединений с БД (только для админов)
+@dp.message(Command("dbstats"))
+async def cmd_db_stats(message: types.Message, db: AsyncSession):
+    if not await is_admin(db, message.from_user.id):
+        await message.answer("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    text = "🗄 Пулы соединений:\n"
+    for name, metrics in pool_metrics.items():
+        stats = metrics.snapshot()
+        text += f"\n{name}: "
+        if stats["pool_size"] is not None:
+            text += f"выдано {stats['checked_out']} из {stats['pool_size']} (+{stats['overflow']} сверх), "
+        text += (
+            f"выдач {stats['checkouts']}, подключений {stats['connects']}, "
+            f"ожидание {stats['wait_avg_ms']} мс в среднем / {stats['wait_max_ms']} мс макс"
+        )
+    text += f"\n\nКэш пользователей: попаданий {user_cache.hits}, промахов {user_cache.misses}"
+    text += (
+        f"\nОчередь отправки: в ожидании {outbox.pending()}, отправлено {outbox.sent}, "
+        f"повторов после 429 {outbox.retries}, объединено правок {outbox.coalesced}"
+    )
+    
+    await message.answer(text)
+
 async def main():
-    await dp.start_polling(bot)
+    # Рассылки о старте турниров, созданные API, идут через общий outbox бота
+    fan_outs = asyncio.create_task(watch_fan_outs(outbox))
+    # Webhook, если задан публичный адрес; иначе (или если Telegram его не принял) - polling
+    webhook_url = os.getenv("BOT_WEBHOOK_URL")
+    try:
+        if webhook_url:
+            try:
+                await run_webhook(dp, bot, webhook_url, secret=os.getenv("BOT_WEBHOOK_SECRET"))
+                return
+            except TelegramAPIError as e:
+                logging.warning(f"Не удалось установить webhook, используем polling: {e}")
+        
+        await bot.delete_webhook()
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        fan_outs.cancel()
+        await asyncio.gather(fan_outs, return_exceptions=True)
+        # Дожидаемся отправки уже поставленных в очередь уведомлений
+        await outbox.stop()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
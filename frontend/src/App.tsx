@@ -2,7 +2,7 @@ import Map from './components/Map';
 import { CssBaseline, ThemeProvider, createTheme } from '@mui/material';
 import TelegramLoginButton from './components/TelegramLoginButton';
 import axios from 'axios';
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
 import Leaderboard from './components/Leaderboard';
 import { AppBar, Toolbar, Button } from '@mui/material';
 import UserProfile from './components/UserProfile';
@@ -23,16 +23,44 @@ const theme = createTheme({
   },
 });
 
+// Токен из /auth/telegram отправляется со всеми запросами к API
+const setAuthToken = (token: string | null) => {
+  if (token) {
+    axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+  } else {
+    delete axios.defaults.headers.common['Authorization'];
+  }
+};
+
+setAuthToken(localStorage.getItem('access_token'));
+
 function App() {
   const [user, setUser] = useState<any>(null);
   const [token, setToken] = useState<string | null>(localStorage.getItem('access_token'));
   const [page, setPage] = useState<'map' | 'leaderboard' | 'profile' | 'tournaments' | 'challenges'>('map');
 
+  // Истекший или неверный токен - возвращаемся к входу через Telegram
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      response => response,
+      error => {
+        if (error.response?.status === 401) {
+          localStorage.removeItem('access_token');
+          setAuthToken(null);
+          setToken(null);
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const handleTelegramAuth = async (tgUser: any) => {
     try {
       console.log('Telegram auth data:', tgUser);
       const response = await axios.post('http://localhost:8000/api/auth/telegram', tgUser);
       localStorage.setItem('access_token', response.data.access_token);
+      setAuthToken(response.data.access_token);
       setToken(response.data.access_token);
       setUser(tgUser);
       console.log('Auth successful:', response.data);
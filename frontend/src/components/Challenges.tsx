@@ -3,7 +3,7 @@ import axios from 'axios';
 import { 
   Paper, Typography, Box, Button, Table, TableBody, TableCell, 
   TableContainer, TableHead, TableRow, Dialog, DialogTitle, 
-  DialogContent, DialogActions, TextField, Chip
+  DialogContent, DialogActions, TextField, Chip, Autocomplete
 } from '@mui/material';
 import { Add as AddIcon } from '@mui/icons-material';
 
@@ -16,33 +16,87 @@ interface Challenge {
   is_challenger: boolean;
 }
 
+interface Spot {
+  id: number;
+  name: string;
+}
+
+interface PlayerSuggestion {
+  id: number;
+  username: string;
+  first_name: string | null;
+  last_name: string | null;
+  rating: number;
+}
+
 const Challenges = () => {
   const [challenges, setChallenges] = useState<Challenge[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [openCreateDialog, setOpenCreateDialog] = useState(false);
-  const [newChallenge, setNewChallenge] = useState({
-    challenged_username: ''
+  const [newChallenge, setNewChallenge] = useState<{ challenged_username: string; spot_id: number | null }>({
+    challenged_username: '',
+    spot_id: null
   });
+  const [suggestions, setSuggestions] = useState<PlayerSuggestion[]>([]);
+  const [spots, setSpots] = useState<Spot[]>([]);
 
   useEffect(() => {
     loadChallenges();
   }, []);
 
-  const loadChallenges = async () => {
+  // Споты для выбора места матча загружаются при первом открытии диалога
+  useEffect(() => {
+    if (!openCreateDialog || spots.length) return;
+    axios.get('http://localhost:8000/api/locations')
+      .then(response => setSpots(response.data))
+      .catch(error => console.error('Error loading spots:', error));
+  }, [openCreateDialog, spots.length]);
+
+  // Подсказки игроков по началу username или имени
+  useEffect(() => {
+    const query = newChallenge.challenged_username.trim();
+    if (!query) {
+      setSuggestions([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get('http://localhost:8000/api/users/autocomplete', {
+          params: { q: query }
+        });
+        setSuggestions(response.data);
+      } catch (error) {
+        console.error('Error loading suggestions:', error);
+      }
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [newChallenge.challenged_username]);
+
+  // Без cursor загружается первая страница, с cursor - следующая добавляется к списку
+  const loadChallenges = async (cursor?: string) => {
     try {
-      const response = await axios.get('http://localhost:8000/api/challenges');
-      setChallenges(response.data);
+      setLoadingMore(Boolean(cursor));
+      const response = await axios.get('http://localhost:8000/api/challenges', {
+        params: cursor ? { cursor } : {}
+      });
+      setChallenges(prev => cursor ? [...prev, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading challenges:', error);
+    } finally {
+      setLoadingMore(false);
     }
   };
 
   const handleCreateChallenge = async () => {
     try {
       await axios.post('http://localhost:8000/api/challenges', {
-        challenged_username: newChallenge.challenged_username
+        challenged_username: newChallenge.challenged_username,
+        spot_id: newChallenge.spot_id
       });
       setOpenCreateDialog(false);
-      setNewChallenge({ challenged_username: '' });
+      setNewChallenge({ challenged_username: '', spot_id: null });
       loadChallenges();
       alert('Вызов создан! Проверьте Telegram для подтверждения.');
     } catch (error: any) {
@@ -121,6 +175,14 @@ const Challenges = () => {
         </Table>
       </TableContainer>
 
+      {nextCursor && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+          <Button onClick={() => loadChallenges(nextCursor)} disabled={loadingMore}>
+            Показать еще
+          </Button>
+        </Box>
+      )}
+
       {/* Диалог создания вызова */}
       <Dialog open={openCreateDialog} onClose={() => setOpenCreateDialog(false)} maxWidth="sm" fullWidth>
         <DialogTitle>Создать вызов</DialogTitle>
@@ -128,13 +190,49 @@ const Challenges = () => {
           <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
             Введите username игрока, которого хотите вызвать (без @):
           </Typography>
-          <TextField
+          <Autocomplete
+            freeSolo
+            fullWidth
+            filterOptions={(options) => options}
+            options={suggestions.map(player => player.username)}
+            renderOption={(props, option) => {
+              const player = suggestions.find(p => p.username === option);
+              const name = player ? [player.first_name, player.last_name].filter(Boolean).join(' ') : '';
+              return (
+                <li {...props} key={option}>
+                  @{option}
+                  {player && (
+                    <Typography variant="body2" color="text.secondary" sx={{ ml: 1 }}>
+                      {name ? `${name}, ` : ''}рейтинг {player.rating}
+                    </Typography>
+                  )}
+                </li>
+              );
+            }}
+            inputValue={newChallenge.challenged_username}
+            onInputChange={(_, value) => setNewChallenge({...newChallenge, challenged_username: value})}
+            renderInput={(params) => (
+              <TextField
+                {...params}
+                label="Username игрока"
+                margin="normal"
+                placeholder="username"
+              />
+            )}
+          />
+          <Autocomplete
             fullWidth
-            label="Username игрока"
-            value={newChallenge.challenged_username}
-            onChange={(e) => setNewChallenge({...newChallenge, challenged_username: e.target.value})}
-            margin="normal"
-            placeholder="username"
+            options={spots}
+            getOptionLabel={(spot) => spot.name}
+            value={spots.find(spot => spot.id === newChallenge.spot_id) || null}
+            onChange={(_, spot) => setNewChallenge({...newChallenge, spot_id: spot ? spot.id : null})}
+            renderInput={(params) => (
+              <TextField
+                {...params}
+                label="Где сыграете (необязательно)"
+                margin="normal"
+              />
+            )}
           />
         </DialogContent>
         <DialogActions>
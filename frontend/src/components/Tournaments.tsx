@@ -26,6 +26,8 @@ interface Location {
 
 const Tournaments = () => {
   const [tournaments, setTournaments] = useState<Tournament[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [locations, setLocations] = useState<Location[]>([]);
   const [openCreateDialog, setOpenCreateDialog] = useState(false);
   const [newTournament, setNewTournament] = useState({
@@ -40,12 +42,19 @@ const Tournaments = () => {
     loadLocations();
   }, []);
 
-  const loadTournaments = async () => {
+  // Без cursor загружается первая страница, с cursor - следующая добавляется к списку
+  const loadTournaments = async (cursor?: string) => {
     try {
-      const response = await axios.get('http://localhost:8000/api/tournaments');
-      setTournaments(response.data);
+      setLoadingMore(Boolean(cursor));
+      const response = await axios.get('http://localhost:8000/api/tournaments', {
+        params: cursor ? { cursor } : {}
+      });
+      setTournaments(prev => cursor ? [...prev, ...response.data.items] : response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading tournaments:', error);
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -164,6 +173,14 @@ const Tournaments = () => {
         </Table>
       </TableContainer>
 
+      {nextCursor && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+          <Button onClick={() => loadTournaments(nextCursor)} disabled={loadingMore}>
+            Показать еще
+          </Button>
+        </Box>
+      )}
+
       {/* Диалог создания турнира */}
       <Dialog open={openCreateDialog} onClose={() => setOpenCreateDialog(false)} maxWidth="sm" fullWidth>
         <DialogTitle>Создать турнир</DialogTitle>
@@ -21,9 +21,8 @@ const UserProfile = () => {
     // Получаем данные пользователя из токена или localStorage
     const token = localStorage.getItem('access_token');
     if (token) {
-      // В реальном приложении здесь нужно декодировать JWT и получить user_id
-      // Пока используем фиксированный ID для демонстрации
-      const userId = 1; // Замените на реальный ID пользователя
+      // id пользователя - поле sub токена (подпись проверяет сервер)
+      const userId = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/'))).sub;
       axios.get(`http://localhost:8000/api/user/${userId}/history`).then(res => setHistory(res.data));
     }
   }, []);
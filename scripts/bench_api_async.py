@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Throughput of sync vs async API endpoints under many concurrent clients.
+Usage: python scripts/bench_api_async.py [clients] [requests] [delay_seconds]
+
+Starts uvicorn in a child process with two endpoints doing the same work
+as /api/leaderboard plus one query that takes delay seconds on the
+database side (network and server latency): a `def` endpoint with the
+synchronous Session, which FastAPI runs in its thread pool, and an
+`async def` endpoint with AsyncSession. Both get a connection pool of
+`clients` connections, so the only difference is threads vs the event
+loop. Then `clients` concurrent HTTP clients send `requests` requests to
+each endpoint and the script prints requests per second and p50/p99
+latency. Run it against PostgreSQL: aiosqlite executes every connection
+in its own thread, so on SQLite the async endpoint is threaded as well.
+"""
+
+import asyncio
+import multiprocessing
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database.database import DATABASE_URL, async_database_url
+from app.database.models import User
+
+PORT = 8094
+LEADERBOARD_SIZE = 50
+
+
+def slow_query(delay: float):
+    """Запрос, который выполняется delay секунд на стороне БД"""
+    if DATABASE_URL.startswith("sqlite"):
+        return select(func.sleep(delay))
+    return select(func.pg_sleep(delay))
+
+
+def register_sqlite_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep", 1, time.sleep)
+
+
+def create_app(pool_size: int, delay: float) -> FastAPI:
+    pool = {"pool_size": pool_size, "max_overflow": 0}
+    engine = create_engine(DATABASE_URL, **pool)
+    if DATABASE_URL.startswith("sqlite"):
+        # aiosqlite по умолчанию работает без пула и открывает файл на каждый запрос
+        pool["poolclass"] = AsyncAdaptedQueuePool
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool)
+    if DATABASE_URL.startswith("sqlite"):
+        event.listen(engine, "connect", register_sqlite_sleep)
+        event.listen(async_engine.sync_engine, "connect", register_sqlite_sleep)
+    session_factory = sessionmaker(bind=engine)
+    async_session_factory = async_sessionmaker(async_engine)
+
+    def get_db():
+        with session_factory() as db:
+            yield db
+
+    async def get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    leaderboard = select(User.id, User.username, User.rating).order_by(User.rating.desc()).limit(LEADERBOARD_SIZE)
+    app = FastAPI()
+
+    @app.get("/sync")
+    def sync_endpoint(db: Session = Depends(get_db)):
+        rows = db.execute(leaderboard).all()
+        db.execute(slow_query(delay))
+        return [{"id": row.id, "username": row.username, "rating": row.rating} for row in rows]
+
+    @app.get("/async")
+    async def async_endpoint(db: AsyncSession = Depends(get_async_db)):
+        rows = (await db.execute(leaderboard)).all()
+        await db.execute(slow_query(delay))
+        return [{"id": row.id, "username": row.username, "rating": row.rating} for row in rows]
+
+    return app
+
+
+def serve(pool_size: int, delay: float):
+    uvicorn.run(create_app(pool_size, delay), host="127.0.0.1", port=PORT, log_level="warning")
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def wait_ready(client: aiohttp.ClientSession):
+    for _ in range(100):
+        try:
+            async with client.get("/docs"):
+                return
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn не запустился")
+
+
+async def run(client: aiohttp.ClientSession, path: str, clients: int, requests: int):
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                async with client.get(path, raise_for_status=True) as response:
+                    await response.read()
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    print(f"{path:>7}: {len(latencies) / elapsed:7.0f} запросов в секунду, "
+          f"p50 {percentile(latencies, 0.5):6.0f} мс, p99 {percentile(latencies, 0.99):6.0f} мс, ошибок {errors}")
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    server = multiprocessing.Process(target=serve, args=(clients, delay), daemon=True)
+    server.start()
+    connector = aiohttp.TCPConnector(limit=clients)
+    timeout = aiohttp.ClientTimeout(total=120)
+    try:
+        async with aiohttp.ClientSession(f"http://127.0.0.1:{PORT}", connector=connector, timeout=timeout) as client:
+            await wait_ready(client)
+            print(f"{clients} клиентов, {requests} запросов, задержка БД {delay * 1000:.0f} мс")
+            # Прогрев: соединения с сервером и с БД
+            await run(client, "/sync", clients, clients)
+            await run(client, "/async", clients, clients)
+            print()
+            await run(client, "/sync", clients, requests)
+            await run(client, "/async", clients, requests)
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
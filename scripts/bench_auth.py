@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of API authentication.
+Usage: python scripts/bench_auth.py [requests]
+
+Issues a token for an existing user the same way /auth/telegram does and
+resolves it with get_current_user N times: with the token and user
+caches cleared before every request (signature check and user query each
+time) and with warm caches. Prints microseconds per request and the SQL
+statements per request for both.
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event
+
+from app.api import security
+from app.api.security import TokenCache, create_access_token, get_current_user
+from app.services.user_cache import UserCache
+from app.database.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.database.models import User
+
+queries = 0
+
+
+def count_query(*args):
+    global queries
+    queries += 1
+
+
+async def run(name: str, credentials, db, count: int, cold: bool):
+    global queries
+    queries = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        if cold:
+            security.token_cache = TokenCache()
+            security.user_snapshots = UserCache(ttl=security.USER_SNAPSHOT_TTL)
+        await get_current_user(credentials, db)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>12}: {elapsed / count * 1e6:.1f} мкс на запрос, SQL на запрос {queries / count:.2f}")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    db = SessionLocal()
+    user = db.query(User).filter(User.telegram_id.isnot(None)).first()
+    db.close()
+    if not user:
+        print("В базе нет пользователей с telegram_id")
+        return
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token(user))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    print(f"{count} запросов от @{user.username}")
+    async with AsyncSessionLocal() as db:
+        await run("без кэша", credentials, db, count, cold=True)
+        await run("с кэшем", credentials, db, count, cold=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark of bot handler concurrency with a deliberately slow database.
+Usage: python scripts/bench_bot_db.py [updates] [delay_seconds]
+
+Runs the same handler-like sequence (user lookup, admin check, challenge
+inbox and one slow query) for N concurrent updates twice: with the old
+synchronous session inside async handlers and with AsyncSession. Prints
+total time and the worst event loop stall measured by a heartbeat task.
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, select
+
+from app.database.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from app.database.models import User
+from app.services.challenge_service import ChallengeService
+
+
+def slow_query(delay: float):
+    """Запрос, который выполняется delay секунд на стороне БД"""
+    if engine.dialect.name == "sqlite":
+        return select(func.sleep(delay))
+    return select(func.pg_sleep(delay))
+
+
+def register_sqlite_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep", 1, time.sleep)
+
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", register_sqlite_sleep)
+    event.listen(async_engine.sync_engine, "connect", register_sqlite_sleep)
+
+
+async def heartbeat(stop: asyncio.Event, stalls: list):
+    """Измеряет, насколько цикл событий опаздывает с пробуждением"""
+    interval = 0.01
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def sync_handler(telegram_id: int, delay: float):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.telegram_id == telegram_id).first()
+        db.query(User.is_admin).filter(User.telegram_id == telegram_id).scalar()
+        if user:
+            ChallengeService(db).inbox(user.id, limit=5)
+        db.execute(slow_query(delay))
+    finally:
+        db.close()
+
+
+async def async_handler(telegram_id: int, delay: float):
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        await db.execute(select(User.is_admin).where(User.telegram_id == telegram_id))
+        if user:
+            await db.run_sync(lambda session: ChallengeService(session).inbox(user.id, limit=5))
+        await db.execute(slow_query(delay))
+
+
+async def run(handler, telegram_ids, delay: float):
+    stop = asyncio.Event()
+    stalls = []
+    beat = asyncio.create_task(heartbeat(stop, stalls))
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(telegram_id, delay) for telegram_id in telegram_ids))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    return elapsed, max(stalls, default=0.0)
+
+
+async def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    db = SessionLocal()
+    telegram_ids = [t for (t,) in db.query(User.telegram_id).limit(updates)] or [0]
+    db.close()
+    telegram_ids = (telegram_ids * updates)[:updates]
+
+    print(f"{updates} обновлений, медленный запрос {delay * 1000:.0f} мс")
+    for name, handler in (("sync Session", sync_handler), ("AsyncSession", async_handler)):
+        elapsed, stall = await run(handler, telegram_ids, delay)
+        print(f"{name:>13}: {elapsed:.3f} с всего, {updates / elapsed:.1f} обн/с, "
+              f"максимальная блокировка цикла {stall * 1000:.0f} мс")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Update-to-reply latency of the bot: long polling vs webhook.
+Usage: python scripts/bench_webhook.py [updates] [rate_per_second]
+
+Starts the fake Telegram API (scripts/fake_telegram_api.py), runs the
+real dispatcher against it first with polling and then with the webhook
+server, sends /start from existing users at the given rate and prints
+p50/p95/p99 latency from sending the update to the bot's reply.
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_API_PORT = 8091
+WEBHOOK_PORT = 8092
+SECRET = "bench-secret"
+
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{FAKE_API_PORT}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+import aiohttp
+from aiohttp import web
+
+from fake_telegram_api import FakeTelegramAPI, message_update, serve
+from app.bot.webhook import WEBHOOK_PATH, SECRET_HEADER, create_webhook_app
+from app.database.database import SessionLocal
+from app.database.models import User
+from app.telegram_bot import bot, dp
+
+# Чаты бенчмарка не пересекаются с настоящими
+CHAT_BASE = 10 ** 12
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def report(name: str, sent_at: dict, api: FakeTelegramAPI):
+    latencies = [
+        (api.replies[chat_id][0][0] - started) * 1000
+        for chat_id, started in sent_at.items()
+        if chat_id in api.replies
+    ]
+    lost = len(sent_at) - len(latencies)
+    if not latencies:
+        print(f"{name:>8}: нет ответов")
+        return
+    print(f"{name:>8}: p50 {percentile(latencies, 0.5):.1f} мс, p95 {percentile(latencies, 0.95):.1f} мс, "
+          f"p99 {percentile(latencies, 0.99):.1f} мс, без ответа {lost}")
+
+
+async def send_updates(updates, rate: float, deliver):
+    sent_at = {}
+    interval = 1 / rate
+    started = time.perf_counter()
+    for i, update in enumerate(updates):
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent_at[update["message"]["chat"]["id"]] = time.perf_counter()
+        await deliver(update)
+    return sent_at
+
+
+async def bench_polling(api: FakeTelegramAPI, updates, rate: float):
+    async def deliver(update):
+        api.push(update)
+
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    sent_at = await send_updates(updates, rate, deliver)
+    await api.wait_replies(sent_at)
+    await dp.stop_polling()
+    await polling
+    return sent_at
+
+
+async def bench_webhook(api: FakeTelegramAPI, updates, rate: float):
+    runner = web.AppRunner(create_webhook_app(dp, bot, SECRET))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", WEBHOOK_PORT).start()
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+
+    async with aiohttp.ClientSession() as session:
+        async def deliver(update):
+            async with session.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                assert response.status == 200, response.status
+
+        sent_at = await send_updates(updates, rate, deliver)
+        await api.wait_replies(sent_at)
+    await runner.cleanup()
+    return sent_at
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    db = SessionLocal()
+    users = [t for (t,) in db.query(User.telegram_id).filter(User.telegram_id.isnot(None)).limit(100)]
+    db.close()
+    if not users:
+        print("В базе нет пользователей с telegram_id")
+        return
+
+    api = FakeTelegramAPI()
+    api_runner = await serve(api, port=FAKE_API_PORT)
+    print(f"{count} обновлений /start, {rate:.0f} в секунду")
+    try:
+        for name, bench, offset in (("polling", bench_polling, 0), ("webhook", bench_webhook, count)):
+            updates = [
+                message_update(offset + i + 1, CHAT_BASE + offset + i, users[i % len(users)], "/start")
+                for i in range(count)
+            ]
+            report(name, await bench(api, updates, rate), api)
+    finally:
+        await api_runner.cleanup()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
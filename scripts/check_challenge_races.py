@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Concurrency check and throughput benchmark for challenge transitions.
+Usage: python scripts/check_challenge_races.py [database_url] [challenges] [threads]
+
+Creates N pending challenges between fresh players and drives them through
+ChallengeService from a thread pool, each call with its own session, the
+way the API worker threads and the bot do:
+
+  - accept: the challenged player accepts every challenge twice at the
+    same moment (a double tap, or the bot and the web app at once);
+  - result: both players submit their result twice at the same moment.
+
+For every challenge exactly one accept has to win, exactly one result
+call has to complete it, and the database has to hold exactly one match
+and two rating history rows with ratings matching the history. Prints
+calls per second for both phases and exits with code 1 on any violation.
+
+Without database_url a temporary SQLite file is used; with a PostgreSQL
+URL pass an empty scratch database (tables are created from the models).
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if len(sys.argv) > 1 and "://" in sys.argv[1]:
+    os.environ["DATABASE_URL"] = sys.argv.pop(1)
+else:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='challenge_races_')}/races.db"
+
+from sqlalchemy import func, insert, select
+
+from app.database.database import SessionLocal, engine
+from app.database.models import Base, Challenge, Match, User, UserRatingHistory
+from app.services.challenge_service import ChallengeError, ChallengeService
+
+TELEGRAM_BASE = 20_000_000
+START_RATING = 1200
+# Сколько секунд поток ждет одновременного старта остальных участников гонки
+BARRIER_TIMEOUT = 30
+
+failures = 0
+rating_callbacks = Counter()
+callbacks_lock = threading.Lock()
+
+
+def check(name: str, ok: bool, details: str = ""):
+    global failures
+    if not ok:
+        failures += 1
+    print(f"{'OK' if ok else 'ОШИБКА':<7} {name}{': ' + details if details else ''}")
+
+
+def seed(challenges: int) -> list:
+    """Создает пары игроков и по ожидающему вызову на пару; возвращает (id, challenger_id, challenged_id)"""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(User)).scalar():
+            print("В базе уже есть пользователи, нужна пустая база")
+            sys.exit(2)
+        conn.execute(insert(User.__table__), [
+            {"id": i, "telegram_id": TELEGRAM_BASE + i, "username": f"race{i}", "rating": START_RATING}
+            for i in range(1, 2 * challenges + 1)
+        ])
+        conn.execute(insert(Challenge.__table__), [
+            {"id": i, "challenger_id": 2 * i - 1, "challenged_id": 2 * i, "status": "pending"}
+            for i in range(1, challenges + 1)
+        ])
+    return [(i, 2 * i - 1, 2 * i) for i in range(1, challenges + 1)]
+
+
+def ratings_changed(ratings: dict):
+    with callbacks_lock:
+        rating_callbacks.update(ratings.keys())
+
+
+def call(action, barrier: threading.Barrier):
+    """Выполняет переход в своей сессии, стартуя одновременно с соперниками по гонке"""
+    db = SessionLocal()
+    try:
+        service = ChallengeService(db, ratings_changed)
+        barrier.wait(BARRIER_TIMEOUT)
+        try:
+            return action(service)
+        except ChallengeError as e:
+            return e
+    except Exception as e:
+        db.rollback()
+        return e
+    finally:
+        db.close()
+
+
+def race(pool: ThreadPoolExecutor, groups: list) -> tuple:
+    """Запускает каждую группу вызовов одновременно; возвращает результаты по группам и время.
+
+    Задачи группы идут в очередь пула подряд, поэтому пул из не меньшего,
+    чем размер группы, числа потоков не может заблокироваться на барьерах.
+    """
+    futures = []
+    started = time.perf_counter()
+    for actions in groups:
+        barrier = threading.Barrier(len(actions))
+        futures.append([pool.submit(call, action, barrier) for action in actions])
+    results = [[future.result() for future in group] for group in futures]
+    return results, time.perf_counter() - started
+
+
+def accept_phase(pool: ThreadPoolExecutor, challenges: list):
+    groups = [
+        [lambda s, c=challenge_id, u=challenged_id: s.accept(c, u)] * 2
+        for challenge_id, _, challenged_id in challenges
+    ]
+    results, elapsed = race(pool, groups)
+    calls = sum(len(group) for group in groups)
+    print(f"\naccept: {calls} вызовов за {elapsed:.2f} с, {calls / elapsed:.0f} в секунду")
+
+    wrong = []
+    for (challenge_id, _, _), group in zip(challenges, results):
+        won = [r for r in group if not isinstance(r, Exception)]
+        lost = [r for r in group if isinstance(r, ChallengeError) and r.code == "not_pending"]
+        if len(won) != 1 or len(lost) != 1:
+            wrong.append(challenge_id)
+    check("ровно один accept из двух одновременных", not wrong, describe(wrong))
+
+
+def result_phase(pool: ThreadPoolExecutor, challenges: list):
+    groups = [
+        [
+            lambda s, c=challenge_id, u=challenger_id: s.submit_result(c, u, "won"),
+            lambda s, c=challenge_id, u=challenged_id: s.submit_result(c, u, "lost"),
+        ] * 2
+        for challenge_id, challenger_id, challenged_id in challenges
+    ]
+    results, elapsed = race(pool, groups)
+    calls = sum(len(group) for group in groups)
+    print(f"result: {calls} вызовов за {elapsed:.2f} с, {calls / elapsed:.0f} в секунду")
+
+    wrong = []
+    errors = Counter()
+    for (challenge_id, challenger_id, _), group in zip(challenges, results):
+        completed = [r for r in group if not isinstance(r, Exception) and r.completed_now]
+        errors.update(type(r).__name__ for r in group if isinstance(r, Exception))
+        if len(completed) != 1 or completed[0].winner_id != challenger_id:
+            wrong.append(challenge_id)
+    check("ровно один запрос завершает вызов", not wrong, describe(wrong))
+    check("повторные результаты без ошибок", not errors, ", ".join(f"{k}: {v}" for k, v in errors.items()))
+
+
+def verify_database(challenges: list):
+    with SessionLocal() as db:
+        statuses = Counter(db.execute(select(Challenge.status)).scalars())
+        matches = db.execute(select(func.count()).select_from(Match)).scalar()
+        linked = db.execute(
+            select(func.count(func.distinct(Challenge.match_id))).where(Challenge.match_id.isnot(None))
+        ).scalar()
+        history = defaultdict(list)
+        for row in db.execute(select(UserRatingHistory).order_by(UserRatingHistory.id)).scalars():
+            history[row.user_id].append(row)
+        ratings = dict(db.execute(select(User.id, User.rating)).all())
+
+    count = len(challenges)
+    check("все вызовы завершены", statuses == Counter(completed=count), str(dict(statuses)))
+    check("по одному матчу на вызов", matches == count == linked, f"матчей {matches}, связанных {linked}")
+    extra = {user_id: len(rows) for user_id, rows in history.items() if len(rows) != 1}
+    missing = len(ratings) - len(history)
+    check("по одной записи истории на игрока", not extra and not missing,
+          f"лишние {extra}, без истории {missing}" if extra or missing else "")
+    mismatched = [user_id for user_id, rows in history.items()
+                  if rows[0].rating_before != START_RATING or rows[-1].rating_after != ratings[user_id]]
+    check("рейтинги совпадают с историей", not mismatched, describe(mismatched))
+    doubled = {user_id: n for user_id, n in rating_callbacks.items() if n != 1}
+    check("on_ratings_changed по разу на игрока", len(rating_callbacks) == len(ratings) and not doubled,
+          str(doubled) if doubled else "")
+
+
+def describe(items: list, limit: int = 3) -> str:
+    if not items:
+        return ""
+    return f"{len(items)}, например {items[:limit]}"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = max(int(sys.argv[2]) if len(sys.argv) > 2 else 8, 4)
+
+    challenges = seed(count)
+    print(f"Вызовов {count}, потоков {threads}, БД {engine.dialect.name}")
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        accept_phase(pool, challenges)
+        result_phase(pool, challenges)
+    print()
+    verify_database(challenges)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
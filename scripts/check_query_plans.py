@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check for the hot API endpoints.
+Usage: python scripts/check_query_plans.py [database_url] [users]
+
+Seeds an empty database with a synthetic dataset (by default 20000
+players with their challenges, matches, rating history, spots with
+photos and ratings, and tournaments), calls every hot endpoint through
+the API and runs EXPLAIN on each SELECT it issues. Exits with code 1 if
+any plan reads a whole table (Seq Scan on PostgreSQL, SCAN without an
+index on SQLite) or an endpoint goes over its query budget (HTTP 500
+with SQL_BUDGET_STRICT=1).
+
+Without database_url a temporary SQLite file is used. For PostgreSQL pass
+the URL of an empty scratch database, migrated with `alembic upgrade head`
+to check the migration's indexes (tables missing there are created from
+the models); the script refuses to seed a database that already has users.
+Endpoints that list a whole table by design (/api/locations,
+/api/leaderboard) are not checked.
+"""
+
+import json
+import random
+import sys
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if len(sys.argv) > 1 and "://" in sys.argv[1]:
+    os.environ["DATABASE_URL"] = sys.argv.pop(1)
+else:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='query_plans_')}/plans.db"
+# Планы проверяются на основной БД
+os.environ.pop("DATABASE_REPLICA_URL", None)
+# Превышение лимита запросов эндпоинта - ошибка 500
+os.environ["SQL_BUDGET_STRICT"] = "1"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, insert, select, text
+
+from app.api.security import create_access_token
+from app.database.database import async_engine, engine
+from app.database.models import (
+    Base, Challenge, Location, Match, Photo, Rating, Tournament, TournamentParticipant, User, UserRatingHistory
+)
+from app.main import app
+
+TELEGRAM_BASE = 10_000_000
+TOURNAMENT_SIZE = 16
+CHUNK = 5000
+
+# Эндпоинт, запросы которого сейчас проверяются, и найденные проблемы
+current_path = None
+statements = defaultdict(int)
+scans = defaultdict(list)
+
+
+def chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def seed(users: int):
+    now = datetime.now()
+    rng = random.Random(42)
+
+    def moment():
+        return now - timedelta(minutes=rng.randint(1, 365 * 24 * 60))
+
+    user_rows = [
+        {"id": i, "telegram_id": TELEGRAM_BASE + i, "username": f"plan{i}", "first_name": f"Plan {i}",
+         "rating": rng.randint(800, 2000), "created_at": moment()}
+        for i in range(1, users + 1)
+    ]
+    spots = max(users // 20, 1)
+    location_rows = [
+        {"id": i, "user_id": rng.randint(1, users), "name": f"Спот {i}", "description": "",
+         "latitude": rng.uniform(41, 70), "longitude": rng.uniform(20, 140), "net_type": "нет",
+         "has_roof": False, "tables_count": 2, "created_at": moment()}
+        for i in range(1, spots + 1)
+    ]
+    photo_rows = [{"location_id": i, "file_path": f"{i}_{n}.jpg", "created_at": moment()}
+                  for i in range(1, spots + 1) for n in range(2)]
+    rating_rows = [{"location_id": i, "user_id": rng.randint(1, users), "score": rng.randint(1, 5), "created_at": moment()}
+                   for i in range(1, spots + 1) for _ in range(3)]
+
+    # Вызовы: случайные пары и отдельно много вызовов у игрока 1, от имени которого идут запросы
+    pairs = [rng.sample(range(1, users + 1), 2) for _ in range(users * 3)]
+    pairs += [[1, rng.randint(2, users)] if n % 2 else [rng.randint(2, users), 1] for n in range(300)]
+    challenge_rows, match_rows, history_rows = [], [], []
+    for challenge_id, (challenger_id, challenged_id) in enumerate(pairs, start=1):
+        status = rng.choice(["pending", "accepted", "declined", "completed", "completed"])
+        created_at = moment()
+        match_id = None
+        if status == "completed":
+            match_id = len(match_rows) + 1
+            winner_id, loser_id = rng.sample([challenger_id, challenged_id], 2)
+            match_rows.append({
+                "id": match_id, "player1_id": challenger_id, "player2_id": challenged_id, "winner_id": winner_id,
+                "loser_id": loser_id, "spot_id": rng.randint(1, spots), "is_rated": True, "created_at": created_at,
+            })
+            for user_id in (winner_id, loser_id):
+                change = 16 if user_id == winner_id else -16
+                history_rows.append({"user_id": user_id, "match_id": match_id, "rating_before": 1200,
+                                     "rating_after": 1200 + change, "change": change, "created_at": created_at})
+        challenge_rows.append({"id": challenge_id, "challenger_id": challenger_id, "challenged_id": challenged_id,
+                               "status": status, "created_at": created_at, "match_id": match_id})
+
+    tournament_rows, participant_rows, bracket_rows = [], [], []
+    for tournament_id in range(1, max(users // 50, 1) + 1):
+        started = moment()
+        tournament_rows.append({"id": tournament_id, "title": f"Турнир {tournament_id}", "spot_id": rng.randint(1, spots),
+                                "datetime": started, "created_by": 1, "status": "started",
+                                "format": "single_elimination", "created_at": started})
+        players = rng.sample(range(1, users + 1), TOURNAMENT_SIZE)
+        participant_rows += [{"tournament_id": tournament_id, "user_id": user_id} for user_id in players]
+        for slot in range(1, TOURNAMENT_SIZE):
+            first_round = slot <= TOURNAMENT_SIZE // 2
+            bracket_rows.append({
+                "id": len(match_rows) + len(bracket_rows) + 1, "tournament_id": tournament_id, "slot": slot, "bracket": "winners",
+                "round": 1 if first_round else 2, "is_rated": True, "created_at": started,
+                "player1_id": players[2 * slot - 2] if first_round else None,
+                "player2_id": players[2 * slot - 1] if first_round else None,
+                "table_number": slot % 4 + 1, "scheduled_at": started + timedelta(minutes=30 * (slot // 4)),
+            })
+
+    with engine.begin() as conn:
+        for model, rows in ((User, user_rows), (Location, location_rows), (Photo, photo_rows),
+                            (Rating, rating_rows), (Tournament, tournament_rows), (Match, match_rows),
+                            (Match, bracket_rows), (TournamentParticipant, participant_rows), (Challenge, challenge_rows),
+                            (UserRatingHistory, history_rows)):
+            for part in chunks(rows):
+                conn.execute(insert(model.__table__), part)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"Игроков {users}, вызовов {len(challenge_rows)}, матчей {len(match_rows) + len(bracket_rows)}, "
+          f"записей истории {len(history_rows)}, спотов {spots}, турниров {len(tournament_rows)}")
+
+
+def full_scans(conn, statement: str, parameters) -> list:
+    """Таблицы, которые план запроса читает целиком"""
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            details = [row[-1] for row in cursor.fetchall()]
+            return [detail.split()[1] for detail in details
+                    if detail.startswith("SCAN ") and "USING" not in detail and "CONSTANT ROW" not in detail]
+        cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    found = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            found.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return found
+
+
+def check_query(conn, cursor, statement, parameters, context, executemany):
+    if current_path is None or executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return
+    statements[current_path] += 1
+    for table in full_scans(conn, statement, parameters):
+        scans[current_path].append((table, " ".join(statement.split())[:160]))
+
+
+def main():
+    global current_path
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(User)).scalar():
+            print("В базе уже есть пользователи, нужна пустая база")
+            sys.exit(2)
+    seed(users)
+
+    with engine.connect() as conn:
+        user = conn.execute(select(User).where(User.id == 1)).first()
+        tournament_id = conn.execute(select(func.max(Tournament.id))).scalar()
+    headers = {"Authorization": f"Bearer {create_access_token(user)}"}
+
+    event.listen(engine, "after_cursor_execute", check_query)
+    event.listen(async_engine.sync_engine, "after_cursor_execute", check_query)
+    failed = False
+    with TestClient(app, raise_server_exceptions=False) as client:
+        next_cursor = client.get("/api/tournaments").json()["next_cursor"]
+        hot_paths = [
+            "/api/challenges",
+            "/api/challenges?status=pending",
+            "/api/user/1/history",
+            "/api/locations/1",
+            "/api/locations/1/ratings",
+            "/api/tournaments",
+            f"/api/tournaments?cursor={next_cursor}",
+            f"/api/tournaments/{tournament_id}/matches",
+            f"/api/tournaments/{tournament_id}/schedule",
+        ]
+        for path in hot_paths:
+            current_path = path
+            status = client.get(path, headers=headers).status_code
+            current_path = None
+            problems = scans.get(path)
+            if status >= 500:
+                failed = True
+            print(f"{'ОШИБКА' if problems or status >= 500 else 'OK':<7} {path} (HTTP {status}, запросов {statements[path]})")
+            for table, statement in problems or ():
+                failed = True
+                print(f"        полное чтение {table}: {statement}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
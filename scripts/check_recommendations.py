@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Check of opponent recommendations on a temporary SQLite database.
+Usage: python scripts/check_recommendations.py
+
+Plays challenges through ChallengeService at three spots (home, 2 km
+away, another city) and checks:
+  - completed challenge matches and tournament bracket matches record
+    their spot;
+  - an opponent who plays nearby ranks above one with a closer rating
+    who plays in another city, even when another candidate has played
+    far more recent matches than everyone else together;
+  - a player without a rating gets recommendations and is recommended
+    without errors.
+Exits with code 1 if any check fails.
+"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='recommendations_')}/check.db"
+
+from sqlalchemy import insert, select
+
+from app.api.endpoints.tournaments import generate_tournament_bracket
+from app.database.database import SessionLocal, engine
+from app.database.models import Base, Challenge, Location, Match, Tournament, User
+from app.services.challenge_service import ChallengeService
+from app.services.matchmaking import DEFAULT_RATING, RECENT_SPOTS_LIMIT, recommend_opponents
+
+failures = 0
+
+# (id, название, широта, долгота)
+SPOTS = [
+    (1, "Дом", 55.7500, 37.6100),
+    (2, "Рядом", 55.7680, 37.6100),
+    (3, "Другой город", 59.9400, 30.3100),
+]
+# (id, username, рейтинг): 1 - тот, кому подбираем соперников
+PLAYERS = [
+    (1, "me", 1200),
+    (2, "near", 1300),
+    (3, "far", 1210),
+    (4, "sparring_home", 1900),
+    (5, "sparring_near", 1900),
+    (6, "sparring_far", 1900),
+    (7, "unrated", None),
+]
+# (вызывающий, вызванный, спот)
+GAMES = [(1, 4, 1), (2, 5, 2), (3, 6, 3)]
+
+
+def check(name: str, ok: bool, details: str = ""):
+    global failures
+    if not ok:
+        failures += 1
+    print(f"{'OK' if ok else 'ОШИБКА':<7} {name}{': ' + details if details else ''}")
+
+
+def seed(db):
+    Base.metadata.create_all(engine)
+    for spot_id, name, lat, lon in SPOTS:
+        db.add(Location(id=spot_id, user_id=None, name=name, description="", latitude=lat, longitude=lon,
+                        net_type="нет", has_roof=False))
+    for user_id, username, rating in PLAYERS:
+        db.add(User(id=user_id, telegram_id=30_000_000 + user_id, username=username))
+    db.flush()
+    # default модели не дает записать NULL через конструктор
+    for user_id, _, rating in PLAYERS:
+        db.get(User, user_id).rating = rating
+    for challenger_id, challenged_id, spot_id in GAMES:
+        db.add(Challenge(challenger_id=challenger_id, challenged_id=challenged_id, spot_id=spot_id, status="accepted"))
+    db.commit()
+
+
+def main():
+    db = SessionLocal()
+    seed(db)
+
+    # Все трое выигрывают у спарринг-партнеров одинаково, разница рейтингов сохраняется
+    for challenge in db.query(Challenge).order_by(Challenge.id).all():
+        service = ChallengeService(db)
+        service.submit_result(challenge.id, challenge.challenger_id, "won")
+        service.submit_result(challenge.id, challenge.challenged_id, "lost")
+    ratings = dict(db.execute(select(User.id, User.rating)).all())
+
+    spots = dict(db.execute(select(Challenge.match_id, Challenge.spot_id)).all())
+    recorded = dict(db.execute(select(Match.id, Match.spot_id).where(Match.id.in_(list(spots)))).all())
+    check("матч вызова получает спот вызова", recorded == spots, f"{recorded}")
+
+    # Спарринг-партнеры играют турнир на другом споте; на близость игроков 1-3 это не влияет
+    tournament = Tournament(title="Проверка", spot_id=3, datetime=datetime.now(), created_by=1, status="started")
+    db.add(tournament)
+    db.flush()
+    generate_tournament_bracket(tournament, [4, 5, 6, 7], db)
+    db.commit()
+    tournament_spots = set(db.execute(select(Match.spot_id).where(Match.tournament_id == tournament.id)).scalars())
+    check("турнирные матчи получают спот турнира", tournament_spots == {3}, f"{tournament_spots}")
+
+    # Очень активный кандидат: его свежих матчей больше, чем лимит спотов на всех кандидатов вместе
+    busy_at = datetime.now() + timedelta(minutes=1)
+    db.execute(insert(Match), [
+        {"player1_id": 6, "player2_id": None, "spot_id": 3, "created_at": busy_at, "is_rated": False}
+        for _ in range(RECENT_SPOTS_LIMIT * len(PLAYERS) * 2)
+    ])
+    db.commit()
+
+    recommended = recommend_opponents(db, 1, limit=10)
+    order = [item["username"] for item in recommended]
+    by_name = {item["username"]: item for item in recommended}
+    print(f"        рекомендации: {order}")
+    check("игрок рядом выше игрока из другого города",
+          "near" in order and "far" in order and order.index("near") < order.index("far"))
+    near_distance = by_name.get("near", {}).get("distance_km")
+    check("расстояние до игрока рядом", near_distance is not None and near_distance < 5, f"{near_distance} км")
+    unrated = by_name.get("unrated")
+    check("игрок без рейтинга сравнивается как " + str(DEFAULT_RATING),
+          unrated is not None and unrated["rating_diff"] == DEFAULT_RATING - ratings[1],
+          f"{unrated}")
+
+    for_unrated = recommend_opponents(db, 7, limit=3)
+    check("рекомендации для игрока без рейтинга", len(for_unrated) == 3,
+          f"{[item['username'] for item in for_unrated]}")
+
+    db.close()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
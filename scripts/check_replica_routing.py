@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Local check of read-replica routing with two SQLite files as stand-ins.
+Usage: python scripts/check_replica_routing.py
+
+Creates a "primary" and a "replica" database in a temporary directory
+with the same admin user and a spot named after the database it lives in,
+so every response shows where it was read from. Then checks through the
+API that read endpoints go to the replica, that a user who has just
+written (POST /api/tournaments) reads from the primary for
+DB_REPLICA_PIN_SECONDS, and that other users keep reading from the
+replica. The stand-ins are not replicated, so a write never shows up in
+the replica.
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp(prefix="replica_check_")
+os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/primary.db"
+os.environ["DATABASE_REPLICA_URL"] = f"sqlite:///{workdir}/replica.db"
+os.environ["DB_REPLICA_PIN_SECONDS"] = "1"
+
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.api.security import create_access_token
+from app.database.database import DB_REPLICA_PIN_SECONDS, engine
+from app.database.models import Base, Location, User
+from app.main import app
+
+failures = 0
+
+
+def seed(bind, spot_name: str):
+    Base.metadata.create_all(bind)
+    with Session(bind) as db:
+        db.add(User(id=1, telegram_id=1001, username="admin", is_admin=True))
+        db.add(User(id=2, telegram_id=1002, username="player"))
+        db.add(Location(id=1, user_id=1, name=spot_name, description="", latitude=55.75, longitude=37.61,
+                        net_type="нет", has_roof=False))
+        db.commit()
+
+
+def check(name: str, actual, expected):
+    global failures
+    if actual == expected:
+        print(f"OK      {name}: {actual}")
+    else:
+        failures += 1
+        print(f"ОШИБКА  {name}: {actual}, ожидалось {expected}")
+
+
+def main():
+    seed(engine, "основная")
+    seed(create_engine(os.environ["DATABASE_REPLICA_URL"]), "реплика")
+    with Session(engine) as db:
+        admin = {"Authorization": f"Bearer {create_access_token(db.get(User, 1))}"}
+        player = {"Authorization": f"Bearer {create_access_token(db.get(User, 2))}"}
+
+    def spot(headers=None):
+        return client.get("/api/locations/1", headers=headers).json()["name"]
+
+    def tournaments(headers=None):
+        return len(client.get("/api/tournaments", headers=headers).json()["items"])
+
+    with TestClient(app) as client:
+        check("аноним читает спот из", spot(), "реплика")
+        check("админ до записи читает спот из", spot(admin), "реплика")
+
+        response = client.post("/api/tournaments", headers=admin, json={
+            "title": "Проверка реплики", "spot_id": 1, "datetime": datetime.now().isoformat()
+        })
+        check("создание турнира", response.status_code, 200)
+        check("админ после записи видит турниров", tournaments(admin), 1)
+        check("админ после записи читает спот из", spot(admin), "основная")
+        check("другой игрок видит турниров", tournaments(player), 0)
+        check("аноним видит турниров", tournaments(), 0)
+
+        time.sleep(DB_REPLICA_PIN_SECONDS + 0.2)
+        check(f"админ через {DB_REPLICA_PIN_SECONDS:g} с читает спот из", spot(admin), "реплика")
+
+    print(f"\nБазы: {workdir}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
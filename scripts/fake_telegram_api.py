@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Local fake of the Telegram Bot API for load tests of the bot.
+Usage: python scripts/fake_telegram_api.py [port]
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>.
+Updates pushed with FakeTelegramAPI.push() are served to getUpdates
+(long polling). Replies (sendMessage, editMessageText) are recorded
+with their arrival time per chat, answerCallbackQuery under the
+callback query id. message_update() and callback_update() build the
+update JSON for commands and inline button taps.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from aiohttp import web
+
+
+class FakeTelegramAPI:
+    def __init__(self):
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.calls: Counter = Counter()
+        # chat_id -> [(время ответа, метод, текст)]
+        self.replies: Dict[int, List[tuple]] = {}
+        self.message_id = 0
+        self.webhook_url = None
+        self._reply_event = asyncio.Event()
+
+    def push(self, update: dict):
+        self.updates.put_nowait(update)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+    async def wait_replies(self, chat_ids, timeout: float = 30) -> bool:
+        """Ждет хотя бы одного ответа в каждый из чатов"""
+        deadline = time.perf_counter() + timeout
+        pending = set(chat_ids)
+        while True:
+            pending = {chat_id for chat_id in pending if chat_id not in self.replies}
+            if not pending:
+                return True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self._reply_event.clear()
+            try:
+                await asyncio.wait_for(self._reply_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls[method] += 1
+        result = await getattr(self, f"api_{method}", self.api_default)(params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def api_default(self, params):
+        return True
+
+    async def api_getme(self, params):
+        return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+    async def api_getupdates(self, params):
+        timeout = float(params.get("timeout", 0))
+        limit = int(params.get("limit", 100))
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout) if timeout else self.updates.get_nowait())
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    async def api_setwebhook(self, params):
+        self.webhook_url = params.get("url")
+        return True
+
+    async def api_deletewebhook(self, params):
+        self.webhook_url = None
+        return True
+
+    async def api_sendmessage(self, params):
+        return self._reply("sendmessage", params)
+
+    async def api_editmessagetext(self, params):
+        return self._reply("editmessagetext", params)
+
+    async def api_answercallbackquery(self, params):
+        # У ответа на нажатие кнопки нет чата - записываем по id нажатия
+        self._record(int(params["callback_query_id"]), "answercallbackquery", params)
+        return True
+
+    def _reply(self, method: str, params) -> dict:
+        chat_id = int(params["chat_id"])
+        self._record(chat_id, method, params)
+        self.message_id += 1
+        return {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    def _record(self, chat_id: int, method: str, params):
+        self.replies.setdefault(chat_id, []).append((time.perf_counter(), method, params.get("text")))
+        self._reply_event.set()
+
+
+def message_update(update_id: int, chat_id: int, user_id: int, text: str, username: str = None) -> dict:
+    """JSON обновления с текстовым сообщением (команда размечается как bot_command)"""
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+    for word in text.split():
+        if word.startswith("@"):
+            entities.append({"type": "mention", "offset": text.index(word), "length": len(word)})
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": username},
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+def callback_update(update_id: int, chat_id: int, user_id: int, data: str, message_id: int = 1,
+                    username: str = None) -> dict:
+    """JSON обновления с нажатием inline-кнопки под сообщением бота message_id"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(chat_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": username},
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Fake"},
+                "text": "",
+            },
+            "data": data,
+        },
+    }
+
+
+async def serve(api: FakeTelegramAPI, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    api = FakeTelegramAPI()
+    await serve(api, port=port)
+    print(f"Fake Telegram API: http://127.0.0.1:{port}")
+    while True:
+        await asyncio.sleep(10)
+        print(json.dumps(dict(api.calls)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Load test of the bot handlers against the fake Telegram Bot API.
+Usage: python scripts/load_test_bot.py [users] [concurrency]
+
+Creates synthetic players through /start, then runs the challenge flow
+in phases: /вызов between pairs of players, accept_ taps and result_
+taps from both players, every callback tapped twice at the same time
+(double tap). Updates are fed to the real Dispatcher with at most
+`concurrency` in flight, bot replies go to scripts/fake_telegram_api.py.
+
+Prints per phase the throughput, and per handler the p50/p95/p99
+latency and SQL statements per update, then checks that double taps did
+not create duplicate results. Synthetic players and their data are
+deleted before and after the run. Use the production database engine:
+SQLite serializes writers and fails concurrent result_ taps with
+"database is locked".
+"""
+
+import asyncio
+import contextvars
+import logging
+import sys
+import os
+import time
+from collections import Counter, defaultdict
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_API_PORT = 8093
+
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{FAKE_API_PORT}"
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+# Лимиты Telegram к фейковому API не относятся
+os.environ.setdefault("BOT_OUTBOX_GLOBAL_RATE", "10000")
+
+from aiogram.types import Update
+from sqlalchemy import delete, func, or_, select
+
+from fake_telegram_api import FakeTelegramAPI, callback_update, message_update, serve
+from app.database.database import SessionLocal
+from app.database.profiling import track_queries
+from app.database.models import Challenge, Match, User, UserRatingHistory
+from app.telegram_bot import bot, dp, outbox
+
+# Лог каждого запроса и обновления заглушил бы отчет
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+# telegram_id синтетических игроков (столбец 32-битный)
+USER_BASE = 2_100_000_000
+
+# Обработчик текущего обновления: {"handler": ...}
+current = contextvars.ContextVar("current", default=None)
+
+
+async def record_handler(handler, event, data):
+    stats = current.get()
+    if stats is not None:
+        stats["handler"] = data["handler"].callback.__name__
+    return await handler(event, data)
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def cleanup():
+    """Удаляет синтетических игроков и все, что они создали"""
+    db = SessionLocal()
+    user_ids = select(User.id).where(User.telegram_id >= USER_BASE).scalar_subquery()
+    match_ids = select(Match.id).where(or_(Match.player1_id.in_(user_ids), Match.player2_id.in_(user_ids)))
+    db.execute(delete(UserRatingHistory).where(UserRatingHistory.user_id.in_(user_ids)))
+    db.execute(delete(Challenge).where(or_(Challenge.challenger_id.in_(user_ids), Challenge.challenged_id.in_(user_ids))))
+    db.execute(delete(Match).where(Match.id.in_(match_ids)))
+    db.execute(delete(User).where(User.telegram_id >= USER_BASE))
+    db.commit()
+    db.close()
+
+
+class LoadTest:
+    def __init__(self, users: int, concurrency: int):
+        self.users = users
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.update_id = 0
+        # handler -> [(задержка в мс, число запросов)]
+        self.results = defaultdict(list)
+        self.errors = Counter()
+
+    def next_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    async def feed(self, update: dict):
+        async with self.semaphore:
+            stats = {"handler": "unhandled"}
+            current.set(stats)
+            started = time.perf_counter()
+            with track_queries() as queries:
+                try:
+                    await dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+                except Exception as e:
+                    self.errors[(stats["handler"], type(e).__name__, str(e).splitlines()[0][:100])] += 1
+            elapsed = (time.perf_counter() - started) * 1000
+            self.results[stats["handler"]].append((elapsed, queries.count))
+
+    async def phase(self, name: str, updates: list):
+        started = time.perf_counter()
+        await asyncio.gather(*(self.feed(update) for update in updates))
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10}: {len(updates)} обновлений за {elapsed:.2f} с, {len(updates) / elapsed:.0f} в секунду")
+
+    def tap_twice(self, telegram_id: int, data: str, message_id: int) -> list:
+        return [
+            callback_update(self.next_id(), telegram_id, telegram_id, data, message_id, f"load{telegram_id - USER_BASE}")
+            for _ in range(2)
+        ]
+
+    async def run(self):
+        players = [USER_BASE + i for i in range(self.users - self.users % 2)]
+        pairs = list(zip(players[::2], players[1::2]))
+
+        await self.phase("/start", [
+            message_update(self.next_id(), tid, tid, "/start", f"load{tid - USER_BASE}") for tid in players
+        ])
+        await self.phase("/вызов", [
+            message_update(self.next_id(), a, a, f"/вызов @load{b - USER_BASE}", f"load{a - USER_BASE}")
+            for a, b in pairs
+        ])
+
+        db = SessionLocal()
+        challenges = db.execute(
+            select(Challenge.id, User.telegram_id)
+            .join(User, User.id == Challenge.challenged_id)
+            .where(User.telegram_id >= USER_BASE, Challenge.status == "pending")
+        ).all()
+        db.close()
+        challenged_by = {b: a for a, b in pairs}
+
+        await self.phase("accept_", [
+            update for challenge_id, tid in challenges
+            for update in self.tap_twice(tid, f"accept_{challenge_id}", challenge_id)
+        ])
+        # Вызвавший побеждает, оба игрока сообщают результат с двойным нажатием
+        await self.phase("result_", [
+            update for challenge_id, tid in challenges
+            for update in (
+                self.tap_twice(challenged_by[tid], f"result_{challenge_id}_won", challenge_id)
+                + self.tap_twice(tid, f"result_{challenge_id}_lost", challenge_id)
+            )
+        ])
+        return [challenge_id for challenge_id, _ in challenges]
+
+    def report(self):
+        print(f"\n{'обработчик':<20} {'число':>6} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'SQL/обн':>8} {'SQL max':>8}")
+        for handler, rows in sorted(self.results.items()):
+            latencies = [latency for latency, _ in rows]
+            queries = [count for _, count in rows]
+            print(f"{handler:<20} {len(rows):>6} {percentile(latencies, 0.5):>8.1f} "
+                  f"{percentile(latencies, 0.95):>8.1f} {percentile(latencies, 0.99):>8.1f} "
+                  f"{sum(queries) / len(queries):>8.1f} {max(queries):>8}")
+        for (handler, error, message), count in self.errors.most_common():
+            print(f"Ошибка в {handler} x{count}: {error}: {message}")
+
+
+def check(challenge_ids: list):
+    """Двойные нажатия не должны давать лишних матчей и изменений рейтинга"""
+    db = SessionLocal()
+    statuses = dict(db.execute(
+        select(Challenge.status, func.count()).where(Challenge.id.in_(challenge_ids)).group_by(Challenge.status)
+    ).all())
+    match_ids = select(Challenge.match_id).where(Challenge.id.in_(challenge_ids)).scalar_subquery()
+    history = db.execute(
+        select(UserRatingHistory.match_id, func.count())
+        .where(UserRatingHistory.match_id.in_(match_ids))
+        .group_by(UserRatingHistory.match_id)
+    ).all()
+    db.close()
+    duplicated = sum(1 for _, count in history if count != 2)
+    print(f"\nВызовы: {statuses}, матчей с изменением рейтинга: {len(history)}, с лишними записями: {duplicated}")
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    cleanup()
+    dp.message.middleware(record_handler)
+    dp.callback_query.middleware(record_handler)
+
+    api = FakeTelegramAPI()
+    api_runner = await serve(api, port=FAKE_API_PORT)
+    print(f"{users} игроков, до {concurrency} обновлений одновременно")
+    test = LoadTest(users, concurrency)
+    try:
+        challenge_ids = await test.run()
+        test.report()
+        await outbox.stop()
+        check(challenge_ids)
+        print(f"Вызовы Bot API: {dict(api.calls)}")
+    finally:
+        await api_runner.cleanup()
+        await bot.session.close()
+        cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -12,13 +12,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database.database import get_db
 from app.database.models import User
+from app.services.search import username_matches
 
 def setup_admin(username: str):
     """Устанавливает пользователя как администратора"""
     db = next(get_db())
     
-    # Ищем пользователя по username
-    user = db.query(User).filter(User.username == username).first()
+    # Ищем пользователя по username без учета регистра
+    user = db.query(User).filter(username_matches(username)).first()
     
     if not user:
         print(f"❌ Пользователь @{username} не найден в базе данных.")